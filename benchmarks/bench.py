@@ -0,0 +1,287 @@
+"""
+Benchmarks de ponta a ponta (rotas FastAPI + pool de renderização +
+armazenamento local) sobre modelos sintéticos, com SQLite no lugar do MySQL.
+
+    python -m benchmarks.bench                         # todos os cenários, perfil "medio"
+    python -m benchmarks.bench -c gerar -p grande -n 10 -o depois.jsonl
+    python -m benchmarks.bench --comparar antes.jsonl depois.jsonl
+
+Cada cenário roda num processo próprio (o pico de RSS é o do cenário) e
+gera uma linha JSON com tempos, pico de memória e tamanho da saída.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+CENARIOS = ("gerar", "extrair", "resolver")
+
+# parâmetros do modelo (sintetico.gerar_modelo) e do payload (sintetico.gerar_payload)
+PERFIS = {
+    "pequeno": {
+        "modelo": {"paragrafos": 10, "tabelas": 1, "linhas": 3, "colunas": 3, "aninhadas": 0, "cabecalho": 1, "imagens": 1},
+        "payload": {"pendencias": 1, "imagens_pendencia": 0, "lado_imagem": 1200},
+    },
+    "medio": {
+        "modelo": {"paragrafos": 100, "tabelas": 5, "linhas": 8, "colunas": 4, "aninhadas": 1, "cabecalho": 3, "imagens": 6},
+        "payload": {"pendencias": 5, "imagens_pendencia": 2, "lado_imagem": 2000},
+    },
+    "grande": {
+        "modelo": {"paragrafos": 500, "tabelas": 20, "linhas": 15, "colunas": 6, "aninhadas": 2, "cabecalho": 6, "imagens": 20},
+        "payload": {"pendencias": 20, "imagens_pendencia": 10, "lado_imagem": 3000},
+    },
+}
+
+
+# ======================================
+# MEDIÇÕES
+# ======================================
+def pico_rss_kb() -> dict:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {"processo": None, "filhos": None}
+
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    escala = 1024 if sys.platform == "darwin" else 1
+    return {
+        "processo": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // escala,
+        "filhos": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // escala,
+    }
+
+
+def resumir_tempos(tempos: list[float]) -> dict:
+    ordenados = sorted(tempos)
+    return {
+        "min": ordenados[0],
+        "mediana": statistics.median(ordenados),
+        "p95": ordenados[min(len(ordenados) - 1, round(0.95 * (len(ordenados) - 1)))],
+        "media": statistics.fmean(ordenados),
+        "max": ordenados[-1],
+    }
+
+
+def commit_atual() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ======================================
+# CENÁRIOS (processo filho)
+# ======================================
+def executar_cenario(cenario: str, perfil: str, repeticoes: int) -> dict:
+    # só importa a aplicação aqui: o banco e o armazenamento vêm das
+    # variáveis de ambiente montadas pelo processo pai
+    from fastapi.testclient import TestClient
+
+    import main
+    from benchmarks.sintetico import gerar_modelo, chaves_modelo, gerar_payload, gerar_foto
+    from core.security import create_access_token
+    from database import SessionLocal
+    from models.relatorio import Relatorio
+    from services.render_pool import executor_renderizacao
+    from services.storage import armazenamento
+
+    parametros = PERFIS[perfil]
+    modelo = gerar_modelo(**parametros["modelo"])
+    chaves = chaves_modelo(**parametros["modelo"])
+    cabecalhos = {"Authorization": "Bearer " + create_access_token({"sub": "benchmark"})}
+
+    def ultimo_relatorio():
+        sessao = SessionLocal()
+        try:
+            return sessao.query(Relatorio).order_by(Relatorio.id.desc()).first()
+        finally:
+            sessao.close()
+
+    def tamanho_ultimo_relatorio() -> int:
+        return armazenamento.metadados(ultimo_relatorio().caminho_arquivo)[0]
+
+    tempos = []
+    tamanho_entrada = len(modelo)
+    tamanho_saida = None
+
+    with TestClient(main.app) as cliente:
+        resposta = cliente.post(
+            "/app/novoModelo",
+            data={
+                "titulo": f"Benchmark {perfil}", "equipe": "benchmark", "descriçao": "sintético",
+                "modelo_automacao": "{}", "termografia": "false",
+                "chave_pendencia": "pendencias", "campos_imagem": json.dumps(chaves["imagens"]),
+            },
+            files={"documento_modelo": ("modelo.docx", modelo)},
+            headers=cabecalhos,
+        )
+        resposta.raise_for_status()
+        modelo_id = resposta.json()["id"]
+
+        def medir(requisicao):
+            inicio = time.perf_counter()
+            resposta = requisicao()
+            tempos.append(time.perf_counter() - inicio)
+            resposta.raise_for_status()
+            return resposta
+
+        if cenario == "gerar":
+            payload = {"modelo_id": modelo_id, **gerar_payload(chaves, **parametros["payload"])}
+            tamanho_entrada = len(json.dumps(payload))
+
+            # aquecimento: sobe o pool e compila o modelo
+            cliente.post("/automate/gerar-doc", json=payload).raise_for_status()
+            for _ in range(repeticoes):
+                medir(lambda: cliente.post("/automate/gerar-doc", json=payload))
+            tamanho_saida = tamanho_ultimo_relatorio()
+
+        elif cenario == "extrair":
+            # SYNTHETIS_EXTRACT_CACHE_ENTRIES=0: toda chamada é uma extração de fato
+            cliente.post("/app/extrair-variaveis", files={"file": ("modelo.docx", modelo)}, headers=cabecalhos)
+            for _ in range(repeticoes):
+                resposta = medir(lambda: cliente.post(
+                    "/app/extrair-variaveis", files={"file": ("modelo.docx", modelo)}, headers=cabecalhos
+                ))
+            tamanho_saida = len(resposta.content)
+
+        elif cenario == "resolver":
+            # relatórios com as fotos pendentes; só a resolução é medida
+            payload = {"modelo_id": modelo_id, **gerar_payload(chaves, imagens=0, **parametros["payload"])}
+            lado = parametros["payload"]["lado_imagem"]
+            imagens = {chave: gerar_foto(lado, 500 + i) for i, chave in enumerate(chaves["imagens"])}
+            tamanho_entrada = len(json.dumps(imagens))
+
+            for _ in range(repeticoes + 1):
+                cliente.post("/automate/gerar-doc", json=payload).raise_for_status()
+
+            sessao = SessionLocal()
+            try:
+                ids = [r.id for r in sessao.query(Relatorio.id).order_by(Relatorio.id)]
+            finally:
+                sessao.close()
+
+            cliente.post("/automate/resolver-itens-pendentes",
+                         json={"relatorio_id": ids[0], "imagens": imagens}).raise_for_status()
+            for relatorio_id in ids[1:]:
+                medir(lambda: cliente.post("/automate/resolver-itens-pendentes",
+                                           json={"relatorio_id": relatorio_id, "imagens": imagens}))
+            tamanho_saida = tamanho_ultimo_relatorio()
+
+        else:
+            raise ValueError(f"Cenário desconhecido: {cenario}")
+
+    # filhos só entram em RUSAGE_CHILDREN depois de encerrados
+    executor_renderizacao.encerrar()
+
+    return {
+        "cenario": cenario,
+        "perfil": perfil,
+        "parametros": parametros,
+        "repeticoes": repeticoes,
+        "tempo_s": resumir_tempos(tempos),
+        "pico_rss_kb": pico_rss_kb(),
+        "tamanho_entrada_bytes": tamanho_entrada,
+        "tamanho_saida_bytes": tamanho_saida,
+    }
+
+
+# ======================================
+# ORQUESTRAÇÃO (processo pai)
+# ======================================
+def rodar(cenario: str, perfil: str, repeticoes: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="synthetis-bench-") as pasta:
+        ambiente = {
+            **os.environ,
+            "SYNTHETIS_DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(pasta, 'bench.db')}",
+            "SYNTHETIS_STORAGE_BACKEND": "local",
+            "SYNTHETIS_STORAGE_ROOT": os.path.join(pasta, "relatorios"),
+            "SYNTHETIS_EXTRACT_CACHE_ENTRIES": "0",
+            "SYNTHETIS_SWEEP_INTERVAL_HOURS": "0",
+        }
+        processo = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench", "--interno",
+             "-c", cenario, "-p", perfil, "-n", str(repeticoes)],
+            env=ambiente, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+
+    if processo.returncode != 0:
+        raise RuntimeError(f"Cenário {cenario}/{perfil} falhou:\n{processo.stderr}")
+
+    # a última linha é o resultado; o resto é log da aplicação
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    resultado.update({
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_atual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    })
+    return resultado
+
+
+def comparar(antes: str, depois: str):
+    def carregar(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            return {(r["cenario"], r["perfil"]): r for r in map(json.loads, filter(str.strip, f))}
+
+    a, d = carregar(antes), carregar(depois)
+
+    print(f"{'cenário':<10} {'perfil':<8} {'mediana antes':>14} {'mediana depois':>15} {'Δ tempo':>8} "
+          f"{'Δ RSS filhos':>13} {'Δ saída':>8}")
+
+    def delta(x, y):
+        return f"{(y - x) / x * 100:+.1f}%" if x and y is not None else "-"
+
+    for chave in sorted(a.keys() & d.keys()):
+        ra, rd = a[chave], d[chave]
+        print(
+            f"{chave[0]:<10} {chave[1]:<8} {ra['tempo_s']['mediana']:>13.3f}s {rd['tempo_s']['mediana']:>14.3f}s "
+            f"{delta(ra['tempo_s']['mediana'], rd['tempo_s']['mediana']):>8} "
+            f"{delta(ra['pico_rss_kb']['filhos'], rd['pico_rss_kb']['filhos']):>13} "
+            f"{delta(ra['tamanho_saida_bytes'], rd['tamanho_saida_bytes']):>8}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--cenario", choices=CENARIOS, action="append",
+                        help="cenário a rodar (pode repetir; padrão: todos)")
+    parser.add_argument("-p", "--perfil", choices=PERFIS, action="append",
+                        help="tamanho do modelo/payload (pode repetir; padrão: medio)")
+    parser.add_argument("-n", "--repeticoes", type=int, default=5)
+    parser.add_argument("-o", "--saida", help="acrescenta os resultados (JSON lines) neste arquivo")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"),
+                        help="compara dois arquivos de resultados")
+    parser.add_argument("--interno", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    if args.interno:
+        print(json.dumps(executar_cenario(args.cenario[0], args.perfil[0], args.repeticoes)))
+        return
+
+    for perfil in args.perfil or ["medio"]:
+        for cenario in args.cenario or CENARIOS:
+            resultado = rodar(cenario, perfil, args.repeticoes)
+            linha = json.dumps(resultado, ensure_ascii=False)
+            print(linha, flush=True)
+            if args.saida:
+                with open(args.saida, "a", encoding="utf-8") as f:
+                    f.write(linha + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import base64
+import random
+from io import BytesIO
+
+from docx import Document
+
+try:
+    from PIL import Image
+except ImportError:  # sem Pillow não há como gerar fotos sintéticas
+    Image = None
+
+
+# ======================================
+# MODELO .DOCX SINTÉTICO
+# ======================================
+def gerar_modelo(paragrafos: int = 50, tabelas: int = 5, linhas: int = 5, colunas: int = 4,
+                 aninhadas: int = 1, cabecalho: int = 2, imagens: int = 4,
+                 pendencias: bool = True) -> bytes:
+    """
+    Modelo com placeholders em todos os lugares que o renderizador percorre:
+
+    - `paragrafos` parágrafos no corpo, cada um com {{campo_N}};
+    - `tabelas` tabelas linhas x colunas com {{celula_T_L_C}}, e `aninhadas`
+      tabelas dentro da primeira célula de cada uma ({{aninhada_T_N}});
+    - `cabecalho` placeholders no cabeçalho e no rodapé ({{cab_N}}/{{rod_N}});
+    - `imagens` parágrafos só com {{foto_N}};
+    - um parágrafo {{pendencias}} no final, se `pendencias`.
+    """
+    doc = Document()
+
+    for i in range(paragrafos):
+        doc.add_paragraph(f"Item {i}: valor medido {{{{campo_{i}}}}} conforme inspeção.")
+
+    for t in range(tabelas):
+        tabela = doc.add_table(rows=linhas, cols=colunas)
+        for l, linha in enumerate(tabela.rows):
+            for c, celula in enumerate(linha.cells):
+                celula.text = f"{{{{celula_{t}_{l}_{c}}}}}"
+
+        for n in range(aninhadas):
+            interna = tabela.cell(0, 0).add_table(rows=2, cols=2)
+            interna.cell(0, 0).text = f"{{{{aninhada_{t}_{n}}}}}"
+
+    for i in range(imagens):
+        doc.add_paragraph(f"{{{{foto_{i}}}}}")
+
+    if pendencias:
+        doc.add_paragraph("{{pendencias}}")
+
+    secao = doc.sections[0]
+    secao.header.paragraphs[0].text = " ".join(f"{{{{cab_{i}}}}}" for i in range(cabecalho))
+    secao.footer.paragraphs[0].text = " ".join(f"{{{{rod_{i}}}}}" for i in range(cabecalho))
+
+    saida = BytesIO()
+    doc.save(saida)
+    return saida.getvalue()
+
+
+def chaves_modelo(paragrafos: int = 50, tabelas: int = 5, linhas: int = 5, colunas: int = 4,
+                  aninhadas: int = 1, cabecalho: int = 2, imagens: int = 4,
+                  pendencias: bool = True) -> dict:
+    """
+    Placeholders de texto e de imagem de um modelo de `gerar_modelo` com os
+    mesmos parâmetros.
+    """
+    textos = [f"campo_{i}" for i in range(paragrafos)]
+    for t in range(tabelas):
+        textos += [f"celula_{t}_{l}_{c}" for l in range(linhas) for c in range(colunas)]
+        textos += [f"aninhada_{t}_{n}" for n in range(aninhadas)]
+    textos += [f"cab_{i}" for i in range(cabecalho)] + [f"rod_{i}" for i in range(cabecalho)]
+
+    return {"textos": textos, "imagens": [f"foto_{i}" for i in range(imagens)]}
+
+
+# ======================================
+# PAYLOAD SINTÉTICO
+# ======================================
+def gerar_foto(lado: int = 2000, semente: int = 0) -> str:
+    """
+    Foto JPEG em data URL com ruído (não comprime bem, como uma foto real).
+    """
+    if Image is None:
+        raise RuntimeError("Pillow é necessário para gerar imagens sintéticas")
+
+    largura, altura = lado, lado * 3 // 4
+    aleatorio = random.Random(semente)
+    ruido = aleatorio.randbytes((largura // 4) * (altura // 4) * 3)
+    foto = Image.frombytes("RGB", (largura // 4, altura // 4), ruido).resize((largura, altura))
+
+    saida = BytesIO()
+    foto.save(saida, "JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(saida.getvalue()).decode()
+
+
+def gerar_payload(chaves: dict, campos: int = None, imagens: int = None, pendencias: int = 3,
+                  imagens_pendencia: int = 1, lado_imagem: int = 2000, semente: int = 0) -> dict:
+    """
+    Dados para /automate/gerar-doc: os `campos` primeiros placeholders de
+    texto (todos, por padrão), `imagens` fotos e `pendencias` itens de
+    pendência, `imagens_pendencia` deles com foto.
+    """
+    textos = chaves["textos"] if campos is None else chaves["textos"][:campos]
+    fotos = chaves["imagens"] if imagens is None else chaves["imagens"][:imagens]
+
+    dados = {chave: f"valor {i}" for i, chave in enumerate(textos)}
+    dados.update({chave: gerar_foto(lado_imagem, semente + i) for i, chave in enumerate(fotos)})
+
+    itens = [
+        {
+            "titulo": f"Pendência {i}",
+            "descricao": f"Descrição da pendência {i}",
+            **({"imagem": gerar_foto(lado_imagem, semente + 1000 + i)} if i < imagens_pendencia else {}),
+        }
+        for i in range(pendencias)
+    ]
+
+    return {
+        "dados": dados,
+        "pendencias": itens,
+        "chavePendencia": "pendencias",
+        "responsavel": "benchmark",
+        "equipamento": "EQ-01",
+        "itens_pendentes": [],
+    }
@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+# ------------------------------------
+# CONFIG GERAL (sobrescrevível por variáveis de ambiente)
+# ------------------------------------
+
+# Orçamento (em bytes) do cache de modelos compilados, por processo
+TEMPLATE_CACHE_MAX_BYTES = int(os.getenv("SYNTHETIS_TEMPLATE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Cache em disco dos .docx dos modelos, compartilhado pelos processos da máquina
+TEMPLATE_BLOB_CACHE_DIR = os.getenv("SYNTHETIS_TEMPLATE_BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "synthetis-modelos"))
+TEMPLATE_BLOB_CACHE_MAX_BYTES = int(os.getenv("SYNTHETIS_TEMPLATE_BLOB_CACHE_MAX_BYTES", 1024 * 1024 * 1024))  # 0 = desligado
+
+# Pool de processos para renderização dos .docx
+RENDER_WORKERS = int(os.getenv("SYNTHETIS_RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_MAX_TASKS_PER_CHILD = int(os.getenv("SYNTHETIS_RENDER_MAX_TASKS_PER_CHILD", 500))  # 0 = sem limite
+RENDER_MAX_QUEUE = int(os.getenv("SYNTHETIS_RENDER_MAX_QUEUE", 64))
+
+# Imagens embutidas nos relatórios
+IMAGE_DPI = int(os.getenv("SYNTHETIS_IMAGE_DPI", 150))
+IMAGE_JPEG_QUALITY = int(os.getenv("SYNTHETIS_IMAGE_JPEG_QUALITY", 82))
+IMAGE_PNG_COMPRESS_LEVEL = int(os.getenv("SYNTHETIS_IMAGE_PNG_COMPRESS_LEVEL", 6))
+IMAGE_THREADS = int(os.getenv("SYNTHETIS_IMAGE_THREADS", 4))
+
+# Upload multipart do /automate/gerar-doc-multipart
+UPLOAD_MAX_FILES = int(os.getenv("SYNTHETIS_UPLOAD_MAX_FILES", 200))
+
+# Armazenamento dos relatórios gerados: "local" (disco) ou "memoria" (testes)
+STORAGE_BACKEND = os.getenv("SYNTHETIS_STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.getenv("SYNTHETIS_STORAGE_ROOT", r"C:\synthetis\relatórios")
+# Camada fria: relatórios antigos, compactados (services.manutencao)
+STORAGE_COLD_ROOT = os.getenv("SYNTHETIS_STORAGE_COLD_ROOT", os.path.join(STORAGE_ROOT, "frio"))
+# Relatórios guardados só com o que difere da versão do modelo (services.delta)
+STORAGE_DELTA = os.getenv("SYNTHETIS_STORAGE_DELTA", "0") == "1"
+DELTA_CACHE_DIR = os.getenv("SYNTHETIS_DELTA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "synthetis-montados"))
+DELTA_CACHE_ENTRIES = int(os.getenv("SYNTHETIS_DELTA_CACHE_ENTRIES", 16))  # .docx remontados mantidos na pasta (todos os processos)
+
+# Extração de variáveis ({{ }}) de modelos enviados
+EXTRACT_CACHE_ENTRIES = int(os.getenv("SYNTHETIS_EXTRACT_CACHE_ENTRIES", 256))
+
+# Senhas (bcrypt): custo calibrado para ~BCRYPT_TARGET_MS por verificação,
+# a não ser que BCRYPT_ROUNDS seja fixado (> 0)
+BCRYPT_TARGET_MS = int(os.getenv("SYNTHETIS_BCRYPT_TARGET_MS", 250))
+BCRYPT_ROUNDS = int(os.getenv("SYNTHETIS_BCRYPT_ROUNDS", 0))
+BCRYPT_MIN_ROUNDS = int(os.getenv("SYNTHETIS_BCRYPT_MIN_ROUNDS", 10))
+BCRYPT_MAX_ROUNDS = int(os.getenv("SYNTHETIS_BCRYPT_MAX_ROUNDS", 14))
+LOGIN_THREADS = int(os.getenv("SYNTHETIS_LOGIN_THREADS", 4))
+
+# Cache da listagem de modelos (/app/modelos), por processo
+MODEL_LIST_CACHE_TTL = float(os.getenv("SYNTHETIS_MODEL_LIST_CACHE_TTL", 30))  # segundos sem revalidar no banco
+MODEL_LIST_CACHE_ENTRIES = int(os.getenv("SYNTHETIS_MODEL_LIST_CACHE_ENTRIES", 256))
+
+# Manutenção do armazenamento (services.manutencao)
+SWEEP_GRACE_HOURS = float(os.getenv("SYNTHETIS_SWEEP_GRACE_HOURS", 24))  # idade mínima de um órfão para ser removido
+SWEEP_COLD_AFTER_DAYS = float(os.getenv("SYNTHETIS_SWEEP_COLD_AFTER_DAYS", 180))  # 0 = sem camada fria
+SWEEP_INTERVAL_HOURS = float(os.getenv("SYNTHETIS_SWEEP_INTERVAL_HOURS", 0))  # 0 = só pela linha de comando
+
+# Busca textual (services.busca), MySQL: o innodb_ft_min_token_size do servidor;
+# termos mais curtos não estão no índice FULLTEXT e são filtrados com LIKE
+SEARCH_FT_MIN_TOKEN = int(os.getenv("SYNTHETIS_SEARCH_FT_MIN_TOKEN", 3))
+
+# Perfis de requisições (services.perfilador)
+PROFILE_ADMINS = {u.strip() for u in os.getenv("SYNTHETIS_PROFILE_ADMINS", "").split(",") if u.strip()}  # quem pode pedir/ver perfis
+PROFILE_SLOW_MS = float(os.getenv("SYNTHETIS_PROFILE_SLOW_MS", 0))  # guarda sozinho as mais lentas que isso; 0 = só sob demanda
+PROFILE_SAMPLE_MS = float(os.getenv("SYNTHETIS_PROFILE_SAMPLE_MS", 10))  # intervalo do amostrador de pilhas
+PROFILE_RING_SIZE = int(os.getenv("SYNTHETIS_PROFILE_RING_SIZE", 20))  # perfis guardados (os mais recentes)
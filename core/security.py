@@ -1,8 +1,21 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
+from passlib.hash import bcrypt
 from jose import jwt, JWTError
+from core.config import (
+    BCRYPT_TARGET_MS,
+    BCRYPT_ROUNDS,
+    BCRYPT_MIN_ROUNDS,
+    BCRYPT_MAX_ROUNDS,
+    LOGIN_THREADS,
+)
 
 # ------------------------------------
 # CONFIG DO JWT
@@ -13,11 +26,78 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 360
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# ------------------------------------
+# SENHAS (BCRYPT)
+# ------------------------------------
+_pwd_context = None
+_pwd_lock = threading.Lock()
+
+# Verificações rodam num pool próprio e limitado: uma onda de logins
+# não ocupa a threadpool do Starlette usada pelo resto da API
+_pool_senhas = ThreadPoolExecutor(max_workers=LOGIN_THREADS, thread_name_prefix="bcrypt")
+
+
+def calibrar_rounds(alvo_ms: int = BCRYPT_TARGET_MS, amostras: int = 5) -> int:
+    """
+    Maior custo bcrypt cuja verificação cabe em `alvo_ms` nesta máquina.
+    Mede com custo baixo (mediana de `amostras`, para que workers e
+    reinícios cheguem ao mesmo custo) e extrapola: cada round a mais
+    dobra o tempo. Para um custo fixo, use SYNTHETIS_BCRYPT_ROUNDS.
+    """
+    base = 8
+    tempos = []
+    for _ in range(amostras):
+        inicio = time.perf_counter()
+        bcrypt.using(rounds=base).hash("calibracao")
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    ms = statistics.median(tempos)
+
+    rounds = base
+    while ms * 2 <= alvo_ms and rounds < BCRYPT_MAX_ROUNDS:
+        ms *= 2
+        rounds += 1
+
+    return max(BCRYPT_MIN_ROUNDS, min(rounds, BCRYPT_MAX_ROUNDS))
+
+
+def criar_pwd_context(rounds: int) -> CryptContext:
+    """
+    Novos hashes saem com `rounds`. Só hashes mais fracos que isso são
+    marcados por needs_update (e refeitos no próximo login válido); um
+    hash mais forte nunca é rebaixado.
+    """
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+
+def get_pwd_context() -> CryptContext:
+    """Contexto criado no primeiro uso (a calibração leva alguns hashes)."""
+    global _pwd_context
+
+    if _pwd_context is None:
+        with _pwd_lock:
+            if _pwd_context is None:
+                _pwd_context = criar_pwd_context(BCRYPT_ROUNDS or calibrar_rounds())
+
+    return _pwd_context
 
 
 def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+    return get_pwd_context().verify(plain, hashed)
+
+
+async def verify_and_update_password(plain, hashed):
+    """
+    Verifica a senha no pool de bcrypt. Retorna (valida, novo_hash);
+    novo_hash vem preenchido quando o hash guardado precisa ser refeito.
+    """
+    loop = asyncio.get_running_loop()
+    # o contexto também é obtido no pool: o primeiro uso calibra (bcrypt)
+    return await loop.run_in_executor(_pool_senhas, lambda: get_pwd_context().verify_and_update(plain, hashed))
 
 
 # ------------------------------------
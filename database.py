@@ -1,14 +1,174 @@
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from services import metricas
 
-DATABASE_URL = "mysql+pymysql://root:@localhost:3306/api_synthetis"
+# URL no formato assíncrono; a síncrona é derivada trocando o driver.
+# Para rodar sem MySQL: SYNTHETIS_DATABASE_URL=sqlite+aiosqlite:///./synthetis.db
+ASYNC_DATABASE_URL = os.getenv(
+    "SYNTHETIS_DATABASE_URL", "mysql+aiomysql://root:@localhost:3306/api_synthetis"
+)
+DATABASE_URL = (
+    ASYNC_DATABASE_URL
+    .replace("+aiomysql", "+pymysql")
+    .replace("+aiosqlite", "")
+)
 
-engine = create_engine(DATABASE_URL,  pool_pre_ping=True,
-    pool_recycle=280,
-    pool_size=10,
-    max_overflow=20)
+SQLITE = DATABASE_URL.startswith("sqlite")
+
+POOL_SIZE = int(os.getenv("SYNTHETIS_DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.getenv("SYNTHETIS_DB_MAX_OVERFLOW", 20))
+
+
+# ------------------------------------
+# POOLS COM MÉTRICAS (espera e tempo de uso das conexões)
+# ------------------------------------
+class PoolMedido(QueuePool):
+    rotulo = "sync"
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metricas.pool_espera_segundos.observar(time.perf_counter() - inicio, engine=self.rotulo)
+
+
+class PoolMedidoAsync(AsyncAdaptedQueuePool):
+    rotulo = "async"
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metricas.pool_espera_segundos.observar(time.perf_counter() - inicio, engine=self.rotulo)
+
+
+if SQLITE:
+    # SQLite: sem pool_size/max_overflow e liberado entre threads
+    _opcoes_engine = {"connect_args": {"check_same_thread": False}}
+    _opcoes_async = {}
+else:
+    _opcoes_engine = _opcoes_async = {
+        "pool_pre_ping": True,
+        "pool_recycle": 280,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+    }
+
+# SQLite em memória precisa do pool próprio do dialeto
+_MEMORIA = SQLITE and ":memory:" in DATABASE_URL or DATABASE_URL in ("sqlite://", "sqlite:///")
+
+engine = create_engine(
+    DATABASE_URL, **_opcoes_engine, **({} if _MEMORIA else {"poolclass": PoolMedido})
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **_opcoes_async, **({} if _MEMORIA else {"poolclass": PoolMedidoAsync})
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+Base = declarative_base()
+
+
+def _medir_uso(pool, rotulo: str):
+    @event.listens_for(pool, "checkout")
+    def _checkout(conexao, registro, proxy):
+        registro.info["retirada_em"] = time.perf_counter()
+
+    @event.listens_for(pool, "checkin")
+    def _checkin(conexao, registro):
+        inicio = registro.info.pop("retirada_em", None)
+        if inicio is not None:
+            metricas.pool_uso_segundos.observar(time.perf_counter() - inicio, engine=rotulo)
+
+
+_medir_uso(engine.pool, "sync")
+_medir_uso(async_engine.sync_engine.pool, "async")
+
+
+def _estado_pools() -> dict:
+    estado = {}
+    for rotulo, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        if isinstance(pool, QueuePool):
+            estado[(rotulo, "em_uso")] = pool.checkedout()
+            estado[(rotulo, "livres")] = pool.checkedin()
+            estado[(rotulo, "overflow")] = max(0, pool.overflow())
+    return estado
+
+
+metricas.registro.registrar(metricas.Medidor(
+    "synthetis_db_pool_conexoes", "Conexões dos pools do banco por estado.",
+    ("engine", "estado"), _estado_pools,
+))
+
+
+# ------------------------------------
+# COLUNAS E ÍNDICES EM TABELAS JÁ EXISTENTES
+# ------------------------------------
+def criar_colunas_ausentes(*colunas):
+    """
+    create_all não altera tabelas que já existem: as colunas declaradas
+    depois nos models são acrescentadas aqui (ALTER TABLE ... ADD COLUMN)
+    se ainda não existem no banco. Só servem colunas que aceitam NULL ou
+    têm server_default.
+    """
+    for coluna in colunas:
+        tabela = coluna.table.name
+        if any(c["name"] == coluna.name for c in inspect(engine).get_columns(tabela)):
+            continue
+        ddl = CreateColumn(coluna).compile(dialect=engine.dialect)
+        try:
+            with engine.begin() as conexao:
+                conexao.exec_driver_sql(
+                    f"ALTER TABLE {engine.dialect.identifier_preparer.format_table(coluna.table)} ADD COLUMN {ddl}"
+                )
+        except DBAPIError:
+            # outro worker pode ter criado ao mesmo tempo
+            if not any(c["name"] == coluna.name for c in inspect(engine).get_columns(tabela)):
+                raise
+
+
+def criar_indices_ausentes(*indices):
+    """
+    create_all só cria índices junto com tabelas novas: os declarados
+    depois nos models são criados aqui se ainda não existem no banco.
+    """
+    for indice in indices:
+        tabela = indice.table.name
+        if any(i["name"] == indice.name for i in inspect(engine).get_indexes(tabela)):
+            continue
+        try:
+            indice.create(bind=engine)
+        except DBAPIError:
+            # outro worker pode ter criado ao mesmo tempo
+            if not any(i["name"] == indice.name for i in inspect(engine).get_indexes(tabela)):
+                raise
+
+
+# ------------------------------------
+# DEPENDÊNCIAS (compartilhadas pelos routers)
+# ------------------------------------
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
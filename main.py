@@ -1,11 +1,29 @@
-from fastapi import FastAPI
-from routes import auth, automate, aplication
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from routes import auth, automate, aplication, perfis
 from fastapi.middleware.cors import CORSMiddleware
+from services.render_pool import executor_renderizacao
+from services.manutencao import iniciar_manutencao
+from services.metricas import MiddlewareMetricas, registro, TIPO_CONTEUDO
+from services.perfilador import MiddlewarePerfilador
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # limpeza periódica do armazenamento (desligada por padrão)
+    manutencao = iniciar_manutencao()
+    yield
+    if manutencao is not None:
+        manutencao.cancel()
+    # encerra os processos de renderização junto com o servidor
+    executor_renderizacao.encerrar()
+
 
 app = FastAPI(
     title="API Synthetis",
     description="API do software de automaçao Synthetis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # IP local e localhost
@@ -17,10 +35,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"]
+    expose_headers=["Content-Disposition", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified", "X-Synthetis-Perfil-Id"]
 )
 
+# Latência por rota, exportada em /metrics
+app.add_middleware(MiddlewareMetricas)
+
+# Perfis sob demanda (admins) ou das requisições lentas, lidos em /perfis
+app.add_middleware(MiddlewarePerfilador)
+
 # Rotas
 app.include_router(auth.router)
 app.include_router(automate.router)
 app.include_router(aplication.router)
+app.include_router(perfis.router)
+
+
+# Métricas no formato texto do Prometheus (por processo)
+@app.get("/metrics", include_in_schema=False)
+def metricas():
+    return Response(content=registro.exportar(), media_type=TIPO_CONTEUDO)
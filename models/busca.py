@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Text, Index
+from database import Base
+
+# Índice de busca dos relatórios (services.busca), mantido pelos eventos de
+# Relatorio na mesma transação; filtros e ordenação usam a própria tabela
+# relatorios. O texto já vem normalizado (minúsculo, sem acento):
+# nome_arquivo, título do modelo e textos dos itens pendentes.
+class DocumentoBusca(Base):
+    __tablename__ = "relatorios_busca"
+
+    relatorio_id = Column(Integer, primary_key=True, autoincrement=False)
+    texto = Column(Text, nullable=False)
+
+    __table_args__ = (
+        # MySQL: MATCH ... AGAINST; nos outros bancos vale relatorios_busca_termos
+        Index("ft_relatorios_busca_texto", "texto", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
+
+
+# Índice invertido (termo -> relatórios) para bancos sem FULLTEXT (SQLite);
+# no MySQL a tabela não é criada. A chave começa pelo emissor porque toda
+# busca é do próprio usuário: o prefixo de um termo vira um range curto na
+# chave primária.
+class TermoBusca(Base):
+    __tablename__ = "relatorios_busca_termos"
+
+    emissor = Column(String(256), primary_key=True)
+    termo = Column(String(64), primary_key=True)
+    relatorio_id = Column(Integer, primary_key=True, autoincrement=False)
+    frequencia = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # remoção/reindexação de um relatório
+        Index("ix_relatorios_busca_termos_relatorio", "relatorio_id"),
+    )
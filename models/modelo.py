@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, LargeBinary, TIMESTAMP, text, Boolean
+from sqlalchemy import Column, Integer, String, Text, LargeBinary, TIMESTAMP, text, Boolean, func, Index
+from sqlalchemy.orm import deferred
 from database import Base
 
 class Modelo(Base):
@@ -9,7 +10,15 @@ class Modelo(Base):
     equipe = Column(String(255), nullable=True)
     descriçao = Column(String(500), nullable=False)
     modelo_automacao = Column(Text, nullable=False)  # LONGTEXT para JSON em texto puro
-    documento_modelo = Column(LargeBinary, nullable=False)  # MEDIUMBLOB para o Word
+    # MEDIUMBLOB para o Word; só é lido quando pedido (miss do services.cache_blobs)
+    documento_modelo = deferred(Column(LargeBinary, nullable=False))
     termografia = Column(Boolean, nullable=False)
+    manifesto_placeholders = Column(Text, nullable=True)  # JSON gerado na criação (services.manifesto)
     criado_em = Column(TIMESTAMP, nullable=False, server_default=text('CURRENT_TIMESTAMP'))
-    atualizado_em = Column(TIMESTAMP, nullable=False, server_default=text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'))
+    # onupdate no ORM (portável; o SQLite não aceita ON UPDATE no DDL)
+    atualizado_em = Column(TIMESTAMP, nullable=False, server_default=text('CURRENT_TIMESTAMP'), onupdate=func.now())
+
+    __table_args__ = (
+        # listagem por equipe e sua versão (MAX(atualizado_em)) no cache de /app/modelos
+        Index("ix_modelos_equipe_atualizado", "equipe", "atualizado_em"),
+    )
@@ -1,6 +1,27 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, func, Boolean, Text
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import Column, Integer, String, TIMESTAMP, func, Boolean, Text, Index, text
 from database import Base
 
+FUSO_BR = timezone(timedelta(hours=-4))  # Rondônia (UTC-4)
+
+
+def horario_emissao(momento: datetime) -> datetime:
+    """
+    Data comparável com emitido_em (filtros desde/ate): horário local
+    (UTC-4) sem fuso, como a coluna é gravada. No SQLite a comparação é
+    textual, então o parâmetro precisa do mesmo formato.
+    """
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(FUSO_BR).replace(tzinfo=None)
+    return momento
+
+
+def agora_emissao() -> datetime:
+    # sem fração de segundo: é o que o TIMESTAMP do MySQL guarda, e o cursor
+    # de recuperarRelatorios volta com exatamente o valor lido
+    return datetime.now(FUSO_BR).replace(tzinfo=None, microsecond=0)
+
+
 class Relatorio(Base):
     __tablename__ = "relatorios"
 
@@ -9,6 +30,22 @@ class Relatorio(Base):
     emissor = Column(String(256), nullable=False)
     equipe = Column(String(256), nullable=False)
     nome_arquivo = Column(String(256), nullable=False)
-    item_pendente = Column(Text, nullable=False)
+    item_pendente = Column(Text, nullable=True)  # resolver_pendencias zera com None
     caminho_arquivo = Column(String(512), nullable=False)
-    emitido_em = Column(TIMESTAMP, server_default=func.now())
+    # JSON {chave: [{parte, caminho}]} dos placeholders ainda não resolvidos (services.pacote)
+    mapa_pendentes = Column(Text, nullable=True)
+    # default no Python (agora_emissao): o func.now() do SQLite grava sem os
+    # microssegundos que os parâmetros DATETIME levam e a ordem textual quebra
+    emitido_em = Column(TIMESTAMP, server_default=func.now(), default=agora_emissao)
+
+    __table_args__ = (
+        # listagem por usuário/equipe ordenada por data (recuperarRelatorios)
+        Index("ix_relatorios_emissor_equipe_emitido", "emissor", "equipe", "emitido_em"),
+    )
+
+
+def normalizar_emitido_em_sqlite(conexao):
+    """Completa o formato dos emitido_em gravados pelo CURRENT_TIMESTAMP (SQLite)."""
+    conexao.execute(text(
+        "UPDATE relatorios SET emitido_em = emitido_em || '.000000' WHERE length(emitido_em) = 19"
+    ))
@@ -1,11 +1,32 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, select, update, func
 from database import Base
 
 class User(Base):
     __tablename__ = "usuarios"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    usuario = Column(String(255), nullable=False)
+    usuario = Column(String(255), nullable=False, unique=True, index=True)
     senha = Column(String(255), nullable=False)
     equipe = Column(String(255), nullable=True)
-    acesso = Column(Integer, nullable=False)
\ No newline at end of file
+    acesso = Column(Integer, nullable=False)
+
+
+def renomear_usuarios_duplicados(conexao) -> list[str]:
+    """
+    Prepara o índice único ix_usuarios_usuario em bancos antigos: das contas
+    com o mesmo nome, a de menor id fica como está e as outras passam a se
+    chamar "<usuario>#<id>". Devolve os nomes novos.
+    """
+    repetidos = select(User.usuario).group_by(User.usuario).having(func.count() > 1)
+    primeiros = select(func.min(User.id)).group_by(User.usuario)
+    linhas = conexao.execute(
+        select(User.id, User.usuario).where(User.usuario.in_(repetidos), User.id.not_in(primeiros))
+    ).all()
+
+    novos = []
+    for id_, usuario in linhas:
+        sufixo = f"#{id_}"
+        novo = usuario[:User.usuario.type.length - len(sufixo)] + sufixo
+        conexao.execute(update(User).where(User.id == id_).values(usuario=novo))
+        novos.append(novo)
+    return novos
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, TIMESTAMP, func
+from sqlalchemy.orm import deferred
+from database import Base
+
+# Cópia imutável do .docx de uma versão de modelo: base dos relatórios guardados
+# como diferença (services.delta). Só recebe INSERT, nunca UPDATE/DELETE.
+class VersaoModelo(Base):
+    __tablename__ = "versoes_modelo"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), nullable=False, unique=True)  # do próprio .docx
+    modelo_id = Column(Integer, nullable=False, index=True)
+    # MEDIUMBLOB no MySQL; só é lido para remontar relatórios (miss do services.cache_blobs)
+    documento = deferred(Column(LargeBinary(16 * 1024 * 1024 - 1), nullable=False))
+    criado_em = Column(TIMESTAMP, server_default=func.now())
@@ -1,51 +1,128 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form, Request, Response
+from sqlalchemy import or_, and_, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+from database import engine, get_db, get_async_db, SQLITE, criar_colunas_ausentes, criar_indices_ausentes
 from models.modelo import Modelo, Base
-from models.relatorio import Relatorio
-from fastapi.responses import StreamingResponse
+from models.relatorio import Relatorio, horario_emissao, normalizar_emitido_em_sqlite
+from models.usuario import User, renomear_usuarios_duplicados
 import zipfile
-import re
-from io import BytesIO
-from xml.etree import ElementTree as ET
+import json
+import logging
+import base64
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
 from core.security import get_current_user
-import os
+from services.storage import ArquivoNaoEncontrado
+from services.delta import metadados_relatorio, abrir_relatorio
+from services.download import RespostaArquivo, etag_confere, content_disposition
+from services.cache_listagem import cache_listagem, serializar
+from services.extracao import extrair_variaveis_memoizado
+from services.manifesto import carregar_manifesto, ModeloInvalido
+from services.render_pool import executor_renderizacao, FilaRenderizacaoCheia
+from services import busca
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/app", tags=["Modelos"])
 
-Base.metadata.create_all(bind=engine)
+Base.metadata.create_all(bind=engine, tables=[t for t in Base.metadata.sorted_tables if t not in busca.TABELAS_SEM_USO])
 
+# colunas e índices declarados depois que as tabelas já existiam em produção
+criar_colunas_ausentes(
+    Modelo.__table__.c.manifesto_placeholders,
+    Relatorio.__table__.c.mapa_pendentes,
+)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+with engine.begin() as conexao:
+    # o índice de login é único: nomes repetidos de antes dele são renomeados
+    for renomeado in renomear_usuarios_duplicados(conexao):
+        logger.warning("Usuário com nome repetido renomeado para %s", renomeado)
+
+criar_indices_ausentes(
+    *(i for i in Modelo.__table__.indexes if i.name == "ix_modelos_equipe_atualizado"),
+    *(i for i in Relatorio.__table__.indexes if i.name == "ix_relatorios_emissor_equipe_emitido"),
+    *(i for i in User.__table__.indexes if i.name == "ix_usuarios_usuario"),
+)
+
+if SQLITE:
+    with engine.begin() as conexao:
+        normalizar_emitido_em_sqlite(conexao)
 
 
 # --------------------------------------------------------
 # LISTA MODELOS
 # --------------------------------------------------------
 @router.get("/modelos")
-def listar_modelos(
+async def listar_modelos(
+    request: Request,
     equipe: str = Query(...),
-    db: Session = Depends(get_db),
+    resumido: bool = Query(False),
+    incluir_manifesto: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    modelos = db.query(Modelo).filter(Modelo.equipe == equipe).all()
-    return [
-        {
+    """
+    A resposta fica em cache por equipe (services.cache_listagem) e vem
+    com ETag: reenviando-o em If-None-Match, o cliente recebe 304.
+    """
+    chave = (equipe, resumido, incluir_manifesto)
+    entrada = cache_listagem.obter(chave)
+
+    if entrada is None:
+        geracao = cache_listagem.geracao(equipe)
+        versao = tuple((await db.execute(
+            select(func.max(Modelo.atualizado_em), func.count(Modelo.id))
+            .where(Modelo.equipe == equipe)
+        )).one())
+
+        entrada = cache_listagem.revalidar(chave, versao)
+        if entrada is None:
+            corpo = serializar(await _consultar_modelos(db, equipe, resumido, incluir_manifesto))
+            entrada = cache_listagem.guardar(chave, versao, corpo, geracao)
+
+    cabecalhos = {"ETag": entrada.etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_confere(if_none_match, entrada.etag):
+        return Response(status_code=304, headers=cabecalhos)
+
+    return Response(content=entrada.corpo, media_type="application/json", headers=cabecalhos)
+
+
+async def _consultar_modelos(db: AsyncSession, equipe: str, resumido: bool, incluir_manifesto: bool) -> list:
+    # documento_modelo (BLOB) é deferred e nunca é lido aqui;
+    # no modo resumido também não traz o JSON de modelo_automacao
+    colunas = [Modelo.id, Modelo.titulo, Modelo.descriçao, Modelo.equipe, Modelo.termografia]
+    if not resumido:
+        colunas.append(Modelo.modelo_automacao)
+    if incluir_manifesto:
+        colunas.append(Modelo.manifesto_placeholders)
+
+    modelos = (await db.execute(
+        select(Modelo)
+        .options(load_only(*colunas))
+        .where(Modelo.equipe == equipe)
+    )).scalars().all()
+
+    resultado = []
+    for m in modelos:
+        item = {
             "id": m.id,
             "titulo": m.titulo,
             "descriçao": m.descriçao,
             "equipe": m.equipe,
-            "modelo_automacao": m.modelo_automacao,
+            "modelo_automacao": None if resumido else m.modelo_automacao,
             "termografia": m.termografia
         }
-        for m in modelos
-    ]
+        if resumido:
+            del item["modelo_automacao"]
+        if incluir_manifesto:
+            item["manifesto"] = carregar_manifesto(m.manifesto_placeholders)
+        resultado.append(item)
+
+    return resultado
 
 
 # --------------------------------------------------------
@@ -59,39 +136,12 @@ async def extrair_variaveis(
     if not file.filename.endswith(".docx"):
         return {"erro": "Formato inválido. Envie um arquivo .docx"}
 
-    content = await file.read()
-    textos = []
-
-    with zipfile.ZipFile(BytesIO(content)) as docx:
-        partes = [
-            "word/document.xml",
-            *[f"word/header{i}.xml" for i in range(1, 6)],
-            *[f"word/footer{i}.xml" for i in range(1, 6)],
-        ]
-
-        for parte in partes:
-            if parte in docx.namelist():
-                try:
-                    xml = docx.read(parte)
-                    root = ET.fromstring(xml)
-                    textos += [
-                        node.text for node in root.iter()
-                        if node.tag.endswith("}t") and node.text
-                    ]
-                except ET.ParseError:
-                    continue
-
-    texto_completo = " ".join(textos)
-    variaveis = re.findall(r"\{\{(.*?)\}\}", texto_completo)
-
-    vistos = set()
-    variaveis_ordenadas = []
-
-    for v in variaveis:
-        var = v.strip()
-        if var not in vistos:
-            vistos.add(var)
-            variaveis_ordenadas.append(var)
+    # UploadFile já vem num SpooledTemporaryFile (vai para o disco acima
+    # do limite do parser); a extração lê direto dele, sem file.read()
+    try:
+        variaveis_ordenadas = await run_in_threadpool(extrair_variaveis_memoizado, file.file)
+    except zipfile.BadZipFile:
+        return {"erro": "Arquivo .docx inválido"}
 
     return {"variaveis": variaveis_ordenadas}
 
@@ -107,73 +157,227 @@ async def criar_modelo(
     modelo_automacao: str = Form(...),
     documento_modelo: UploadFile = File(...),
     termografia: bool = Form(...),
+    chave_pendencia: str = Form(None),
+    campos_imagem: str = Form(None),
     db: Session = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
+    """
+    `chave_pendencia` e `campos_imagem` (lista JSON ou nomes separados por
+    vírgula) são opcionais e só servem para classificar os placeholders no
+    manifesto; sem eles, todos são registrados como texto.
+    """
     if not documento_modelo.filename.endswith(".docx"):
         return {"erro": "O arquivo deve estar no formato .docx"}
 
     conteudo_doc = await documento_modelo.read()
 
+    try:
+        campos = json.loads(campos_imagem) if campos_imagem else []
+    except ValueError:
+        campos = [c.strip() for c in campos_imagem.split(",") if c.strip()]
+
+    if not isinstance(campos, list) or not all(isinstance(c, str) for c in campos):
+        raise HTTPException(status_code=400, detail="campos_imagem deve ser uma lista de nomes")
+
+    # placeholders analisados uma vez só, fora do event loop
+    try:
+        manifesto = await executor_renderizacao.manifesto(conteudo_doc, chave_pendencia, campos)
+    except FilaRenderizacaoCheia:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente.")
+    except ModeloInvalido:
+        return {"erro": "Não foi possível ler o arquivo .docx"}
+    except Exception:
+        logger.exception("Erro ao analisar o modelo enviado (%s)", documento_modelo.filename)
+        raise
+
     novo_modelo = Modelo(
         titulo=titulo.strip(),
         equipe=equipe.strip(),
         descriçao=descriçao.strip(),
         modelo_automacao=modelo_automacao.strip(),
         documento_modelo=conteudo_doc,
-        termografia=termografia
+        termografia=termografia,
+        manifesto_placeholders=json.dumps(manifesto, ensure_ascii=False)
     )
 
     db.add(novo_modelo)
     db.commit()
     db.refresh(novo_modelo)
 
+    # a listagem em cache da equipe deixa de valer
+    cache_listagem.invalidar(novo_modelo.equipe)
+
     return {"mensagem": "Modelo criado com sucesso", "id": novo_modelo.id}
 
 
 # --------------------------------------------------------
 # LISTA RELATÓRIOS DO USUÁRIO
 # --------------------------------------------------------
+def codificar_cursor(relatorio: Relatorio) -> str:
+    bruto = f"{relatorio.emitido_em.isoformat()}|{relatorio.id}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+
+def decodificar_cursor(cursor: str):
+    try:
+        emitido_em, relatorio_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(emitido_em), int(relatorio_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
 @router.get("/recuperarRelatorios")
-def recuperar_relatorios(
+async def recuperar_relatorios(
     equipe: str = Query(None),
-    db: Session = Depends(get_db),
+    modelo: str = Query(None),
+    desde: datetime = Query(None),
+    ate: datetime = Query(None),
+    cursor: str = Query(None),
+    limite: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    query = db.query(Relatorio).filter(Relatorio.emissor == current_user)
+    """
+    Relatórios do usuário, do mais novo para o mais antigo, em páginas.
+
+    A paginação é por cursor (emitido_em, id): para carregar os mais
+    antigos, repita a chamada com `cursor=next_cursor` da resposta
+    anterior. `next_cursor` vem null na última página.
+    """
+    query = select(Relatorio).where(Relatorio.emissor == current_user)
 
     if equipe:
-        query = query.filter(Relatorio.equipe == equipe)
-
-    relatorios = query.order_by(Relatorio.emitido_em.desc()).all()
-
-    if not relatorios:
-        return False
-
-    return [
-        {
-            "id": r.id,
-            "modelo": r.modelo,
-            "emissor": r.emissor,
-            "equipe": r.equipe,
-            "nome_arquivo": r.nome_arquivo,
-            "emitido_em": r.emitido_em,
-            "item_pendente": r.item_pendente
-        }
-        for r in relatorios
-    ]
+        query = query.where(Relatorio.equipe == equipe)
+
+    if modelo:
+        query = query.where(Relatorio.modelo == modelo)
+
+    if desde:
+        query = query.where(Relatorio.emitido_em >= horario_emissao(desde))
+
+    if ate:
+        query = query.where(Relatorio.emitido_em <= horario_emissao(ate))
+
+    if cursor:
+        cursor_emitido, cursor_id = decodificar_cursor(cursor)
+        query = query.where(or_(
+            Relatorio.emitido_em < cursor_emitido,
+            and_(Relatorio.emitido_em == cursor_emitido, Relatorio.id < cursor_id)
+        ))
+
+    relatorios = (await db.execute(
+        query
+        .order_by(Relatorio.emitido_em.desc(), Relatorio.id.desc())
+        .limit(limite + 1)
+    )).scalars().all()
+
+    proximo = None
+    if len(relatorios) > limite:
+        relatorios = relatorios[:limite]
+        proximo = codificar_cursor(relatorios[-1])
+
+    return {
+        "relatorios": [
+            {
+                "id": r.id,
+                "modelo": r.modelo,
+                "emissor": r.emissor,
+                "equipe": r.equipe,
+                "nome_arquivo": r.nome_arquivo,
+                "emitido_em": r.emitido_em,
+                "item_pendente": r.item_pendente
+            }
+            for r in relatorios
+        ],
+        "next_cursor": proximo
+    }
+
+
+# --------------------------------------------------------
+# BUSCA TEXTUAL NOS RELATÓRIOS DO USUÁRIO
+# --------------------------------------------------------
+def codificar_cursor_busca(deslocamento: int) -> str:
+    return base64.urlsafe_b64encode(f"busca|{deslocamento}".encode()).decode()
+
+
+def decodificar_cursor_busca(cursor: str) -> int:
+    try:
+        marcador, deslocamento = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if marcador != "busca" or int(deslocamento) < 0:
+            raise ValueError(cursor)
+        return int(deslocamento)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+@router.get("/relatorios/busca")
+async def buscar_relatorios(
+    q: str = Query(..., min_length=1, max_length=256),
+    equipe: str = Query(None),
+    desde: datetime = Query(None),
+    ate: datetime = Query(None),
+    cursor: str = Query(None),
+    limite: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Relatórios do usuário cujo nome do arquivo, modelo ou itens pendentes
+    contêm todos os termos de `q` (sem diferenciar maiúsculas e acentos;
+    "bomb" encontra "Bomba"), do mais relevante para o menos. Como em
+    recuperarRelatorios, `equipe` só filtra os relatórios do próprio
+    usuário.
+
+    Para a próxima página, repita a chamada com `cursor=next_cursor`.
+    """
+    termos = busca.termos_consulta(q)
+    if not termos:
+        raise HTTPException(status_code=400, detail="Informe ao menos um termo com 2 ou mais caracteres")
+
+    deslocamento = decodificar_cursor_busca(cursor) if cursor else 0
+
+    resultados = await busca.buscar(
+        db, current_user, termos, equipe=equipe,
+        desde=horario_emissao(desde) if desde else None,
+        ate=horario_emissao(ate) if ate else None,
+        limite=limite + 1, deslocamento=deslocamento
+    )
+
+    proximo = None
+    if len(resultados) > limite:
+        resultados = resultados[:limite]
+        proximo = codificar_cursor_busca(deslocamento + limite)
+
+    return {
+        "relatorios": [
+            {
+                "id": r.id,
+                "modelo": r.modelo,
+                "emissor": r.emissor,
+                "equipe": r.equipe,
+                "nome_arquivo": r.nome_arquivo,
+                "emitido_em": r.emitido_em,
+                "item_pendente": r.item_pendente,
+                "relevancia": round(relevancia, 4)
+            }
+            for r, relevancia in resultados
+        ],
+        "next_cursor": proximo
+    }
 
 
 # --------------------------------------------------------
 # BAIXAR RELATÓRIO (LENDO DO DISCO)
 # --------------------------------------------------------
 @router.get("/baixarRelatorio/{relatorio_id}")
-def baixar_relatorio(
+async def baixar_relatorio(
     relatorio_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    relatorio = db.query(Relatorio).filter(Relatorio.id == relatorio_id).first()
+    relatorio = await db.get(Relatorio, relatorio_id)
 
     if not relatorio:
         raise HTTPException(status_code=404, detail="Relatório não encontrado")
@@ -181,13 +385,13 @@ def baixar_relatorio(
     if relatorio.emissor != current_user:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
-    caminho = relatorio.caminho_arquivo
+    chave = relatorio.caminho_arquivo
 
-    if not os.path.exists(caminho):
+    try:
+        tamanho, modificado_em = await run_in_threadpool(metadados_relatorio, chave)
+    except ArquivoNaoEncontrado:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado no servidor")
 
-    file_stream = open(caminho, "rb")
-
 
     nome_download = relatorio.nome_arquivo
     print("Enviando header:", nome_download)
@@ -195,11 +399,16 @@ def baixar_relatorio(
     if not nome_download.lower().endswith(".docx"):
         nome_download += ".docx"
 
-    return StreamingResponse(
-        file_stream,
+    # arquivo é aberto e fechado pela própria resposta, durante o envio
+    return RespostaArquivo(
+        request,
+        lambda: abrir_relatorio(chave),
+        chave,
+        tamanho,
+        modificado_em,
         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         headers={
-            "Content-Disposition": f"attachment; filename=\"{nome_download}\""
+            "Content-Disposition": content_disposition(nome_download)
         }
     )
 
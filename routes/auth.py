@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.security import (
     create_access_token,
     create_refresh_token,
 )
-from database import SessionLocal
+from database import get_async_db
 from services import user_service
 from fastapi.security import OAuth2PasswordRequestForm
 from schemas.user import Token
@@ -14,20 +14,12 @@ from core.security import SECRET_KEY, ALGORITHM
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # -----------------------------
 # LOGIN → retorna access + refresh
 # -----------------------------
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = user_service.authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await user_service.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Credenciais inválidas")        
 
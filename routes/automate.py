@@ -1,27 +1,39 @@
-import os
+import asyncio
+import json
+import logging
+import tempfile
+import zipfile
 import traceback
-from io import BytesIO
-from base64 import b64decode
-import re
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile as StarletteUploadFile
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import SessionLocal, get_db
 from models.modelo import Modelo
-from models.relatorio import Relatorio
+from models.relatorio import Relatorio, agora_emissao
+from services.render_pool import executor_renderizacao, FilaRenderizacaoCheia
+from services.renderizador import referencia_arquivo
+from services.storage import armazenamento, ArquivoNaoEncontrado
+from services.cache_blobs import cache_blobs
+from services.delta import gravar_relatorio, base_do_modelo, base_de, abrir_relatorio, ler_relatorio
+from services.download import content_disposition
+from services.manifesto import carregar_manifesto, filtrar_dados
+from services.pacote import resolver_pendencias_pacote, MapaDesatualizado
+from services import metricas
+from services.metricas import etapa
+from services.perfilador import anotar
+from core.config import UPLOAD_MAX_FILES
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+TIPO_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# entrega=armazenar: grava e devolve só o status (baixa depois por /app/baixarRelatorio)
+# entrega=stream: devolve o .docx na própria resposta e grava em paralelo
+ENTREGAS = "^(armazenar|stream)$"
 
-from docx import Document
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from uuid import uuid4
-from datetime import datetime, timezone, timedelta
-
-FUSO_BR = timezone(timedelta(hours=-4))  # Rondônia (UTC-4)
-
-
-# =========================
-# CONFIG
-# =========================
-BASE_DIR = r"C:\synthetis\relatórios"
 
 router = APIRouter(
     prefix="/automate",
@@ -29,217 +41,137 @@ router = APIRouter(
 )
 
 
-# =========================
-# DB SESSION
-# =========================
-def get_model_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def carregar_modelo(db: Session, modelo_id) -> tuple[Modelo | None, str | bytes | None]:
+    """
+    Modelo (sem o BLOB, que é deferred) e o documento dele: o caminho no
+    cache em disco compartilhado, que só busca o BLOB no banco em caso de
+    miss, ou os bytes, com o cache desligado.
+    """
+    modelo = db.query(Modelo).filter(Modelo.id == modelo_id).first()
+    if modelo is None:
+        return None, None
+
+    documento = cache_blobs.obter(
+        modelo.id, modelo.atualizado_em,
+        lambda: db.query(Modelo.documento_modelo).filter(Modelo.id == modelo.id).scalar()
+    )
+    return modelo, documento
 
 
 # =========================
-# UTILITÁRIOS
+# ARQUIVOS
 # =========================
-def is_base64_image(value: str) -> bool:
-    return isinstance(value, str) and value.startswith("data:image") and ";base64," in value
-
-
-def decode_base64_image(data_url: str) -> BytesIO:
-    base64_str = re.sub(r"^data:image/\w+;base64,", "", data_url)
-    image_bytes = b64decode(base64_str)
-    return BytesIO(image_bytes)
-
-
-def clear_paragraph(paragraph):
-    for run in paragraph.runs:
-        paragraph._element.remove(run._element)
-
-
-# ======================================
-# SUBSTITUIÇÃO DE TEXTOS
-# ======================================
-def substituir_textos_no_documento(doc: Document, dados: dict):
-    for paragraph in doc.paragraphs:
-        for key, value in dados.items():
-
-            # NÃO SUBSTITUI SE VALUE ESTIVER VAZIO / NONE / ""
-            if value in [None, "", " ", "null"]:
-                continue
-
-            if is_base64_image(value):
-                continue
-
-            placeholder = f"{{{{{key}}}}}"
-
-            if placeholder in paragraph.text:
-                paragraph.text = paragraph.text.replace(placeholder, str(value))
-                paragraph.style.font.size = Pt(10)
-                for run in paragraph.runs:
-                    run.font.size = Pt(10)
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for key, value in dados.items():
-
-                        if value in [None, "", " ", "null"]:
-                            continue
-
-                        if is_base64_image(value):
-                            continue
-
-                        placeholder = f"{{{{{key}}}}}"
-
-                        if placeholder in paragraph.text:
-                            paragraph.text = paragraph.text.replace(placeholder, str(value))
-                            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                            for run in paragraph.runs:
-                                run.font.size = Pt(10)
-
-
-
-# ======================================
-# CABEÇALHO / RODAPÉ
-# ======================================
-def substituir_textos_em_cabecalho_rodape(doc: Document, dados: dict):
-    for section in doc.sections:
-        for area in [section.header, section.footer]:
-
-            for paragraph in area.paragraphs:
-                for key, value in dados.items():
-                    if is_base64_image(value):
-                        continue
-
-                    placeholder = f"{{{{{key}}}}}"
-
-                    if placeholder in paragraph.text:
-                        paragraph.text = paragraph.text.replace(placeholder, str(value))
-                        paragraph.style.font.size = Pt(10)
-                        for run in paragraph.runs:
-                            run.font.size = Pt(10)
-
-            for table in area.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            for key, value in dados.items():
-                                if is_base64_image(value):
-                                    continue
-
-                                placeholder = f"{{{{{key}}}}}"
-
-                                if placeholder in paragraph.text:
-                                    paragraph.text = paragraph.text.replace(placeholder, str(value))
-                                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                    for run in paragraph.runs:
-                                        run.font.size = Pt(10)
-
-
-# ======================================
-# SUBSTITUIÇÃO DE IMAGENS
-# ======================================
-def substituir_imagens_no_documento(doc: Document, dados: dict):
-    for paragraph in doc.paragraphs:
-        for key, value in dados.items():
-
-            # Se não houver imagem, NÃO substitui e NÃO remove o placeholder
-            if not value or value in ["", " ", None, "null"]:
-                continue
-
-            placeholder = f"{{{{{key}}}}}"
-
-            # Só substitui se o valor realmente for uma imagem base64
-            if placeholder in paragraph.text and is_base64_image(value):
-                clear_paragraph(paragraph)
-                run = paragraph.add_run()
-                run.add_picture(decode_base64_image(value), height=Cm(10))
-
-    # Agora nas tabelas
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for key, value in dados.items():
-
-                        # Se não houver imagem válida, pula
-                        if not value or value in ["", " ", None, "null"]:
-                            continue
+def resolver_incremental(chave: str, mapa: dict, imagens: dict) -> tuple[str, dict]:
+    """
+    Resolve as pendências do arquivo `chave` só nas partes apontadas pelo
+    mapa, copiando o resto do pacote sem recompactar. Devolve a chave do
+    novo arquivo e o mapa do que continua pendente.
+    """
+    with abrir_relatorio(chave) as origem, tempfile.TemporaryFile() as destino:
+        restante = resolver_pendencias_pacote(origem, destino, mapa, imagens)
+        with etapa("gravar_arquivo"):
+            return gravar_relatorio(destino, base_de(chave)), restante
+
+
+def gravar_relatorio_modelo(conteudo: bytes, modelo_id, atualizado_em, documento) -> str:
+    # com SYNTHETIS_STORAGE_DELTA, guarda só o que difere da versão do modelo
+    return gravar_relatorio(conteudo, base_do_modelo(modelo_id, atualizado_em, documento))
+
+
+def remover_arquivo_antigo(chave: str):
+    # o novo arquivo já está gravado e referenciado no banco; se a remoção
+    # falhar (ex.: arquivo aberto no Windows), só fica um órfão no disco
+    try:
+        armazenamento.remover(chave)
+    except (ArquivoNaoEncontrado, OSError):
+        print(traceback.format_exc())
 
-                        placeholder = f"{{{{{key}}}}}"
 
-                        if placeholder in paragraph.text and is_base64_image(value):
-                            clear_paragraph(paragraph)
-                            run = paragraph.add_run()
-                            run.add_picture(decode_base64_image(value), height=Cm(10))
+def persistir_relatorio(relatorio: Relatorio, conteudo: bytes, modelo_id, atualizado_em, documento):
+    """
+    Grava o arquivo e insere o relatório numa sessão própria (entrega=stream:
+    roda enquanto a resposta já está sendo enviada). Se o commit falhar, o
+    arquivo gravado é removido para não virar órfão.
+    """
+    with etapa("gravar_arquivo"):
+        relatorio.caminho_arquivo = gravar_relatorio_modelo(conteudo, modelo_id, atualizado_em, documento)
 
+    sessao = SessionLocal()
+    try:
+        sessao.add(relatorio)
+        with etapa("commit"):
+            sessao.commit()
+    except Exception:
+        sessao.rollback()
+        remover_arquivo_antigo(relatorio.caminho_arquivo)
+        raise
+    finally:
+        sessao.close()
 
 
-# ======================================
-# INSERIR PENDÊNCIAS
-# ======================================
-def inserir_pendencias_no_documento(doc: Document, pendencias: list[dict], chavePendencia: str):
-    placeholder = f"{{{{{chavePendencia}}}}}"
+async def aguardar_persistencia(tarefa: asyncio.Future):
+    # o cliente já recebeu o arquivo: uma falha aqui só pode ser registrada
+    try:
+        await tarefa
+    except Exception:
+        print(traceback.format_exc())
 
-    def process_paragraph(paragraph):
-        if placeholder in paragraph.text:
-            clear_paragraph(paragraph)
 
-            if not pendencias:
-                paragraph.add_run("Nenhuma pendência relatada.\n")
-                return True
+class BufferZip:
+    """
+    Destino sem seek para o ZipFile: guarda o que foi escrito até ser
+    drenado, permitindo enviar o ZIP aos poucos enquanto é montado.
+    """
 
-            for idx, pendencia in enumerate(pendencias, 1):
-                titulo = pendencia.get("titulo", "Sem título")
-                descricao = pendencia.get("descriçao") or pendencia.get("descricao") or ""
-                imagem = pendencia.get("imagem")
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
 
-                # título
-                par_titulo = paragraph.insert_paragraph_before(f"{idx}. {titulo}")
-                par_titulo.runs[0].bold = True
-                par_titulo.runs[0].font.size = Pt(10)
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
 
-                # descrição
-                if descricao:
-                    par_desc = paragraph.insert_paragraph_before(descricao)
-                    par_desc.runs[0].font.size = Pt(10)
+    def tell(self) -> int:
+        return self._posicao
 
-                # imagem
-                if imagem and is_base64_image(imagem):
-                    par_img = paragraph.insert_paragraph_before()
-                    run_img = par_img.add_run()
-                    run_img.add_picture(decode_base64_image(imagem), width=Cm(10))
+    def flush(self):
+        pass
 
-            return True
+    def drenar(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
 
-        return False
 
-    # busca no corpo
-    for paragraph in doc.paragraphs:
-        if process_paragraph(paragraph):
-            return
+# ============================
+#  DEFINIR NOME DO ARQUIVO
+# ============================
+def definir_nome_arquivo(modelo: Modelo, nome_relatorio, equipamento: str) -> str:
+    if nome_relatorio and str(nome_relatorio).strip() != "":
+        return nome_relatorio.strip()
 
-    # busca em tabelas
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    if process_paragraph(paragraph):
-                        return
+    return f"{modelo.titulo.strip()} {equipamento}".strip()
 
 
 # ======================================
 # ROTA PRINCIPAL (armazenando em DISCO)
 # ======================================
 @router.post("/gerar-doc") 
-def gerar_documento(payload: dict, db: Session = Depends(get_model_db)):
+async def gerar_documento(
+    payload: dict,
+    entrega: str = Query("armazenar", pattern=ENTREGAS),
+    db: Session = Depends(get_db)
+):
+    return await _gerar_documento(payload, db, entrega=entrega)
+
+
+async def _gerar_documento(payload: dict, db: Session, anexos: dict = None, entrega: str = "armazenar"):
     try:
         import json
 
         modelo_id = payload.get("modelo_id")
+        anotar(modelo_id=modelo_id)
         dados = payload.get("dados", {})
         pendencias = payload.get("pendencias", [])
         chavePendencia = payload.get("chavePendencia")
@@ -255,118 +187,393 @@ def gerar_documento(payload: dict, db: Session = Depends(get_model_db)):
         # Salvar como JSON string
         itens_pendentes = json.dumps(itens_pendentes_raw)
 
-        modelo = db.query(Modelo).filter(Modelo.id == modelo_id).first()
-        if not modelo or not modelo.documento_modelo:
+        with etapa("carregar_modelo"):
+            modelo, documento = await run_in_threadpool(carregar_modelo, db, modelo_id)
+        if not modelo or not documento:
             raise HTTPException(status_code=404, detail="Modelo não encontrado ou sem documento")
 
-        doc = Document(BytesIO(modelo.documento_modelo))
-
-        substituir_textos_no_documento(doc, dados)
-        substituir_textos_em_cabecalho_rodape(doc, dados)
-        substituir_imagens_no_documento(doc, dados)
-
-        if chavePendencia:
-            inserir_pendencias_no_documento(doc, pendencias, chavePendencia)
+        # Com manifesto, só vai para o pool o que o modelo realmente usa
+        manifesto = carregar_manifesto(modelo.manifesto_placeholders)
+        dados = filtrar_dados(manifesto, dados)
+        if manifesto is not None and chavePendencia not in manifesto.get("placeholders", {}):
+            chavePendencia = None
 
-        # ============================
-        #  DEFINIR NOME DO ARQUIVO
-        # ============================
-
-        if nome_relatorio and str(nome_relatorio).strip() != "":
-            nome_arquivo_original = nome_relatorio.strip()
-        else:
-            nome_arquivo_original = f"{modelo.titulo.strip()} {equipamento}".strip()
-
-        # Sempre gerar nome físico temporário
-        _, ext = os.path.splitext("arquivo.docx")
-        nome_arquivo_fisico = f"{uuid4()}{ext}"
-        caminho_final = os.path.join(BASE_DIR, nome_arquivo_fisico)
+        # Renderização (CPU) no pool de processos
+        conteudo, mapa_pendentes = await executor_renderizacao.renderizar(
+            modelo.id, modelo.atualizado_em, documento,
+            dados, pendencias, chavePendencia, anexos
+        )
+        metricas.relatorio_bytes.observar(len(conteudo))
 
-        doc.save(caminho_final)
+        nome_arquivo_original = definir_nome_arquivo(modelo, nome_relatorio, equipamento)
 
         novo = Relatorio(
             modelo=modelo.titulo,
             emissor=responsavel,
             equipe=modelo.equipe,
             nome_arquivo=nome_arquivo_original,  
-            caminho_arquivo=caminho_final,
-            item_pendente=itens_pendentes
+            item_pendente=itens_pendentes,
+            mapa_pendentes=json.dumps(mapa_pendentes, ensure_ascii=False)
         )
 
+        if entrega == "stream":
+            # os bytes que voltaram do pool vão direto para o cliente; gravar
+            # e inserir o registro corre em paralelo com o envio
+            persistencia = asyncio.ensure_future(run_in_threadpool(
+                persistir_relatorio, novo, conteudo, modelo.id, modelo.atualizado_em, documento
+            ))
+
+            nome_download = nome_arquivo_original
+            if not nome_download.lower().endswith(".docx"):
+                nome_download += ".docx"
+
+            return Response(
+                content=conteudo,
+                media_type=TIPO_DOCX,
+                headers={
+                    "Content-Disposition": content_disposition(nome_download)
+                },
+                background=BackgroundTask(aguardar_persistencia, persistencia)
+            )
+
+        # Nome físico é a chave gerada pelo armazenamento
+        with etapa("gravar_arquivo"):
+            novo.caminho_arquivo = await run_in_threadpool(
+                gravar_relatorio_modelo, conteudo, modelo.id, modelo.atualizado_em, documento
+            )
+
         db.add(novo)
-        db.commit()
+        with etapa("commit"):
+            await run_in_threadpool(db.commit)
 
         return {"status": "ok", "mensagem": "Relatório armazenado no disco com sucesso"}
 
+    except FilaRenderizacaoCheia:
+        raise HTTPException(status_code=503, detail="Servidor ocupado gerando relatórios, tente novamente.")
+
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Erro ao gerar documento: {str(e)}")
 
 
 
+# ======================================
+# VARIANTE MULTIPART (imagens como arquivos)
+# ======================================
+@router.post("/gerar-doc-multipart")
+async def gerar_documento_multipart(
+    request: Request,
+    entrega: str = Query("armazenar", pattern=ENTREGAS),
+    db: Session = Depends(get_db)
+):
+    """
+    Mesmo contrato do /gerar-doc, mas em multipart/form-data:
+
+    - campo "payload": o JSON de sempre;
+    - demais campos: arquivos de imagem, referenciados no JSON (em
+      `dados` ou em `pendencias[].imagem`) como "arquivo:<nome do campo>".
+
+    Os arquivos chegam como UploadFile (em disco acima do limite de
+    memória do parser) e vão para o renderizador sem passar por base64.
+    """
+    import json
+
+    form = await request.form(max_files=UPLOAD_MAX_FILES)
+    try:
+        if "payload" not in form:
+            raise HTTPException(status_code=400, detail="Campo 'payload' é obrigatório.")
+
+        try:
+            payload = json.loads(form["payload"])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Campo 'payload' deve ser um JSON válido.")
+
+        arquivos = {
+            nome: valor for nome, valor in form.multi_items()
+            if isinstance(valor, StarletteUploadFile)
+        }
+
+        referencias = [
+            *payload.get("dados", {}).values(),
+            *(p.get("imagem") for p in payload.get("pendencias", []) if isinstance(p, dict)),
+        ]
+        faltando = sorted({
+            nome for nome in map(referencia_arquivo, referencias)
+            if nome is not None and nome not in arquivos
+        })
+        if faltando:
+            raise HTTPException(status_code=400, detail=f"Arquivos não enviados: {', '.join(faltando)}")
+
+        anexos = {nome: await arquivo.read() for nome, arquivo in arquivos.items()}
+
+    finally:
+        await form.close()
+
+    return await _gerar_documento(payload, db, anexos, entrega)
+
+
+# ======================================
+# GERAÇÃO EM LOTE (mesmo modelo)
+# ======================================
+@router.post("/gerar-docs-lote")
+async def gerar_documentos_lote(payload: dict, db: Session = Depends(get_db)):
+    """
+    Gera vários relatórios de um mesmo modelo numa chamada só.
+
+    payload = {
+        "modelo_id": 1,
+        "responsavel": "...",
+        "chavePendencia": "...",      # padrão para os itens
+        "zip": false,                 # true -> devolve um ZIP em streaming
+        "relatorios": [
+            {"dados": {...}, "pendencias": [...], "equipamento": "...",
+             "nome_relatorio": "...", "itens_pendentes": [...]},
+            ...
+        ]
+    }
+    """
+    import json
+
+    modelo_id = payload.get("modelo_id")
+    anotar(modelo_id=modelo_id, itens=len(payload.get("relatorios") or []))
+    responsavel = payload.get("responsavel")
+    chave_padrao = payload.get("chavePendencia")
+    itens = payload.get("relatorios") or []
+
+    if not itens:
+        raise HTTPException(status_code=400, detail="Nenhum relatório informado.")
+
+    with etapa("carregar_modelo"):
+        modelo, documento = await run_in_threadpool(carregar_modelo, db, modelo_id)
+    if not modelo or not documento:
+        raise HTTPException(status_code=404, detail="Modelo não encontrado ou sem documento")
+
+    manifesto = carregar_manifesto(modelo.manifesto_placeholders)
+
+    # não ocupa mais processos do que o pool tem; o resto espera aqui
+    vagas = asyncio.Semaphore(executor_renderizacao.workers)
+
+    # gravações dos arquivos do lote: se o lote não chegar ao banco (erro
+    # em outro item, falha no commit, cliente do ZIP desconectou), os
+    # arquivos já gravados são removidos
+    gravacoes = []
+
+    def _remover_gravado(gravacao: asyncio.Future):
+        if gravacao.cancelled() or gravacao.exception() is not None:
+            return
+        asyncio.get_running_loop().run_in_executor(None, remover_arquivo_antigo, gravacao.result())
+
+    def descartar_gravados():
+        # sem await: roda também quando a resposta em streaming é cancelada;
+        # gravações ainda em andamento são removidas quando terminarem
+        for gravacao in gravacoes:
+            gravacao.add_done_callback(_remover_gravado)
+
+    async def renderizar_item(indice: int, item: dict):
+        chave_pendencia = item.get("chavePendencia", chave_padrao)
+        if manifesto is not None and chave_pendencia not in manifesto.get("placeholders", {}):
+            chave_pendencia = None
+
+        async with vagas:
+            conteudo, mapa_pendentes = await executor_renderizacao.renderizar(
+                modelo.id, modelo.atualizado_em, documento,
+                filtrar_dados(manifesto, item.get("dados", {})), item.get("pendencias", []),
+                chave_pendencia
+            )
+        metricas.relatorio_bytes.observar(len(conteudo))
+
+        nome_arquivo_original = definir_nome_arquivo(
+            modelo, item.get("nome_relatorio"), str(item.get("equipamento", "")).strip()
+        )
+        with etapa("gravar_arquivo"):
+            gravacao = asyncio.ensure_future(run_in_threadpool(
+                gravar_relatorio_modelo, conteudo, modelo.id, modelo.atualizado_em, documento
+            ))
+            gravacoes.append(gravacao)
+            # a thread não para com o cancelamento do item: a gravação segue
+            # até o fim e o arquivo é removido por descartar_gravados
+            chave_arquivo = await asyncio.shield(gravacao)
+
+        relatorio = Relatorio(
+            modelo=modelo.titulo,
+            emissor=responsavel,
+            equipe=modelo.equipe,
+            nome_arquivo=nome_arquivo_original,
+            caminho_arquivo=chave_arquivo,
+            item_pendente=json.dumps(item.get("itens_pendentes")),
+            mapa_pendentes=json.dumps(mapa_pendentes, ensure_ascii=False)
+        )
+        return indice, relatorio, conteudo
+
+    def gravar_lote(sessao: Session, relatorios: list) -> list[int]:
+        sessao.add_all(relatorios)
+        sessao.flush()
+        # lidos antes do commit: depois dele (expire_on_commit) cada r.id
+        # seria um SELECT
+        ids = [r.id for r in relatorios]
+        sessao.commit()
+        return ids
+
+    async def salvar_relatorios(sessao: Session, relatorios: list) -> list[int]:
+        # um único commit para o lote inteiro
+        with etapa("commit"):
+            return await run_in_threadpool(gravar_lote, sessao, relatorios)
+
+    tarefas = [asyncio.ensure_future(renderizar_item(i, item)) for i, item in enumerate(itens)]
+
+    if not payload.get("zip"):
+        salvos = False
+        try:
+            resultados = await asyncio.gather(*tarefas)
+            relatorios = [relatorio for _, relatorio, _ in sorted(resultados, key=lambda r: r[0])]
+            ids = await salvar_relatorios(db, relatorios)
+            salvos = True
+        except FilaRenderizacaoCheia:
+            raise HTTPException(status_code=503, detail="Servidor ocupado gerando relatórios, tente novamente.")
+        except Exception as e:
+            logger.exception("Erro ao gerar lote do modelo %s", modelo_id)
+            raise HTTPException(status_code=500, detail=f"Erro ao gerar documentos: {str(e)}")
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            if not salvos:
+                descartar_gravados()
+
+        return {
+            "status": "ok",
+            "mensagem": f"{len(relatorios)} relatórios armazenados no disco com sucesso",
+            "ids": ids
+        }
+
+    async def enviar_zip():
+        buffer = BufferZip()
+        resultados = []
+        nomes = set()
+        salvos = False
+
+        try:
+            with zipfile.ZipFile(buffer, "w") as arquivo_zip:
+                # cada relatório entra no ZIP assim que fica pronto
+                for pronto in asyncio.as_completed(tarefas):
+                    indice, relatorio, conteudo = await pronto
+                    resultados.append((indice, relatorio))
+
+                    nome = relatorio.nome_arquivo
+                    if not nome.lower().endswith(".docx"):
+                        nome += ".docx"
+                    base, n = nome[:-5], 2
+                    while nome in nomes:
+                        nome, n = f"{base} ({n}).docx", n + 1
+                    nomes.add(nome)
+
+                    # .docx já é compactado: só armazena
+                    arquivo_zip.writestr(nome, conteudo, compress_type=zipfile.ZIP_STORED)
+                    yield buffer.drenar()
+
+                # sessão própria: o streaming pode continuar depois que a
+                # dependência get_db já fechou a dela
+                sessao = SessionLocal()
+                try:
+                    await salvar_relatorios(sessao, [r for _, r in sorted(resultados, key=lambda r: r[0])])
+                    salvos = True
+                finally:
+                    sessao.close()
+
+            yield buffer.drenar()
+
+        except Exception:
+            logger.exception("Erro ao gerar lote (ZIP) do modelo %s", modelo_id)
+            raise
+
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            if not salvos:
+                descartar_gravados()
+
+    nome_zip = f"{modelo.titulo.strip()}.zip"
+
+    return StreamingResponse(
+        enviar_zip(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=\"{nome_zip}\""
+        }
+    )
+
+
+
 @router.post("/resolver-itens-pendentes")
-def resolver_pendencias(payload: dict, db: Session = Depends(get_model_db)):
+async def resolver_pendencias(payload: dict, db: Session = Depends(get_db)):
     try:
         relatorio_id = payload.get("relatorio_id")
         imagens = payload.get("imagens", {})
+        anotar(relatorio_id=relatorio_id, imagens=len(imagens))
 
         if not relatorio_id:
             raise HTTPException(status_code=400, detail="relatorio_id é obrigatório.")
 
-        relatorio = db.query(Relatorio).filter(Relatorio.id == relatorio_id).first()
+        relatorio = await run_in_threadpool(
+            lambda: db.query(Relatorio).filter(Relatorio.id == relatorio_id).first()
+        )
         if not relatorio:
             raise HTTPException(status_code=404, detail="Relatório não encontrado.")
 
-        if not os.path.exists(relatorio.caminho_arquivo):
+        chave_antiga = relatorio.caminho_arquivo
+        mapa = json.loads(relatorio.mapa_pendentes) if relatorio.mapa_pendentes else None
+        chave_arquivo = None
+
+        try:
+            if mapa is not None:
+                # só as partes com placeholder pendente são lidas e regravadas
+                try:
+                    chave_arquivo, mapa = await run_in_threadpool(
+                        resolver_incremental, chave_antiga, mapa, imagens
+                    )
+                except MapaDesatualizado as e:
+                    logger.warning(
+                        "Mapa de pendências do relatório %s desatualizado (%s); reabrindo o documento inteiro",
+                        relatorio_id, e
+                    )
+
+            if chave_arquivo is None:
+                # relatório antigo (sem mapa): reabre o documento inteiro
+                with etapa("ler_arquivo"):
+                    documento = await run_in_threadpool(ler_relatorio, chave_antiga)
+                conteudo, mapa = await executor_renderizacao.resolver(documento, imagens)
+                with etapa("gravar_arquivo"):
+                    chave_arquivo = await run_in_threadpool(
+                        lambda: gravar_relatorio(conteudo, base_de(chave_antiga))
+                    )
+
+        except ArquivoNaoEncontrado:
             raise HTTPException(status_code=404, detail="Arquivo do relatório não encontrado.")
 
-        doc = Document(relatorio.caminho_arquivo)
-
-        def substituir_imagem_placeholder(paragraph, chave, base64img):
-            placeholder = f"{{{{{chave}}}}}"
-            if placeholder in paragraph.text and is_base64_image(base64img):
-                clear_paragraph(paragraph)
-                run = paragraph.add_run()
-                run.add_picture(decode_base64_image(base64img), height=Cm(10))
-                return True
-            return False
-
-        for paragraph in doc.paragraphs:
-         for chave, img in imagens.items():
-             if substituir_imagem_placeholder(paragraph, chave, img):
-                 break  # <- interrompe para não tentar substituir de novo
-
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        for chave, img in imagens.items():
-                            if substituir_imagem_placeholder(paragraph, chave, img):
-                                break
-
-        nome_final = f"{uuid4()}"
-        caminho_final = os.path.join(BASE_DIR, nome_final)
-
-        doc.save(caminho_final)
-
         # --- Atualizações no banco ---
-        relatorio.caminho_arquivo = caminho_final
+        relatorio.caminho_arquivo = chave_arquivo
+        relatorio.mapa_pendentes = json.dumps(mapa, ensure_ascii=False)
 
         # Zerar pendências com lista vazia
         relatorio.item_pendente = None
 
         # Atualizar data com horário local (UTC-4)
-        relatorio.emitido_em = datetime.now(FUSO_BR)
+        relatorio.emitido_em = agora_emissao()
+
+        with etapa("commit"):
+            await run_in_threadpool(db.commit)
 
-        db.commit()
+        # a versão anterior não é mais referenciada
+        await run_in_threadpool(remover_arquivo_antigo, chave_antiga)
 
         return {
             "status": "ok",
             "mensagem": "Pendências resolvidas e relatório atualizado.",
-            "novo_arquivo": caminho_final
+            "novo_arquivo": chave_arquivo
         }
 
+    except FilaRenderizacaoCheia:
+        raise HTTPException(status_code=503, detail="Servidor ocupado gerando relatórios, tente novamente.")
+
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Erro ao resolver pendências: {str(e)}")
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from core.security import get_current_user
+from services import perfilador
+
+
+router = APIRouter(prefix="/perfis", tags=["Perfis"])
+
+
+def usuario_admin(current_user: str = Depends(get_current_user)) -> str:
+    if not perfilador.pode_perfilar(current_user):
+        raise HTTPException(status_code=403, detail="Acesso negado")
+    return current_user
+
+
+def obter_perfil(perfil_id: int) -> perfilador.Perfil:
+    perfil = perfilador.perfis.obter(perfil_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado (só os mais recentes ficam guardados)")
+    return perfil
+
+
+# --------------------------------------------------------
+# LISTA PERFIS GUARDADOS (mais recente primeiro)
+# --------------------------------------------------------
+@router.get("")
+def listar_perfis(current_user: str = Depends(usuario_admin)):
+    return [perfil.resumo() for perfil in perfilador.perfis.listar()]
+
+
+@router.get("/{perfil_id}")
+def resumo_perfil(
+    perfil_id: int,
+    limite: int = Query(40, ge=1, le=500),
+    ordem: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$"),
+    current_user: str = Depends(usuario_admin)
+):
+    """
+    Metadados e, quando há pstats, as `limite` funções mais caras em texto.
+    """
+    perfil = obter_perfil(perfil_id)
+    return {**perfil.resumo(), "pstats_texto": perfil.texto_pstats(limite, ordem)}
+
+
+# --------------------------------------------------------
+# DOWNLOADS (pstats / pilhas para flamegraph)
+# --------------------------------------------------------
+@router.get("/{perfil_id}/pstats")
+def baixar_pstats(perfil_id: int, current_user: str = Depends(usuario_admin)):
+    conteudo = obter_perfil(perfil_id).pstats_bytes()
+    if conteudo is None:
+        raise HTTPException(status_code=404, detail="Perfil automático não tem pstats, só pilhas")
+
+    return Response(
+        content=conteudo,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="perfil-{perfil_id}.pstats"'}
+    )
+
+
+@router.get("/{perfil_id}/pilhas")
+def baixar_pilhas(perfil_id: int, current_user: str = Depends(usuario_admin)):
+    """
+    Formato collapsed (flamegraph.pl, speedscope, inferno).
+    """
+    return Response(
+        content=obter_perfil(perfil_id).pilhas_collapsed(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="perfil-{perfil_id}.folded"'}
+    )
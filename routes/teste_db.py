@@ -1,16 +1,9 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import get_db
 
 router = APIRouter(prefix="/test", tags=["Test"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/db")
 def test_db_connection(db: Session = Depends(get_db)):
     try:
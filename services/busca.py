@@ -0,0 +1,285 @@
+"""
+Busca textual de relatórios (/app/relatorios/busca) por nome do arquivo
+(que traz o equipamento), título do modelo e texto dos itens pendentes.
+
+O texto de cada relatório é normalizado (minúsculo, sem acento) e indexado
+na mesma transação que grava o Relatorio, pelos eventos do mapper:
+
+- MySQL: relatorios_busca.texto com índice FULLTEXT, consultado com
+  MATCH ... AGAINST em modo booleano (`+termo*` para cada termo). Termos
+  que o InnoDB não indexa (mais curtos que innodb_ft_min_token_size ou
+  stopwords) deixariam o MATCH sem nenhuma linha: esses viram LIKE sobre o
+  texto já filtrado pelos outros;
+- SQLite: índice invertido relatorios_busca_termos (emissor, termo,
+  relatorio_id, frequência); o prefixo de cada termo é um range na chave
+  primária e a relevância é frequência x IDF, com peso dobrado para o
+  termo exato.
+
+Todos os termos precisam aparecer (como palavra ou prefixo de palavra).
+Relatórios gravados antes do índice existir entram com:
+
+    python -m services.busca               # só os que faltam
+    python -m services.busca --tudo        # reindexa todos
+"""
+import argparse
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import event, inspect, select, delete, insert, func, case, literal, union_all, distinct
+from sqlalchemy.dialects.mysql import match
+
+from core.config import SEARCH_FT_MIN_TOKEN
+from database import engine, SessionLocal
+from models.busca import DocumentoBusca, TermoBusca
+from models.relatorio import Relatorio
+
+FULLTEXT = engine.dialect.name == "mysql"
+
+# relatorios_busca_termos só serve sem FULLTEXT; create_all pula no MySQL
+TABELAS_SEM_USO = (TermoBusca.__table__,) if FULLTEXT else ()
+
+TERMO_MIN = 2
+TERMO_MAX = 64  # tamanho da coluna termo
+MAX_TERMOS_CONSULTA = 8
+TEXTO_MAX = 60000  # cabe no TEXT do MySQL com folga para UTF-8 de 1 byte
+
+# campos do Relatorio que entram no índice
+CAMPOS = ("emissor", "nome_arquivo", "modelo", "item_pendente")
+
+# lista padrão do InnoDB (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD)
+STOPWORDS_INNODB = frozenset((
+    "a about an are as at be by com de en for from how i in is it la of on or "
+    "that the this to was what when where who will with und www"
+).split())
+
+_PALAVRA_RE = re.compile(r"\w+")
+
+
+# ======================================
+# TEXTO / TERMOS
+# ======================================
+def normalizar(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def termos(texto: str) -> list[str]:
+    """Palavras do texto normalizado, na ordem, com o tamanho da coluna."""
+    return [p[:TERMO_MAX] for p in _PALAVRA_RE.findall(normalizar(texto)) if len(p) >= TERMO_MIN]
+
+
+def _textos_json(valor):
+    # só os valores: as chaves dos itens se repetem em todo relatório
+    if isinstance(valor, str):
+        # imagens em base64/data URL não são texto pesquisável
+        if valor.startswith("data:") or (len(valor) > 200 and " " not in valor):
+            return
+        yield valor
+    elif isinstance(valor, dict):
+        for v in valor.values():
+            yield from _textos_json(v)
+    elif isinstance(valor, list):
+        for v in valor:
+            yield from _textos_json(v)
+    elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        yield str(valor)
+
+
+def texto_relatorio(nome_arquivo: str, modelo: str, item_pendente: str | None) -> str:
+    partes = [nome_arquivo or "", modelo or ""]
+    if item_pendente:
+        try:
+            partes.extend(_textos_json(json.loads(item_pendente)))
+        except ValueError:
+            partes.append(item_pendente)
+    return " ".join(termos(" ".join(partes)))[:TEXTO_MAX]
+
+
+# ======================================
+# INDEXAÇÃO (eventos do Relatorio)
+# ======================================
+def remover(conexao, relatorio_id: int):
+    conexao.execute(delete(DocumentoBusca).where(DocumentoBusca.relatorio_id == relatorio_id))
+    if not FULLTEXT:
+        conexao.execute(delete(TermoBusca).where(TermoBusca.relatorio_id == relatorio_id))
+
+
+def indexar(conexao, relatorio: Relatorio, novo: bool = False):
+    """(Re)indexa `relatorio` usando a conexão da transação corrente."""
+    if not novo:
+        remover(conexao, relatorio.id)
+
+    texto = texto_relatorio(relatorio.nome_arquivo, relatorio.modelo, relatorio.item_pendente)
+    conexao.execute(insert(DocumentoBusca).values(relatorio_id=relatorio.id, texto=texto))
+
+    if not FULLTEXT and texto:
+        conexao.execute(insert(TermoBusca), [
+            {"emissor": relatorio.emissor, "termo": termo, "relatorio_id": relatorio.id, "frequencia": n}
+            for termo, n in Counter(texto.split()).items()
+        ])
+
+
+@event.listens_for(Relatorio, "after_insert")
+def _apos_inserir(mapper, conexao, relatorio):
+    indexar(conexao, relatorio, novo=True)
+
+
+@event.listens_for(Relatorio, "after_update")
+def _apos_atualizar(mapper, conexao, relatorio):
+    estado = inspect(relatorio)
+    if any(estado.attrs[campo].history.has_changes() for campo in CAMPOS):
+        indexar(conexao, relatorio)
+
+
+@event.listens_for(Relatorio, "after_delete")
+def _apos_remover(mapper, conexao, relatorio):
+    remover(conexao, relatorio.id)
+
+
+def reindexar(tudo: bool = False, lote: int = 1000, criar_sessao=SessionLocal) -> int:
+    """Indexa os relatórios que ainda não estão no índice (ou todos). Devolve quantos."""
+    total = 0
+    ultimo_id = 0
+    sessao = criar_sessao()
+    try:
+        while True:
+            consulta = select(Relatorio).where(Relatorio.id > ultimo_id)
+            if not tudo:
+                consulta = consulta.where(~select(DocumentoBusca.relatorio_id).where(
+                    DocumentoBusca.relatorio_id == Relatorio.id
+                ).exists())
+            relatorios = sessao.execute(consulta.order_by(Relatorio.id).limit(lote)).scalars().all()
+            if not relatorios:
+                return total
+
+            conexao = sessao.connection()
+            for relatorio in relatorios:
+                indexar(conexao, relatorio)
+            ultimo_id = relatorios[-1].id
+            sessao.commit()
+            sessao.expunge_all()
+
+            total += len(relatorios)
+    finally:
+        sessao.close()
+
+
+# ======================================
+# CONSULTA
+# ======================================
+def termos_consulta(q: str) -> list[str]:
+    return list(dict.fromkeys(termos(q)))[:MAX_TERMOS_CONSULTA]
+
+
+def _fim_prefixo(termo: str) -> str:
+    # menor string maior que todas as que começam com `termo`
+    return termo[:-1] + chr(ord(termo[-1]) + 1)
+
+
+def indexado_fulltext(termo: str) -> bool:
+    """Se o InnoDB guarda `termo` (e os que começam com ele) no índice FULLTEXT."""
+    return len(termo) >= SEARCH_FT_MIN_TOKEN and termo not in STOPWORDS_INNODB
+
+
+async def _relevancia_termos(db, emissor: str, lista: list[str]):
+    """Subconsulta (relatorio_id, relevancia) dos relatórios com todos os termos (SQLite)."""
+    prefixos = [
+        (TermoBusca.emissor == emissor) & (TermoBusca.termo >= termo) & (TermoBusca.termo < _fim_prefixo(termo))
+        for termo in lista
+    ]
+
+    # usa o índice (emissor, equipe, emitido_em) de relatorios
+    total = await db.scalar(select(func.count()).select_from(Relatorio).where(Relatorio.emissor == emissor))
+    partes = []
+    for n, (termo, filtro) in enumerate(zip(lista, prefixos)):
+        ocorrencias = await db.scalar(select(func.count(distinct(TermoBusca.relatorio_id))).where(filtro))
+        if not ocorrencias:
+            return None
+        idf = math.log(1 + total / ocorrencias)
+        partes.append(
+            select(
+                TermoBusca.relatorio_id,
+                literal(n).label("n"),
+                (TermoBusca.frequencia * case((TermoBusca.termo == termo, 2.0), else_=1.0) * idf).label("pontos"),
+            ).where(filtro)
+        )
+
+    ocorrencias = union_all(*partes).subquery()
+    return (
+        select(ocorrencias.c.relatorio_id, func.sum(ocorrencias.c.pontos).label("relevancia"))
+        .group_by(ocorrencias.c.relatorio_id)
+        .having(func.count(distinct(ocorrencias.c.n)) == len(lista))
+        .subquery()
+    )
+
+
+def _consulta_fulltext(lista: list[str]):
+    """(consulta, relevância) do MySQL: MATCH nos termos indexados, LIKE nos outros."""
+    indexados = [t for t in lista if indexado_fulltext(t)]
+    # o texto é uma palavra normalizada por espaço: " termo" acha o começo de uma palavra
+    palavras = literal(" ") + DocumentoBusca.texto
+    filtros = [palavras.contains(f" {t}", autoescape=True) for t in lista if not indexado_fulltext(t)]
+
+    if indexados:
+        relevancia = match(DocumentoBusca.texto, against=" ".join(f"+{t}*" for t in indexados)).in_boolean_mode()
+        filtros.insert(0, relevancia > 0)
+    else:
+        relevancia = literal(1.0)
+
+    consulta = (
+        select(Relatorio, relevancia.label("relevancia"))
+        .join(DocumentoBusca, DocumentoBusca.relatorio_id == Relatorio.id)
+        .where(*filtros)
+    )
+    return consulta, relevancia
+
+
+async def buscar(db, emissor: str, lista: list[str], equipe=None, desde=None, ate=None,
+                 limite: int = 50, deslocamento: int = 0) -> list[tuple[Relatorio, float]]:
+    """
+    [(Relatorio, relevância)] do emissor com todos os termos de `lista`
+    (de termos_consulta), do mais relevante para o menos; empates pelo
+    mais novo.
+    """
+    if FULLTEXT:
+        consulta, relevancia = _consulta_fulltext(lista)
+    else:
+        pontuados = await _relevancia_termos(db, emissor, lista)
+        if pontuados is None:
+            return []
+        relevancia = pontuados.c.relevancia
+        consulta = select(Relatorio, relevancia).join(pontuados, pontuados.c.relatorio_id == Relatorio.id)
+
+    consulta = consulta.where(Relatorio.emissor == emissor)
+
+    if equipe:
+        consulta = consulta.where(Relatorio.equipe == equipe)
+
+    if desde:
+        consulta = consulta.where(Relatorio.emitido_em >= desde)
+
+    if ate:
+        consulta = consulta.where(Relatorio.emitido_em <= ate)
+
+    linhas = (await db.execute(
+        consulta
+        .order_by(relevancia.desc(), Relatorio.emitido_em.desc(), Relatorio.id.desc())
+        .offset(deslocamento)
+        .limit(limite)
+    )).all()
+    return [(relatorio, float(pontos)) for relatorio, pontos in linhas]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexa relatórios para a busca textual.")
+    parser.add_argument("--tudo", action="store_true", help="reindexa todos, não só os que faltam")
+    args = parser.parse_args()
+
+    from database import Base
+    Base.metadata.create_all(bind=engine, tables=[
+        t for t in (DocumentoBusca.__table__, TermoBusca.__table__) if t not in TABELAS_SEM_USO
+    ])
+    print(f"{reindexar(tudo=args.tudo)} relatório(s) indexado(s)")
@@ -0,0 +1,213 @@
+"""
+Cache em disco dos .docx dos modelos, compartilhado por todos os processos
+(workers do uvicorn e processos de renderização) da máquina.
+
+Cada versão de modelo, (modelo_id, atualizado_em), vira um arquivo com nome
+derivado dessa chave: uma versão nunca muda de conteúdo, então não há
+invalidação, só despejo. O banco só é lido em caso de miss, com uma trava
+de arquivo para que processos concorrentes não busquem o mesmo BLOB ao
+mesmo tempo. A leitura é por mmap. O tamanho total é limitado
+(SYNTHETIS_TEMPLATE_BLOB_CACHE_MAX_BYTES), despejando os arquivos usados
+há mais tempo (mtime, renovado nos acertos).
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from core.config import TEMPLATE_BLOB_CACHE_DIR, TEMPLATE_BLOB_CACHE_MAX_BYTES
+from services import metricas
+
+# acertos só renovam o mtime (posição no LRU) se ele tiver mais que isso
+RENOVAR_APOS_SEGUNDOS = 60
+# temporários de gravações interrompidas
+TEMPORARIO_ABANDONADO_SEGUNDOS = 3600
+
+consultas = metricas.registro.registrar(metricas.Contador(
+    "synthetis_cache_blobs_modelo_total", "Consultas ao cache em disco dos .docx dos modelos.",
+    ("resultado",),
+))
+
+
+# ======================================
+# LEITURA MAPEADA
+# ======================================
+class ArquivoMapeado(mmap.mmap):
+    """mmap somente leitura que o zipfile aceita como arquivo (seekable só existe no 3.13+)."""
+
+    def seekable(self) -> bool:
+        return True
+
+
+def mapear_arquivo(caminho: str) -> ArquivoMapeado:
+    """
+    Mapeamento que continua válido mesmo se o arquivo for despejado depois
+    (no Linux; no Windows o despejo de um arquivo mapeado falha e fica para
+    a próxima vez). Fecha quando deixa de ser referenciado.
+    """
+    with open(caminho, "rb") as f:
+        return ArquivoMapeado(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+@contextmanager
+def mapear(caminho: str):
+    mapeado = mapear_arquivo(caminho)
+    try:
+        yield mapeado
+    finally:
+        mapeado.close()
+
+
+# ======================================
+# TRAVA ENTRE PROCESSOS
+# ======================================
+@contextmanager
+def _travado(caminho: str):
+    with open(caminho, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK desiste depois de ~10 s
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# ======================================
+# CACHE
+# ======================================
+class CacheBlobsModelo:
+
+    def __init__(self, raiz: str = TEMPLATE_BLOB_CACHE_DIR, limite_bytes: int = TEMPLATE_BLOB_CACHE_MAX_BYTES):
+        self.raiz = raiz
+        self.limite_bytes = limite_bytes
+
+    @property
+    def habilitado(self) -> bool:
+        return self.limite_bytes > 0
+
+    def _nome(self, modelo_id, atualizado_em) -> str:
+        versao = atualizado_em.isoformat() if hasattr(atualizado_em, "isoformat") else str(atualizado_em)
+        return hashlib.sha256(f"{modelo_id}:{versao}".encode()).hexdigest()[:40]
+
+    def caminho(self, modelo_id, atualizado_em) -> str:
+        nome = self._nome(modelo_id, atualizado_em)
+        return os.path.join(self.raiz, nome[:2], nome + ".docx")
+
+    def _trava(self, modelo_id, atualizado_em) -> str:
+        # 256 travas fixas (pelo prefixo do nome): o arquivo de trava nunca é apagado
+        pasta = os.path.join(self.raiz, "_travas")
+        os.makedirs(pasta, exist_ok=True)
+        return os.path.join(pasta, self._nome(modelo_id, atualizado_em)[:2] + ".lock")
+
+    @staticmethod
+    def _renovar(caminho: str) -> bool:
+        try:
+            modificado_em = os.stat(caminho).st_mtime
+        except FileNotFoundError:
+            return False
+
+        if time.time() - modificado_em > RENOVAR_APOS_SEGUNDOS:
+            try:
+                os.utime(caminho)
+            except OSError:
+                pass
+        return True
+
+    def obter(self, modelo_id, atualizado_em, carregar) -> str | bytes | None:
+        """
+        Caminho do .docx da versão no cache; `carregar()` (que lê o BLOB do
+        banco) só é chamado em caso de miss. Com o cache desligado, devolve
+        o próprio `carregar()`. None se o modelo não tem documento.
+        """
+        if not self.habilitado:
+            return carregar()
+
+        destino = self.caminho(modelo_id, atualizado_em)
+        if self._renovar(destino):
+            consultas.inc(resultado="acerto")
+            return destino
+
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+
+        with _travado(self._trava(modelo_id, atualizado_em)):
+            # outro processo pode ter preenchido enquanto esperávamos a trava
+            if os.path.exists(destino):
+                consultas.inc(resultado="acerto")
+                return destino
+
+            consultas.inc(resultado="falta")
+            conteudo = carregar()
+            if not conteudo:
+                return None
+
+            fd, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(conteudo)
+                os.replace(temporario, destino)
+            except BaseException:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+                raise
+
+        self.despejar(preservar=destino)
+        return destino
+
+    def despejar(self, preservar: str = None):
+        """Remove os arquivos menos usados até o total caber no limite."""
+        arquivos, total = [], 0
+        agora = time.time()
+
+        for pasta in os.scandir(self.raiz):
+            if not pasta.is_dir() or pasta.name == "_travas":
+                continue
+            for entrada in os.scandir(pasta.path):
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                if entrada.name.endswith(".docx"):
+                    arquivos.append((info.st_mtime, info.st_size, entrada.path))
+                    total += info.st_size
+                elif entrada.name.endswith(".tmp") and agora - info.st_mtime > TEMPORARIO_ABANDONADO_SEGUNDOS:
+                    try:
+                        os.remove(entrada.path)
+                    except OSError:
+                        pass
+
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.limite_bytes:
+                break
+            if caminho == preservar:
+                continue
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except FileNotFoundError:
+                total -= tamanho
+            except OSError:  # Windows: aberto/mapeado por outro processo
+                pass
+
+
+cache_blobs = CacheBlobsModelo()
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import MODEL_LIST_CACHE_TTL, MODEL_LIST_CACHE_ENTRIES
+
+
+class EntradaListagem:
+    """
+    Resposta já serializada da listagem de modelos de uma equipe.
+
+    `versao` é o par (MAX(atualizado_em), COUNT(*)) lido do banco quando
+    a resposta foi montada; o ETag é derivado do próprio corpo.
+    """
+
+    def __init__(self, versao: tuple, corpo: bytes):
+        self.versao = versao
+        self.corpo = corpo
+        self.etag = f'"{hashlib.sha256(corpo).hexdigest()[:32]}"'
+        self.validado_em = time.monotonic()
+
+
+def serializar(conteudo) -> bytes:
+    # mesmo formato do JSONResponse do FastAPI
+    return json.dumps(
+        conteudo, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class CacheListagem:
+    """
+    Cache LRU com TTL das respostas de /app/modelos, chaveado por
+    (equipe, variação da consulta).
+
+    Dentro do TTL a entrada é servida sem ir ao banco; depois dele, só é
+    reaproveitada se a versão (MAX(atualizado_em), COUNT(*)) da equipe não
+    mudou. Escritas feitas por este processo invalidam a equipe na hora.
+    """
+
+    def __init__(self, ttl: float = MODEL_LIST_CACHE_TTL, max_entradas: int = MODEL_LIST_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas: OrderedDict = OrderedDict()
+        self._geracoes: dict = {}
+        self._lock = threading.Lock()
+
+    def geracao(self, equipe: str) -> int:
+        """
+        Contador de invalidações da equipe; `guardar` descarta respostas
+        montadas antes de uma invalidação.
+        """
+        with self._lock:
+            return self._geracoes.get(equipe, 0)
+
+    def obter(self, chave: tuple) -> EntradaListagem | None:
+        """
+        Entrada ainda dentro do TTL, ou None (precisa revalidar).
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or time.monotonic() - entrada.validado_em > self.ttl:
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada
+
+    def revalidar(self, chave: tuple, versao: tuple) -> EntradaListagem | None:
+        """
+        Reaproveita a entrada se a versão no banco é a mesma (renova o TTL).
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada.versao != versao:
+                return None
+            entrada.validado_em = time.monotonic()
+            self._entradas.move_to_end(chave)
+            return entrada
+
+    def guardar(self, chave: tuple, versao: tuple, corpo: bytes, geracao: int) -> EntradaListagem:
+        entrada = EntradaListagem(versao, corpo)
+
+        with self._lock:
+            if self._geracoes.get(chave[0], 0) != geracao:
+                # a equipe foi invalidada enquanto a consulta rodava
+                return entrada
+
+            self._entradas[chave] = entrada
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+        return entrada
+
+    def invalidar(self, equipe: str):
+        with self._lock:
+            self._geracoes[equipe] = self._geracoes.get(equipe, 0) + 1
+            for chave in [c for c in self._entradas if c[0] == equipe]:
+                del self._entradas[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._geracoes.clear()
+
+
+cache_listagem = CacheListagem()
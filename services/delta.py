@@ -0,0 +1,323 @@
+"""
+Relatórios guardados como diferença em relação à versão do modelo
+(SYNTHETIS_STORAGE_DELTA=1).
+
+O relatório gerado já traz, byte a byte, todas as entradas do modelo que
+não mudaram (services.pacote.salvar_documento): estilos, tema, fontes,
+logos. O arquivo .delta guarda só as entradas que diferem da versão do
+modelo (mesmo nome, CRC e tamanho = mesma entrada) e um manifesto com a
+ordem das entradas e o SHA-256 da base, que fica em versoes_modelo e nunca
+é alterada.
+
+Para baixar, o .docx é remontado copiando entradas brutas da base e do
+delta, sem recompactar nada, e fica num pequeno cache em disco. O
+tamanho do .docx remontado vai no manifesto (Content-Length/Range sem
+remontar).
+Relatórios .docx (anteriores ou com o modo desligado) são lidos como sempre.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager, closing
+from io import BytesIO
+
+from sqlalchemy.exc import IntegrityError
+
+from core.config import STORAGE_DELTA, DELTA_CACHE_DIR, DELTA_CACHE_ENTRIES
+from database import SessionLocal
+from models.versao_modelo import VersaoModelo
+from services.cache_blobs import cache_blobs, mapear_arquivo, TEMPORARIO_ABANDONADO_SEGUNDOS
+from services.pacote import copiar_entrada
+from services.storage import armazenamento, ArquivoNaoEncontrado
+
+EXTENSAO = ".delta"
+MANIFESTO = "synthetis-delta.json"
+
+
+def eh_delta(chave: str) -> bool:
+    return chave.endswith(EXTENSAO)
+
+
+# ======================================
+# VERSÕES DE MODELO (bases)
+# ======================================
+# (modelo_id, atualizado_em) -> SHA-256 já registrado em versoes_modelo
+_versoes: dict = {}
+
+
+def base_do_modelo(modelo_id, atualizado_em, documento) -> str | None:
+    """
+    SHA-256 da versão do modelo, registrada em versoes_modelo na primeira
+    vez, ou None com o modo delta desligado. `documento` é o caminho no
+    cache em disco ou os bytes (como vem de carregar_modelo).
+    """
+    if not STORAGE_DELTA:
+        return None
+
+    sha = _versoes.get((modelo_id, atualizado_em))
+    if sha is not None:
+        return sha
+
+    if isinstance(documento, str):
+        with open(documento, "rb") as f:
+            documento = f.read()
+    sha = hashlib.sha256(documento).hexdigest()
+
+    sessao = SessionLocal()
+    try:
+        if sessao.query(VersaoModelo.id).filter(VersaoModelo.sha256 == sha).first() is None:
+            sessao.add(VersaoModelo(sha256=sha, modelo_id=modelo_id, documento=documento))
+            try:
+                sessao.commit()
+            except IntegrityError:  # outro processo registrou a mesma versão
+                sessao.rollback()
+    finally:
+        sessao.close()
+
+    _versoes[(modelo_id, atualizado_em)] = sha
+    return sha
+
+
+def _carregar_base(sha: str) -> bytes | None:
+    sessao = SessionLocal()
+    try:
+        return sessao.query(VersaoModelo.documento).filter(VersaoModelo.sha256 == sha).scalar()
+    finally:
+        sessao.close()
+
+
+def _mapear_base(sha: str):
+    # mesmo cache em disco dos modelos, chaveado pelo conteúdo
+    origem = cache_blobs.obter("versao", sha, lambda: _carregar_base(sha))
+    if isinstance(origem, str):
+        try:
+            return mapear_arquivo(origem)
+        except FileNotFoundError:
+            # despejado entre obter() e a abertura: lê direto do banco
+            origem = _carregar_base(sha)
+
+    if origem is None:
+        raise ArquivoNaoEncontrado(f"versão de modelo {sha}")
+    return BytesIO(origem)
+
+
+@contextmanager
+def _abrir_base(sha: str):
+    with closing(_mapear_base(sha)) as arquivo:
+        yield arquivo
+
+
+# ======================================
+# GRAVAÇÃO / MONTAGEM
+# ======================================
+def _mesma_entrada(a: zipfile.ZipInfo, b: zipfile.ZipInfo) -> bool:
+    return (a.CRC, a.file_size, a.compress_size, a.compress_type) == (b.CRC, b.file_size, b.compress_size, b.compress_type)
+
+
+class _Contador:
+    """Destino sem seek para o ZipFile que só conta os bytes escritos."""
+
+    def __init__(self):
+        self.total = 0
+
+    def write(self, dados) -> int:
+        self.total += len(dados)
+        return len(dados)
+
+    def tell(self) -> int:
+        return self.total
+
+    def flush(self):
+        pass
+
+
+def _copiar_entradas(entradas: list, pacotes: dict, destino):
+    # a mesma cópia na gravação (para medir) e na remontagem
+    with zipfile.ZipFile(destino, "w") as saida:
+        for nome, origem in entradas:
+            pacote = pacotes[origem]
+            copiar_entrada(pacote, pacote.getinfo(nome), saida)
+
+
+def gerar_delta(relatorio, base, sha: str, destino):
+    """
+    Escreve em `destino` as entradas de `relatorio` que não estão iguais
+    em `base` (copiadas sem recompactar) e o manifesto, com o tamanho que
+    o .docx terá ao ser remontado.
+    """
+    with zipfile.ZipFile(relatorio) as zr, zipfile.ZipFile(base) as zb, \
+            zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as saida:
+        entradas = []
+        for info in zr.infolist():
+            original = zb.NameToInfo.get(info.filename)
+            if original is not None and _mesma_entrada(info, original):
+                entradas.append([info.filename, "base"])
+            else:
+                entradas.append([info.filename, "delta"])
+                copiar_entrada(zr, info, saida)
+
+        # as entradas "delta" copiadas de zr ficam idênticas às do arquivo .delta
+        contador = _Contador()
+        _copiar_entradas(entradas, {"base": zb, "delta": zr}, contador)
+
+        saida.writestr(MANIFESTO, json.dumps({"base": sha, "entradas": entradas, "tamanho": contador.total}))
+
+
+def gravar_relatorio(conteudo, base: str | None) -> str:
+    """
+    Grava o relatório (bytes ou arquivo binário aberto) e devolve a chave:
+    como .delta sobre a versão `base`, ou o .docx inteiro se não há base.
+    """
+    if base is None:
+        if isinstance(conteudo, bytes):
+            return armazenamento.gravar(conteudo)
+        return armazenamento.gravar_arquivo(conteudo)
+
+    relatorio = BytesIO(conteudo) if isinstance(conteudo, bytes) else conteudo
+    relatorio.seek(0)
+    with _abrir_base(base) as arquivo_base, tempfile.TemporaryFile() as destino:
+        gerar_delta(relatorio, arquivo_base, base, destino)
+        return armazenamento.gravar_arquivo(destino, EXTENSAO)
+
+
+def _manifesto(chave: str) -> dict:
+    with armazenamento.abrir(chave) as arquivo, zipfile.ZipFile(arquivo) as pacote:
+        return json.loads(pacote.read(MANIFESTO))
+
+
+def base_de(chave: str) -> str | None:
+    """Versão de modelo em que o relatório `chave` se apoia (None se é .docx inteiro)."""
+    if not eh_delta(chave):
+        return None
+    return _manifesto(chave)["base"]
+
+
+def montar(chave: str, destino):
+    """Remonta em `destino` o .docx completo do relatório delta `chave`."""
+    with armazenamento.abrir(chave) as arquivo_delta, zipfile.ZipFile(arquivo_delta) as zd:
+        manifesto = json.loads(zd.read(MANIFESTO))
+
+        with _abrir_base(manifesto["base"]) as arquivo_base, zipfile.ZipFile(arquivo_base) as zb:
+            _copiar_entradas(manifesto["entradas"], {"base": zb, "delta": zd}, destino)
+
+
+class CacheMontados:
+    """
+    .docx remontados em arquivos, na pasta compartilhada pelos processos:
+    downloads seguidos e retomadas (Range) do mesmo relatório não remontam
+    de novo. Cada chave de relatório é imutável (resolver pendências gera
+    outra), então o arquivo tem o nome derivado da chave, como em
+    services.cache_blobs.
+
+    A pasta guarda no máximo `max_entradas` arquivos: saem os usados há
+    mais tempo (mtime, renovado nos acertos), inclusive os deixados por
+    outros processos ou por execuções anteriores.
+
+    `obter` devolve o arquivo já aberto: um despejo logo depois (outra
+    requisição) não o tira de quem está enviando.
+    """
+
+    def __init__(self, pasta: str = DELTA_CACHE_DIR, max_entradas: int = DELTA_CACHE_ENTRIES):
+        self.pasta = pasta
+        self.max_entradas = max(1, max_entradas)
+
+    def caminho(self, chave: str) -> str:
+        return os.path.join(self.pasta, hashlib.sha256(chave.encode()).hexdigest()[:40] + ".docx")
+
+    def obter(self, chave: str):
+        """O .docx remontado de `chave`, aberto para leitura (quem chama fecha)."""
+        caminho = self.caminho(chave)
+        try:
+            arquivo = open(caminho, "rb")
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                os.utime(caminho)
+            except OSError:
+                pass
+            return arquivo
+
+        os.makedirs(self.pasta, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.pasta, suffix=".tmp")
+        arquivo = os.fdopen(fd, "w+b")
+        try:
+            montar(chave, arquivo)
+            arquivo.flush()
+            try:
+                os.replace(temporario, caminho)
+            except PermissionError:  # Windows: não renomeia arquivo aberto
+                arquivo.close()
+                os.replace(temporario, caminho)
+                arquivo = open(caminho, "rb")
+            arquivo.seek(0)
+        except BaseException:
+            arquivo.close()
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+        self.despejar(preservar=caminho)
+        return arquivo
+
+    def despejar(self, preservar: str = None):
+        """Remove os arquivos usados há mais tempo até sobrarem `max_entradas`."""
+        arquivos = []
+        agora = time.time()
+
+        for entrada in os.scandir(self.pasta):
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            if entrada.name.endswith(".docx"):
+                arquivos.append((info.st_mtime, entrada.path))
+            elif entrada.name.endswith(".tmp") and agora - info.st_mtime > TEMPORARIO_ABANDONADO_SEGUNDOS:
+                try:
+                    os.remove(entrada.path)
+                except OSError:
+                    pass
+
+        excedentes = len(arquivos) - self.max_entradas
+        for _, caminho in sorted(arquivos):
+            if excedentes <= 0:
+                break
+            if caminho == preservar:
+                continue
+            try:
+                os.remove(caminho)
+                excedentes -= 1
+            except FileNotFoundError:
+                excedentes -= 1
+            except OSError:  # Windows: ainda sendo enviado
+                pass
+
+
+montados = CacheMontados()
+
+
+# ======================================
+# LEITURA (rotas)
+# ======================================
+def metadados_relatorio(chave: str) -> tuple[int, float]:
+    """Como armazenamento.metadados, com o tamanho do .docx completo."""
+    if not eh_delta(chave):
+        return armazenamento.metadados(chave)
+
+    _, modificado_em = armazenamento.metadados(chave)
+    return _manifesto(chave)["tamanho"], modificado_em
+
+
+def abrir_relatorio(chave: str):
+    """Como armazenamento.abrir, sempre com o .docx completo."""
+    if not eh_delta(chave):
+        return armazenamento.abrir(chave)
+    return montados.obter(chave)
+
+
+def ler_relatorio(chave: str) -> bytes:
+    with abrir_relatorio(chave) as arquivo:
+        return arquivo.read()
@@ -0,0 +1,191 @@
+import hashlib
+import re
+import unicodedata
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from anyio import to_thread
+from starlette.requests import Request
+from starlette.responses import Response
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(chave: str, tamanho: int, modificado_em: float) -> str:
+    h = hashlib.sha1(f"{chave}:{tamanho}:{modificado_em}".encode()).hexdigest()
+    return f'"{h[:32]}"'
+
+
+def etag_confere(cabecalho: str, etag: str) -> bool:
+    if cabecalho.strip() == "*":
+        return True
+    valores = [v.strip().removeprefix("W/") for v in cabecalho.split(",")]
+    return etag in valores
+
+
+def content_disposition(nome: str) -> str:
+    """
+    Anexo com o nome em UTF-8 (filename*, RFC 6266) e uma versão ASCII em
+    filename para clientes antigos; cabeçalhos HTTP só levam latin-1.
+    """
+    ascii_ = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode().replace('"', "")
+    return f"attachment; filename=\"{ascii_}\"; filename*=UTF-8''{quote(nome, safe='')}"
+
+
+def _tem_descritor(arquivo) -> bool:
+    try:
+        arquivo.fileno()
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def _data_http(valor: str):
+    try:
+        return parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class RespostaArquivo(Response):
+    """
+    Download de um arquivo do armazenamento com:
+
+    - Content-Length, ETag e Last-Modified;
+    - If-None-Match / If-Modified-Since -> 304 sem corpo;
+    - Range (um intervalo, com If-Range) -> 206, para retomar downloads;
+    - zero-copy (sendfile) quando o servidor ASGI oferece a extensão
+      `http.response.zerocopysend`; senão, leitura em blocos fora do loop.
+
+    O arquivo só é aberto dentro do envio e é sempre fechado no final.
+    """
+
+    tamanho_bloco = 256 * 1024
+
+    def __init__(self, request: Request, abrir, chave: str, tamanho: int, modificado_em: float,
+                 media_type: str, headers: dict = None):
+        self.abrir = abrir
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.inicio, self.fim = 0, tamanho - 1
+
+        etag = _etag(chave, tamanho, modificado_em)
+        cabecalhos = {
+            **(headers or {}),
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(modificado_em, usegmt=True),
+            "cache-control": "private, no-cache",
+        }
+
+        status = 200
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+
+        if if_none_match is not None:
+            nao_modificado = etag_confere(if_none_match, etag)
+        else:
+            desde = _data_http(if_modified_since) if if_modified_since else None
+            nao_modificado = desde is not None and int(modificado_em) <= desde.timestamp()
+
+        if nao_modificado:
+            status = 304
+        else:
+            intervalo = self._intervalo(request, etag, modificado_em, tamanho)
+            if intervalo == "invalido":
+                status = 416
+                cabecalhos["content-range"] = f"bytes */{tamanho}"
+            elif intervalo is not None:
+                status = 206
+                self.inicio, self.fim = intervalo
+                cabecalhos["content-range"] = f"bytes {self.inicio}-{self.fim}/{tamanho}"
+
+        if status in (200, 206):
+            cabecalhos["content-length"] = str(self.fim - self.inicio + 1)
+
+        self.status_code = status
+        self.init_headers(cabecalhos)
+
+    @staticmethod
+    def _intervalo(request: Request, etag: str, modificado_em: float, tamanho: int):
+        cabecalho = request.headers.get("range")
+        if not cabecalho:
+            return None
+
+        # If-Range: só vale o Range se o arquivo ainda for o mesmo
+        if_range = request.headers.get("if-range")
+        if if_range:
+            if if_range.strip().startswith('"') or if_range.strip().startswith("W/"):
+                if if_range.strip() != etag:
+                    return None
+            else:
+                data = _data_http(if_range)
+                if data is None or int(modificado_em) > data.timestamp():
+                    return None
+
+        # vários intervalos não são suportados: devolve o arquivo inteiro
+        m = _RANGE_RE.match(cabecalho.strip())
+        if not m:
+            return None
+
+        inicio, fim = m.groups()
+        if not inicio and not fim:
+            return "invalido"
+
+        if not inicio:
+            sufixo = int(fim)
+            if sufixo == 0 or tamanho == 0:
+                return "invalido"
+            return max(0, tamanho - sufixo), tamanho - 1
+
+        inicio = int(inicio)
+        fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+        if inicio >= tamanho or fim < inicio:
+            return "invalido"
+
+        return inicio, fim
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if self.status_code not in (200, 206) or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        arquivo = await to_thread.run_sync(self.abrir)
+        try:
+            restante = self.fim - self.inicio + 1
+            zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+
+            if restante <= 0:
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            if zerocopy and _tem_descritor(arquivo):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": arquivo,
+                    "offset": self.inicio,
+                    "count": restante,
+                })
+                return
+
+            await to_thread.run_sync(arquivo.seek, self.inicio)
+            while restante > 0:
+                bloco = await to_thread.run_sync(arquivo.read, min(self.tamanho_bloco, restante))
+                if not bloco:
+                    break
+                restante -= len(bloco)
+                await send({"type": "http.response.body", "body": bloco, "more_body": restante > 0})
+
+            if restante > 0:
+                # arquivo encolheu durante o envio
+                await send({"type": "http.response.body", "body": b""})
+
+        finally:
+            arquivo.close()
@@ -0,0 +1,169 @@
+import hashlib
+import posixpath
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from xml.etree import ElementTree as ET
+
+from core.config import EXTRACT_CACHE_ENTRIES
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P = W + "p"
+_W_T = W + "t"
+
+_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+_RT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+RT_DOCUMENTO = _RT + "officeDocument"
+
+# Partes ligadas ao documento principal que podem conter placeholders,
+# na ordem em que entram no resultado (caixas de texto ficam dentro delas)
+RT_PARTES = [_RT + "header", _RT + "footer", _RT + "footnotes", _RT + "endnotes"]
+
+_VARIAVEL_RE = re.compile(r"\{\{(.*?)\}\}")
+
+_TAMANHO_BLOCO = 1024 * 1024
+
+
+# ======================================
+# PARTES DO PACOTE
+# ======================================
+def _rels(pacote: zipfile.ZipFile, parte: str) -> list[tuple[str, str]]:
+    """
+    [(tipo, parte destino)] das relações internas de uma parte.
+    """
+    pasta, nome = posixpath.split(parte)
+    caminho_rels = posixpath.join(pasta, "_rels", f"{nome}.rels")
+
+    try:
+        raiz = ET.fromstring(pacote.read(caminho_rels))
+    except KeyError:
+        return []
+
+    rels = []
+    for rel in raiz.iter(_REL):
+        if rel.get("TargetMode") == "External":
+            continue
+
+        alvo = rel.get("Target", "")
+        if alvo.startswith("/"):
+            alvo = alvo[1:]
+        else:
+            alvo = posixpath.normpath(posixpath.join(pasta, alvo))
+
+        rels.append((rel.get("Type"), alvo))
+
+    return rels
+
+
+def partes_com_texto(pacote: zipfile.ZipFile) -> list[str]:
+    """
+    Documento principal + cabeçalhos, rodapés e notas, descobertos pelas
+    relações do pacote (e não por nomes fixos como header1..5).
+    """
+    principal = next(
+        (alvo for tipo, alvo in _rels(pacote, "") if tipo == RT_DOCUMENTO),
+        "word/document.xml",
+    )
+
+    relacionadas = _rels(pacote, principal)
+    partes = [principal]
+    for tipo_parte in RT_PARTES:
+        partes += sorted({alvo for tipo, alvo in relacionadas if tipo == tipo_parte})
+
+    nomes = set(pacote.namelist())
+    return [p for p in partes if p in nomes]
+
+
+# ======================================
+# EXTRAÇÃO INCREMENTAL
+# ======================================
+def _variaveis_da_parte(arquivo_xml):
+    """
+    Lê a parte com iterparse, juntando os w:t de cada parágrafo (um
+    placeholder quebrado em vários runs é reconstituído, e textos de
+    parágrafos diferentes nunca se juntam). Cada elemento é descartado
+    assim que termina, então a memória não cresce com o tamanho da parte.
+    """
+    pilha = []       # elementos abertos
+    paragrafos = []  # textos dos w:p abertos (caixas de texto aninham parágrafos)
+
+    for evento, elem in ET.iterparse(arquivo_xml, events=("start", "end")):
+        if evento == "start":
+            pilha.append(elem)
+            if elem.tag == _W_P:
+                paragrafos.append([])
+            continue
+
+        pilha.pop()
+
+        if elem.tag == _W_T:
+            if paragrafos and elem.text:
+                paragrafos[-1].append(elem.text)
+
+        elif elem.tag == _W_P:
+            yield from _VARIAVEL_RE.findall("".join(paragrafos.pop()))
+
+        if pilha:
+            pilha[-1].remove(elem)
+
+
+def extrair_variaveis_docx(arquivo) -> list[str]:
+    """
+    Variáveis {{ }} de um .docx (caminho ou arquivo binário com seek),
+    sem repetição e na ordem em que aparecem.
+    """
+    vistos = set()
+    variaveis_ordenadas = []
+
+    with zipfile.ZipFile(arquivo) as pacote:
+        for parte in partes_com_texto(pacote):
+            try:
+                with pacote.open(parte) as xml:
+                    for v in _variaveis_da_parte(xml):
+                        var = v.strip()
+                        if var not in vistos:
+                            vistos.add(var)
+                            variaveis_ordenadas.append(var)
+            except ET.ParseError:
+                continue
+
+    return variaveis_ordenadas
+
+
+# ======================================
+# MEMOIZAÇÃO POR CONTEÚDO
+# ======================================
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def hash_arquivo(arquivo) -> str:
+    arquivo.seek(0)
+    h = hashlib.sha256()
+    for bloco in iter(lambda: arquivo.read(_TAMANHO_BLOCO), b""):
+        h.update(bloco)
+    arquivo.seek(0)
+    return h.hexdigest()
+
+
+def extrair_variaveis_memoizado(arquivo) -> list[str]:
+    """
+    Igual a extrair_variaveis_docx, mas reenvios do mesmo arquivo
+    (mesmo SHA-256) devolvem o resultado já calculado.
+    """
+    chave = hash_arquivo(arquivo)
+
+    with _cache_lock:
+        if chave in _cache:
+            _cache.move_to_end(chave)
+            return list(_cache[chave])
+
+    variaveis = extrair_variaveis_docx(arquivo)
+
+    with _cache_lock:
+        _cache[chave] = variaveis
+        while len(_cache) > EXTRACT_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+    return list(variaveis)
@@ -0,0 +1,85 @@
+import hashlib
+import math
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from core.config import IMAGE_DPI, IMAGE_JPEG_QUALITY, IMAGE_PNG_COMPRESS_LEVEL, IMAGE_THREADS
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # sem Pillow as imagens vão como chegaram
+    Image = None
+
+# Tamanho (cm) com que as imagens aparecem no relatório: altura nos dados,
+# largura nas pendências. Basta que o menor lado cubra essa medida.
+TAMANHO_IMAGEM_CM = 10
+
+
+def _lado_minimo_px(tamanho_cm: float = TAMANHO_IMAGEM_CM, dpi: int = IMAGE_DPI) -> int:
+    return math.ceil(tamanho_cm / 2.54 * dpi)
+
+
+def processar_imagem(conteudo: bytes) -> bytes:
+    """
+    Reduz a foto para o necessário na impressão, aplica a rotação do EXIF,
+    descarta os metadados e recomprime (PNG continua PNG, o resto vira JPEG).
+    """
+    if Image is None:
+        return conteudo
+
+    try:
+        with Image.open(BytesIO(conteudo)) as original:
+            formato = original.format
+            imagem = ImageOps.exif_transpose(original)
+            icc = original.info.get("icc_profile")
+
+            lado = _lado_minimo_px()
+            menor = min(imagem.size)
+            if menor > lado:
+                escala = lado / menor
+                imagem = imagem.resize(
+                    (round(imagem.width * escala), round(imagem.height * escala)),
+                    Image.LANCZOS,
+                )
+
+            saida = BytesIO()
+            if formato == "PNG":
+                imagem.save(saida, "PNG", optimize=False, compress_level=IMAGE_PNG_COMPRESS_LEVEL, icc_profile=icc)
+            else:
+                if imagem.mode not in ("RGB", "L"):
+                    imagem = imagem.convert("RGB")
+                imagem.save(saida, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, icc_profile=icc)
+
+            return saida.getvalue()
+
+    except Exception:
+        # formato que o Pillow não entende: segue o conteúdo original
+        return conteudo
+
+
+def preparar_imagens(valores, decodificar) -> dict:
+    """
+    Decodifica e processa em paralelo um conjunto de imagens e devolve
+    {valor: bytes prontos para o add_picture}.
+
+    Imagens idênticas (a mesma foto nos dados e nas pendências) são
+    processadas uma vez só, pelo hash do conteúdo; como o resultado também
+    é idêntico, o python-docx guarda uma única mídia no pacote.
+    """
+    valores = list(dict.fromkeys(valores))
+    if not valores:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(IMAGE_THREADS, len(valores)))) as pool:
+        decodificados = list(pool.map(decodificar, valores))
+
+        por_hash = {}
+        for conteudo in decodificados:
+            por_hash.setdefault(hashlib.sha1(conteudo).digest(), conteudo)
+
+        processados = dict(zip(por_hash, pool.map(processar_imagem, por_hash.values())))
+
+    return {
+        valor: processados[hashlib.sha1(conteudo).digest()]
+        for valor, conteudo in zip(valores, decodificados)
+    }
@@ -0,0 +1,81 @@
+import json
+import zipfile
+
+from docx.opc.exceptions import PackageNotFoundError
+from lxml.etree import XMLSyntaxError
+
+from services.renderizador import CABECALHO, CABECALHO_TABELA
+from services.template_cache import ModeloCompilado
+
+TIPO_TEXTO = "texto"
+TIPO_IMAGEM = "imagem"
+TIPO_PENDENCIA = "pendencia"
+
+VERSAO_MANIFESTO = 1
+
+
+class ModeloInvalido(Exception):
+    """
+    O .docx enviado não pôde ser lido. Substitui os erros de leitura no
+    processo filho: o XMLSyntaxError do lxml não volta pelo pickle do pool.
+    """
+
+
+def gerar_manifesto(documento_bytes: bytes, chave_pendencia: str = None, campos_imagem=()) -> dict:
+    """
+    Manifesto dos placeholders do modelo, com o tipo e os locais de cada um:
+
+        {"versao": 1, "placeholders": {
+            "nome": {"tipo": "texto", "locais": [
+                {"parte": "/word/document.xml", "contexto": "corpo", "caminho": [0, 3]}
+            ]}
+        }}
+
+    O tipo vem do que foi informado na criação do modelo (campos de imagem e
+    chave de pendências); o resto é texto. Cabeçalho/rodapé só aceita texto.
+    """
+    campos_imagem = set(campos_imagem or ())
+    placeholders = {}
+
+    try:
+        compilado = ModeloCompilado(documento_bytes)
+    except (zipfile.BadZipFile, KeyError, XMLSyntaxError, PackageNotFoundError) as e:
+        raise ModeloInvalido(f"{type(e).__name__}: {e}") from None
+
+    for contexto, parte, caminho, chaves in compilado.indice:
+        for chave in chaves:
+            item = placeholders.setdefault(chave, {"tipo": TIPO_TEXTO, "locais": []})
+            item["locais"].append({"parte": parte, "contexto": contexto, "caminho": list(caminho)})
+
+    for chave, item in placeholders.items():
+        so_cabecalho = all(l["contexto"] in (CABECALHO, CABECALHO_TABELA) for l in item["locais"])
+        if so_cabecalho:
+            continue
+        if chave == chave_pendencia:
+            item["tipo"] = TIPO_PENDENCIA
+        elif chave in campos_imagem:
+            item["tipo"] = TIPO_IMAGEM
+
+    return {"versao": VERSAO_MANIFESTO, "placeholders": placeholders}
+
+
+def carregar_manifesto(texto: str | None) -> dict | None:
+    if not texto:
+        return None
+    try:
+        return json.loads(texto)
+    except ValueError:
+        return None
+
+
+def filtrar_dados(manifesto: dict | None, dados: dict) -> dict:
+    """
+    Mantém só as chaves de `dados` que existem no modelo, em O(chaves),
+    antes de qualquer trabalho com o .docx (e antes de mandar o payload,
+    com imagens, para o pool de renderização).
+    """
+    if manifesto is None:
+        return dados
+
+    placeholders = manifesto.get("placeholders", {})
+    return {key: value for key, value in dados.items() if key in placeholders}
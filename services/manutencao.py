@@ -0,0 +1,158 @@
+"""
+Manutenção do armazenamento de relatórios.
+
+- remove arquivos órfãos (que nenhum `Relatorio.caminho_arquivo` aponta)
+  depois de uma carência, para não apagar um arquivo recém-gravado cujo
+  registro ainda não foi commitado;
+- move para a camada fria (compactada) os relatórios mais antigos.
+
+Roda em segundo plano (SYNTHETIS_SWEEP_INTERVAL_HOURS > 0) ou pela linha
+de comando:
+
+    python -m services.manutencao              # só mostra o que faria
+    python -m services.manutencao --aplicar
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import traceback
+
+from fastapi.concurrency import run_in_threadpool
+
+from core.config import SWEEP_GRACE_HOURS, SWEEP_COLD_AFTER_DAYS, SWEEP_INTERVAL_HOURS
+from database import SessionLocal
+from models.relatorio import Relatorio
+from services.storage import armazenamento as armazenamento_padrao, ArquivoNaoEncontrado
+
+
+def chaves_referenciadas(sessao, armazenamento) -> set:
+    consulta = sessao.query(Relatorio.caminho_arquivo).execution_options(yield_per=5000)
+    return {armazenamento.normalizar(chave) for (chave,) in consulta if chave}
+
+
+def varrer(aplicar: bool = False,
+           carencia_horas: float = SWEEP_GRACE_HOURS,
+           congelar_apos_dias: float = SWEEP_COLD_AFTER_DAYS,
+           armazenamento=None,
+           criar_sessao=SessionLocal) -> dict:
+    """
+    Uma passada de reconciliação do armazenamento com a tabela relatorios.
+    Com `aplicar=False` só conta o que seria feito.
+    """
+    armazenamento = armazenamento or armazenamento_padrao
+    agora = time.time()
+    limite_orfao = agora - carencia_horas * 3600
+    limite_frio = agora - congelar_apos_dias * 86400 if congelar_apos_dias > 0 else None
+    congelar = limite_frio is not None and armazenamento.suporta_camada_fria
+
+    sessao = criar_sessao()
+    try:
+        referenciadas = chaves_referenciadas(sessao, armazenamento)
+    finally:
+        sessao.close()
+
+    resumo = {
+        "aplicado": aplicar,
+        "arquivos": 0,
+        "orfaos": 0,
+        "orfaos_em_carencia": 0,
+        "removidos": 0,
+        "congelados": 0,
+        "erros": 0,
+    }
+    orfaos, para_congelar = [], []
+
+    for chave, modificado_em, frio in armazenamento.listar():
+        resumo["arquivos"] += 1
+
+        if chave not in referenciadas:
+            if modificado_em > limite_orfao:
+                resumo["orfaos_em_carencia"] += 1
+            else:
+                orfaos.append(chave)
+            continue
+
+        # relatórios antigos (caminho absoluto) ficam onde estão
+        if congelar and not frio and modificado_em < limite_frio and not os.path.isabs(chave):
+            para_congelar.append(chave)
+
+    resumo["orfaos"] = len(orfaos)
+
+    # banco vazio com arquivos no disco é quase sempre configuração errada
+    # (outro banco apontando para a mesma pasta): não apaga nada
+    if not referenciadas and orfaos:
+        raise RuntimeError(
+            f"Nenhum relatório no banco e {len(orfaos)} arquivos no armazenamento; "
+            "confira SYNTHETIS_DATABASE_URL e SYNTHETIS_STORAGE_ROOT."
+        )
+
+    if not aplicar:
+        resumo["congelados"] = len(para_congelar)
+        return resumo
+
+    for chave in orfaos:
+        try:
+            armazenamento.remover(chave)
+            resumo["removidos"] += 1
+        except ArquivoNaoEncontrado:
+            pass
+        except OSError:
+            resumo["erros"] += 1
+            print(traceback.format_exc())
+
+    for chave in para_congelar:
+        try:
+            armazenamento.congelar(chave)
+            resumo["congelados"] += 1
+        except ArquivoNaoEncontrado:
+            pass
+        except (OSError, ValueError):
+            resumo["erros"] += 1
+            print(traceback.format_exc())
+
+    return resumo
+
+
+# ======================================
+# EXECUÇÃO PERIÓDICA (lifespan da API)
+# ======================================
+async def manutencao_periodica(intervalo_horas: float = SWEEP_INTERVAL_HOURS):
+    while True:
+        await asyncio.sleep(intervalo_horas * 3600)
+        try:
+            resumo = await run_in_threadpool(varrer, True)
+            print("Manutenção do armazenamento:", json.dumps(resumo))
+        except Exception:
+            print(traceback.format_exc())
+
+
+def iniciar_manutencao() -> asyncio.Task | None:
+    if SWEEP_INTERVAL_HOURS <= 0:
+        return None
+    return asyncio.create_task(manutencao_periodica())
+
+
+# ======================================
+# LINHA DE COMANDO
+# ======================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m services.manutencao",
+        description="Remove relatórios órfãos e move os antigos para a camada fria.",
+    )
+    parser.add_argument("--aplicar", action="store_true",
+                        help="executa as remoções/congelamentos (sem isso, só mostra o resumo)")
+    parser.add_argument("--carencia-horas", type=float, default=SWEEP_GRACE_HOURS,
+                        help="idade mínima de um órfão para ser removido")
+    parser.add_argument("--congelar-apos-dias", type=float, default=SWEEP_COLD_AFTER_DAYS,
+                        help="idade para ir para a camada fria (0 desliga)")
+    args = parser.parse_args(argv)
+
+    resumo = varrer(args.aplicar, args.carencia_horas, args.congelar_apos_dias)
+    print(json.dumps(resumo, indent=2))
+
+
+if __name__ == "__main__":
+    main()
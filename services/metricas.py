@@ -0,0 +1,275 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# ======================================
+# TIPOS DE MÉTRICA (formato texto do Prometheus)
+# ======================================
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BALDES_BYTES = tuple(1024 * 4 ** i for i in range(11))  # 1 KB .. 1 GB
+
+_LE_INF = 'le="+Inf"'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _formatar_numero(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores: dict = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+
+    def exportar(self) -> list[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exportar(self) -> list[str]:
+        linhas = super().exportar()
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}")
+        return linhas
+
+
+class Medidor(_Metrica):
+    """
+    Gauge. Com `funcao`, o valor é lido na hora da coleta (ex.: conexões
+    em uso no pool) e `funcao()` devolve {tupla de rótulos: valor}.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), funcao=None):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao
+
+    def definir(self, valor: float, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor: float = 1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def exportar(self) -> list[str]:
+        linhas = super().exportar()
+        if self.funcao is not None:
+            try:
+                itens = sorted(self.funcao().items())
+            except Exception:
+                itens = []
+        else:
+            with self._lock:
+                itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}")
+        return linhas
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), baldes: tuple = BALDES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(sorted(baldes))
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        i = bisect.bisect_left(self.baldes, valor)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                # [contagens por balde (não acumuladas), soma, total]
+                serie = self._valores[chave] = [[0] * len(self.baldes), 0.0, 0]
+            if i < len(self.baldes):
+                serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self) -> list[str]:
+        linhas = super().exportar()
+        with self._lock:
+            itens = sorted((chave, (list(s[0]), s[1], s[2])) for chave, s in self._valores.items())
+
+        for chave, (contagens, soma, total) in itens:
+            acumulado = 0
+            for limite, n in zip(self.baldes, contagens):
+                acumulado += n
+                le = f'le="{_formatar_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, _LE_INF)} {total}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+
+class Registro:
+
+    def __init__(self):
+        self._metricas: list[_Metrica] = []
+
+    def registrar(self, metrica: _Metrica) -> _Metrica:
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ======================================
+# MÉTRICAS DA APLICAÇÃO
+# ======================================
+requisicoes_segundos = registro.registrar(Histograma(
+    "synthetis_http_requisicao_segundos", "Latência das requisições HTTP por rota.",
+    ("rota", "metodo", "status"),
+))
+requisicoes_em_andamento = registro.registrar(Medidor(
+    "synthetis_http_requisicoes_em_andamento", "Requisições HTTP sendo atendidas.",
+))
+payload_bytes = registro.registrar(Histograma(
+    "synthetis_http_payload_bytes", "Tamanho do corpo das requisições (Content-Length).",
+    ("rota",), BALDES_BYTES,
+))
+etapa_segundos = registro.registrar(Histograma(
+    "synthetis_render_etapa_segundos", "Duração de cada etapa da geração/resolução de relatórios.",
+    ("etapa",),
+))
+relatorio_bytes = registro.registrar(Histograma(
+    "synthetis_relatorio_bytes", "Tamanho dos .docx gerados.", (), BALDES_BYTES,
+))
+pool_espera_segundos = registro.registrar(Histograma(
+    "synthetis_db_pool_espera_segundos", "Espera para obter uma conexão do pool do banco.",
+    ("engine",),
+))
+pool_uso_segundos = registro.registrar(Histograma(
+    "synthetis_db_pool_uso_segundos", "Tempo em que uma conexão ficou fora do pool.",
+    ("engine",),
+))
+
+
+# ======================================
+# ETAPAS (também dentro dos processos de renderização)
+# ======================================
+_coletor = threading.local()
+
+
+@contextmanager
+def etapa(nome: str):
+    """
+    Mede um trecho como uma etapa de renderização. Dentro de `coletar()`
+    (processo filho) a duração é guardada para ser devolvida ao processo
+    principal; fora dele, vai direto para o histograma.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(nome, time.perf_counter() - inicio)
+
+
+def registrar_etapa(nome: str, duracao: float):
+    etapas = getattr(_coletor, "etapas", None)
+    if etapas is not None:
+        etapas.append((nome, duracao))
+    else:
+        etapa_segundos.observar(duracao, etapa=nome)
+
+
+@contextmanager
+def coletar():
+    """
+    Junta as etapas medidas no bloco numa lista [(etapa, segundos)], em vez
+    de registrá-las (o registro do processo filho não é exportado).
+    """
+    anterior = getattr(_coletor, "etapas", None)
+    etapas = _coletor.etapas = []
+    try:
+        yield etapas
+    finally:
+        _coletor.etapas = anterior
+
+
+# ======================================
+# MIDDLEWARE (latência por rota)
+# ======================================
+class MiddlewareMetricas:
+    """
+    Middleware ASGI puro: mede cada requisição HTTP até o fim do envio da
+    resposta (inclusive streaming), rotulada pelo template da rota
+    (ex.: /app/baixarRelatorio/{relatorio_id}) e não pela URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        inicio = time.perf_counter()
+        requisicoes_em_andamento.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            requisicoes_em_andamento.dec()
+            rota = getattr(scope.get("route"), "path", "desconhecida")
+            requisicoes_segundos.observar(
+                time.perf_counter() - inicio, rota=rota, metodo=scope["method"], status=status
+            )
+
+            tamanho = dict(scope["headers"]).get(b"content-length")
+            if tamanho and tamanho.isdigit():
+                payload_bytes.observar(int(tamanho), rota=rota)
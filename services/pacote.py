@@ -0,0 +1,371 @@
+import copy
+import hashlib
+import posixpath
+import struct
+import zipfile
+from io import BytesIO
+
+from docx.image.image import Image
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.opc.packuri import PACKAGE_URI
+from docx.opc.part import XmlPart
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+from docx.oxml.shape import CT_Inline
+from docx.shared import Cm
+from lxml import etree
+
+from services.metricas import etapa
+from services.renderizador import is_base64_image, preparar_imagens_payload, resolver_caminho
+
+_NS_RELS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_NS_TIPOS = "http://schemas.openxmlformats.org/package/2006/content-types"
+_TIPOS = "[Content_Types].xml"
+
+# cabeçalho local de uma entrada do ZIP: 30 bytes fixos + nome + extra
+_CABECALHO_LOCAL = struct.Struct("<4s2B4HL2L2H")
+_BIT_DESCRITOR = 0x08
+
+# mídia que já vem compactada: entra no ZIP só armazenada
+_MIDIA_COMPACTADA = {"jpeg", "jpg", "png", "gif"}
+
+
+class MapaDesatualizado(Exception):
+    """O mapa de pendências não corresponde mais ao documento gravado."""
+
+
+# ======================================
+# CÓPIA BRUTA DE ENTRADAS DO ZIP
+# ======================================
+def copiar_entrada(origem: zipfile.ZipFile, info: zipfile.ZipInfo, destino: zipfile.ZipFile):
+    """
+    Copia uma entrada de `origem` para `destino` byte a byte, ainda
+    compactada: sem descompactar, recompactar nem recalcular o CRC.
+
+    O zipfile não tem API pública para isso; a entrada é registrada em
+    `destino` do mesmo jeito que o `write()` faria.
+    """
+    fp = origem.fp
+    fp.seek(info.header_offset)
+    cabecalho = _CABECALHO_LOCAL.unpack(fp.read(_CABECALHO_LOCAL.size))
+    fp.seek(cabecalho[10] + cabecalho[11], 1)  # pula nome e extra do cabeçalho local
+
+    novo = copy.copy(info)
+    # tamanhos e CRC vão no cabeçalho local, sem data descriptor depois dos dados
+    novo.flag_bits &= ~_BIT_DESCRITOR
+    novo.extra = b""
+    novo.header_offset = destino.fp.tell()
+
+    destino.fp.write(novo.FileHeader())
+
+    restante = info.compress_size
+    while restante:
+        bloco = fp.read(min(restante, 1024 * 1024))
+        if not bloco:
+            raise zipfile.BadZipFile(f"Entrada truncada: {info.filename}")
+        destino.fp.write(bloco)
+        restante -= len(bloco)
+
+    destino.filelist.append(novo)
+    destino.NameToInfo[novo.filename] = novo
+    destino.start_dir = destino.fp.tell()
+    destino._didModify = True
+
+
+def gravar_pacote(origem: zipfile.ZipFile, destino, alteradas: dict, novas: dict):
+    """
+    Monta em `destino` (arquivo binário com seek) o pacote de `origem` com
+    as partes de `alteradas` ({nome: bytes}) regravadas e `novas` acrescentadas
+    no final (partes XML compactadas, mídia só armazenada). Todas as outras
+    entradas são copiadas sem recompactar.
+    """
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as saida:
+        for info in origem.infolist():
+            if info.filename in alteradas:
+                saida.writestr(info.filename, alteradas[info.filename])
+            else:
+                copiar_entrada(origem, info, saida)
+
+        for nome, conteudo in alteradas.items():
+            if nome not in origem.NameToInfo:
+                saida.writestr(nome, conteudo)
+
+        for nome, conteudo in novas.items():
+            # mídia já vem compactada (JPEG/PNG)
+            saida.writestr(nome, conteudo, compress_type=zipfile.ZIP_STORED)
+
+
+# ======================================
+# SALVAR DOCUMENTO A PARTIR DO PACOTE DE ORIGEM
+# ======================================
+def _assinatura(parte):
+    # só partes XML são editadas pelo python-docx; mídia sai como foi lida
+    if isinstance(parte, XmlPart):
+        return hashlib.sha1(parte.blob).digest()
+    return None
+
+
+def nomes_partes(doc) -> dict:
+    """
+    {nome no ZIP: assinatura} das partes carregadas do documento. A
+    assinatura é o hash do XML serializado (None para partes que não são
+    XML) e serve para achar, ao salvar, as partes alteradas fora das que
+    tinham placeholder (ex.: word/styles.xml, pelo `paragraph.style`).
+    """
+    return {parte.partname.membername: _assinatura(parte) for parte in doc.part.package.iter_parts()}
+
+
+def _rels_de(pacote: zipfile.ZipFile, nome_rels: str) -> set:
+    if nome_rels not in pacote.NameToInfo:
+        return set()
+    raiz = etree.fromstring(pacote.read(nome_rels))
+    return {
+        (rel.get("Id"), rel.get("Type"), rel.get("Target"), rel.get("TargetMode", "Internal"))
+        for rel in raiz.findall(f"{{{_NS_RELS}}}Relationship")
+    }
+
+
+def _rels_atuais(rels) -> set:
+    return {
+        (rId, rel.reltype, rel.target_ref, "External" if rel.is_external else "Internal")
+        for rId, rel in rels.items()
+    }
+
+
+def salvar_documento(doc, origem, originais: dict, tocadas: set) -> bytes:
+    """
+    Equivalente a `doc.save()` para um documento aberto do pacote `origem`:
+    regrava as partes XML `tocadas` (nomes no ZIP), as outras partes XML
+    cujo conteúdo mudou, as partes novas (mídia JPEG/PNG só armazenada), os
+    .rels que mudaram e o [Content_Types].xml, se houver parte nova. O que
+    não mudou (estilos, temas, fontes, mídia do modelo) é copiado de
+    `origem` sem recompactar.
+
+    `originais` são as partes que o documento tinha ao ser aberto, com a
+    assinatura de cada uma (nomes_partes); uma parte nova com o nome de uma
+    entrada órfã de `origem` substitui essa entrada. `origem` são os bytes do pacote ou um
+    arquivo binário com seek (ex.: o mmap do cache em disco).
+    """
+    pacote_doc = doc.part.package
+    partes = list(pacote_doc.iter_parts())
+
+    if isinstance(origem, (bytes, bytearray)):
+        origem = BytesIO(origem)
+
+    with zipfile.ZipFile(origem) as pacote:
+        alteradas, novas = {}, {}
+        ha_parte_nova = False
+
+        for parte in partes:
+            nome = parte.partname.membername
+
+            if nome not in originais:
+                ha_parte_nova = True
+                extensao = parte.partname.ext.lower()
+                if nome in pacote.NameToInfo or isinstance(parte, XmlPart) or extensao not in _MIDIA_COMPACTADA:
+                    alteradas[nome] = parte.blob
+                else:
+                    novas[nome] = parte.blob
+            elif nome in tocadas:
+                alteradas[nome] = parte.blob
+            elif originais[nome] is not None:
+                blob = parte.blob
+                if hashlib.sha1(blob).digest() != originais[nome]:
+                    alteradas[nome] = blob
+
+            nome_rels = parte.partname.rels_uri.membername
+            # o python-docx não grava .rels vazio
+            if (len(parte.rels) or nome_rels in pacote.NameToInfo) and _rels_atuais(parte.rels) != _rels_de(pacote, nome_rels):
+                alteradas[nome_rels] = parte.rels.xml
+
+        nome_rels = PACKAGE_URI.rels_uri.membername
+        if _rels_atuais(pacote_doc.rels) != _rels_de(pacote, nome_rels):
+            alteradas[nome_rels] = pacote_doc.rels.xml
+
+        if ha_parte_nova:
+            alteradas[_TIPOS] = _ContentTypesItem.from_parts(partes).blob
+
+        saida = BytesIO()
+        gravar_pacote(pacote, saida, alteradas, novas)
+        return saida.getvalue()
+
+
+# ======================================
+# PARTES XML (rels, content types)
+# ======================================
+def _nome_zip(partname: str) -> str:
+    return partname.lstrip("/")
+
+
+def _nome_rels(nome_parte: str) -> str:
+    pasta, arquivo = posixpath.split(nome_parte)
+    return posixpath.join(pasta, "_rels", f"{arquivo}.rels")
+
+
+class _ParteEditada:
+    """
+    Parte XML de um relatório sendo alterada no lugar, com os seus
+    relacionamentos (.rels).
+    """
+
+    def __init__(self, pacote: zipfile.ZipFile, nome: str):
+        self.nome = nome
+        self.nome_rels = _nome_rels(nome)
+        self.elemento = parse_xml(pacote.read(nome))
+
+        if self.nome_rels in pacote.NameToInfo:
+            self.rels = etree.fromstring(pacote.read(self.nome_rels))
+        else:
+            self.rels = etree.Element(f"{{{_NS_RELS}}}Relationships", nsmap={None: _NS_RELS})
+
+        ids = [int(i) for i in self.elemento.xpath("//@id") if i.isdigit()]
+        self._proximo_id = max(ids, default=0) + 1
+
+    def proximo_id(self) -> int:
+        atual = self._proximo_id
+        self._proximo_id += 1
+        return atual
+
+    def relacionar_imagem(self, nome_midia: str) -> str:
+        alvo = posixpath.relpath(nome_midia, posixpath.dirname(self.nome))
+
+        existentes = self.rels.findall(f"{{{_NS_RELS}}}Relationship")
+        for rel in existentes:
+            if rel.get("Type") == RT.IMAGE and rel.get("Target") == alvo:
+                return rel.get("Id")
+
+        usados = {rel.get("Id") for rel in existentes}
+        n = len(existentes) + 1
+        while f"rId{n}" in usados:
+            n += 1
+
+        etree.SubElement(self.rels, f"{{{_NS_RELS}}}Relationship", Id=f"rId{n}", Type=RT.IMAGE, Target=alvo)
+        return f"rId{n}"
+
+    def serializar(self) -> dict:
+        return {
+            self.nome: serialize_part_xml(self.elemento),
+            self.nome_rels: serialize_part_xml(self.rels),
+        }
+
+
+def _registrar_extensoes(pacote: zipfile.ZipFile, tipos: dict) -> bytes | None:
+    """
+    [Content_Types].xml com um Default para cada extensão de mídia nova,
+    ou None se todas já estavam lá.
+    """
+    raiz = etree.fromstring(pacote.read(_TIPOS))
+    conhecidas = {d.get("Extension", "").lower() for d in raiz.findall(f"{{{_NS_TIPOS}}}Default")}
+
+    faltando = {ext: tipo for ext, tipo in tipos.items() if ext.lower() not in conhecidas}
+    if not faltando:
+        return None
+
+    for ext, tipo in faltando.items():
+        elemento = etree.Element(f"{{{_NS_TIPOS}}}Default", Extension=ext, ContentType=tipo)
+        # Defaults antes dos Overrides, como o Word grava
+        raiz.insert(len(raiz.findall(f"{{{_NS_TIPOS}}}Default")), elemento)
+
+    return serialize_part_xml(raiz)
+
+
+# ======================================
+# RESOLUÇÃO INCREMENTAL DE PENDÊNCIAS
+# ======================================
+def resolver_pendencias_pacote(origem, destino, mapa: dict, imagens: dict) -> dict:
+    """
+    Resolve as imagens pendentes de um relatório já gerado mexendo só nas
+    partes que o mapa aponta (services.renderizador.mapear_pendentes).
+
+    `origem` é o .docx aberto para leitura e `destino` um arquivo binário
+    vazio com seek. Lê e regrava só as partes XML afetadas, acrescenta as
+    mídias novas e copia o resto do pacote sem recompactar. Devolve o mapa
+    com o que continua pendente.
+
+    Levanta MapaDesatualizado se algum local do mapa não tiver mais o
+    placeholder esperado; nesse caso nada útil foi gravado em `destino`.
+    """
+    ordem = {chave: i for i, chave in enumerate(imagens)}
+
+    # (parte, caminho) -> chaves com imagem enviada, na ordem de `imagens`
+    alvos = {}
+    for chave, locais in mapa.items():
+        if not is_base64_image(imagens.get(chave)):
+            continue
+        for local in locais:
+            alvos.setdefault((local["parte"], tuple(local["caminho"])), []).append(chave)
+
+    # o que não recebeu imagem continua pendente, menos os parágrafos que
+    # serão limpos para receber a imagem de outra chave
+    restante = {}
+    for chave, locais in mapa.items():
+        if is_base64_image(imagens.get(chave)):
+            continue
+        locais = [l for l in locais if (l["parte"], tuple(l["caminho"])) not in alvos]
+        if locais:
+            restante[chave] = locais
+
+    with zipfile.ZipFile(origem) as pacote:
+        if not alvos:
+            gravar_pacote(pacote, destino, {}, {})
+            return restante
+
+        partes = {}
+        for (nome_parte, caminho), chaves in alvos.items():
+            nome = _nome_zip(nome_parte)
+            if nome not in pacote.NameToInfo:
+                raise MapaDesatualizado(nome_parte)
+
+            parte = partes.get(nome)
+            if parte is None:
+                parte = partes[nome] = _ParteEditada(pacote, nome)
+
+            try:
+                p = resolver_caminho(parte.elemento, caminho)
+            except IndexError:
+                raise MapaDesatualizado(f"{nome_parte} {list(caminho)}")
+
+            chave = min(chaves, key=ordem.get)
+            if p.tag != qn("w:p") or f"{{{{{chave}}}}}" not in p.text:
+                raise MapaDesatualizado(f"{nome_parte} {list(caminho)}")
+
+            alvos[(nome_parte, caminho)] = (parte, p, imagens[chave])
+
+        with etapa("imagens"):
+            imagens_prontas = preparar_imagens_payload(imagem for _, _, imagem in alvos.values())
+
+        novas, tipos = {}, {}
+        for parte, p, imagem in alvos.values():
+            conteudo = imagens_prontas[imagem]
+            descritor = Image.from_blob(conteudo)
+
+            nome_midia = f"word/media/pendencia_{hashlib.sha1(conteudo).hexdigest()[:16]}.{descritor.ext}"
+            novas[nome_midia] = conteudo
+            tipos[descritor.ext] = descritor.content_type
+
+            rId = parte.relacionar_imagem(nome_midia)
+            cx, cy = descritor.scaled_dimensions(None, Cm(10))
+            inline = CT_Inline.new_pic_inline(parte.proximo_id(), rId, posixpath.basename(nome_midia), cx, cy)
+
+            # mesmo resultado de clear_paragraph + add_run().add_picture()
+            for r in p.r_lst:
+                p.remove(r)
+            p.add_r().add_drawing(inline)
+
+        alteradas = {}
+        for parte in partes.values():
+            alteradas.update(parte.serializar())
+
+        tipos_xml = _registrar_extensoes(pacote, tipos)
+        if tipos_xml is not None:
+            alteradas[_TIPOS] = tipos_xml
+
+        # mídia repetida (mesma foto já acrescentada antes) não entra de novo
+        novas = {nome: conteudo for nome, conteudo in novas.items() if nome not in pacote.NameToInfo}
+
+        with etapa("gravar_pacote"):
+            gravar_pacote(pacote, destino, alteradas, novas)
+
+    return restante
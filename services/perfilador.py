@@ -0,0 +1,437 @@
+"""
+Perfis de requisições lentas.
+
+- Sob demanda: um administrador (SYNTHETIS_PROFILE_ADMINS) manda o
+  cabeçalho `X-Synthetis-Perfil: 1` (ou `?perfil=1`) com o próprio token;
+  a requisição roda com cProfile e com o amostrador de pilhas, e o id do
+  perfil volta no cabeçalho `X-Synthetis-Perfil-Id`.
+- Automático: com SYNTHETIS_PROFILE_SLOW_MS > 0 todas as requisições são
+  amostradas (barato) e só as que passam do limite viram perfil.
+
+Cada perfil tem o pstats (só sob demanda) e as pilhas no formato
+"collapsed" (uma linha `f1;f2;f3 N`, entrada do flamegraph.pl/speedscope),
+marcados com rota, modelo_id e duração. O trabalho feito nos processos de
+renderização entra no mesmo perfil (render_pool). Os perfis ficam num anel
+em memória, por processo, e são lidos em /perfis.
+
+O amostrador vê todas as threads do processo: com requisições simultâneas
+as pilhas de uma aparecem no perfil da outra (`concorrentes` no resumo).
+"""
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from jose import jwt, JWTError
+
+from core.config import PROFILE_ADMINS, PROFILE_SLOW_MS, PROFILE_SAMPLE_MS, PROFILE_RING_SIZE
+from core.security import SECRET_KEY, ALGORITHM
+
+CABECALHO = b"x-synthetis-perfil"
+CABECALHO_ID = b"x-synthetis-perfil-id"
+
+# rotas que não entram no perfil automático (ler perfis não gera perfil)
+IGNORADAS = ("/perfis", "/metrics")
+
+
+def pode_perfilar(usuario: str | None) -> bool:
+    return usuario is not None and usuario in PROFILE_ADMINS
+
+
+# ======================================
+# PILHAS
+# ======================================
+# folhas em que a thread está parada esperando (não entram no perfil)
+_OCIOSAS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("connection.py", "wait"),
+}
+
+_rotulos: dict = {}
+
+
+def _rotulo(codigo) -> str:
+    rotulo = _rotulos.get(codigo)
+    if rotulo is None:
+        rotulo = _rotulos[codigo] = f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+    return rotulo
+
+
+def pilha(frame) -> str | None:
+    """
+    Pilha da raiz até `frame` no formato collapsed, ou None se a thread
+    está ociosa.
+    """
+    codigo = frame.f_code
+    if (os.path.basename(codigo.co_filename), codigo.co_name) in _OCIOSAS:
+        return None
+
+    rotulos = []
+    while frame is not None:
+        rotulos.append(_rotulo(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(rotulos))
+
+
+class Amostrador:
+    """
+    Thread que tira uma foto das pilhas de todas as threads a cada
+    `intervalo` segundos enquanto houver alguém usando (iniciar/parar com
+    contagem). As amostras ficam num deque limitado, com o instante de cada
+    uma, e cada requisição recorta a sua janela.
+    """
+
+    def __init__(self, intervalo: float, max_amostras: int = 200_000):
+        self.intervalo = intervalo
+        self._amostras = deque(maxlen=max_amostras)
+        self._usuarios = 0
+        self._ativo = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._nomes: dict = {}
+
+    def iniciar(self):
+        with self._lock:
+            self._usuarios += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._rodar, name="perfilador", daemon=True)
+                self._thread.start()
+            self._ativo.set()
+
+    def parar(self):
+        with self._lock:
+            self._usuarios -= 1
+            if self._usuarios <= 0:
+                self._usuarios = 0
+                self._ativo.clear()
+
+    def _nome_thread(self, ident) -> str:
+        nome = self._nomes.get(ident)
+        if nome is None:
+            self._nomes = {t.ident: t.name for t in threading.enumerate()}
+            nome = self._nomes.get(ident, str(ident))
+        return nome
+
+    def _rodar(self):
+        propria = threading.get_ident()
+        while True:
+            self._ativo.wait()
+            agora = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == propria:
+                    continue
+                texto = pilha(frame)
+                if texto is not None:
+                    self._amostras.append((agora, self._nome_thread(ident) + ";" + texto))
+            time.sleep(self.intervalo)
+
+    def recortar(self, inicio: float, fim: float) -> Counter:
+        with self._lock:
+            amostras = list(self._amostras)
+        return Counter(texto for instante, texto in amostras if inicio <= instante <= fim)
+
+
+class _AmostradorThread(threading.Thread):
+    """Amostra só uma thread (a principal do processo de renderização)."""
+
+    def __init__(self, alvo: int, intervalo: float):
+        super().__init__(name="perfilador", daemon=True)
+        self.alvo = alvo
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._fim = threading.Event()
+
+    def run(self):
+        while not self._fim.wait(self.intervalo):
+            frame = sys._current_frames().get(self.alvo)
+            texto = pilha(frame) if frame is not None else None
+            if texto is not None:
+                self.pilhas[texto] += 1
+
+    def encerrar(self) -> Counter:
+        self._fim.set()
+        self.join()
+        return self.pilhas
+
+
+class _Estatisticas:
+    """Adapta um dict de cProfile (vindo de outro processo) para pstats.Stats."""
+
+    def __init__(self, stats: dict):
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        pass
+
+
+def perfilar_chamada(funcao, args, detalhado: bool):
+    """
+    Executa `funcao(*args)` amostrando a thread atual (e com cProfile, se
+    `detalhado`). Usado dentro dos processos de renderização; devolve
+    (resultado, {"pilhas": ..., "pstats": ...}) para o processo principal.
+    """
+    amostrador = _AmostradorThread(threading.get_ident(), PROFILE_SAMPLE_MS / 1000)
+    perfil = cProfile.Profile() if detalhado else None
+
+    amostrador.start()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        resultado = funcao(*args)
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        pilhas = amostrador.encerrar()
+
+    estatisticas = None
+    if perfil is not None:
+        perfil.create_stats()
+        estatisticas = perfil.stats
+    return resultado, {"pilhas": dict(pilhas), "pstats": estatisticas}
+
+
+# ======================================
+# PERFIS GUARDADOS
+# ======================================
+class Perfil:
+
+    def __init__(self, id: int, motivo: str, usuario: str | None, rota: str, metodo: str,
+                 status: int, duracao: float, anotacoes: dict, concorrentes: int,
+                 pilhas: Counter, estatisticas: dict | None):
+        self.id = id
+        self.criado_em = datetime.now()
+        self.motivo = motivo
+        self.usuario = usuario
+        self.rota = rota
+        self.metodo = metodo
+        self.status = status
+        self.duracao = duracao
+        self.anotacoes = anotacoes
+        self.concorrentes = concorrentes
+        self.pilhas = pilhas
+        self.estatisticas = estatisticas
+
+    def resumo(self) -> dict:
+        return {
+            "id": self.id,
+            "criado_em": self.criado_em.isoformat(timespec="seconds"),
+            "motivo": self.motivo,
+            "usuario": self.usuario,
+            "rota": self.rota,
+            "metodo": self.metodo,
+            "status": self.status,
+            "duracao_ms": round(self.duracao * 1000, 1),
+            "modelo_id": self.anotacoes.get("modelo_id"),
+            "anotacoes": self.anotacoes,
+            "concorrentes": self.concorrentes,
+            "amostras": sum(self.pilhas.values()),
+            "pstats": self.estatisticas is not None,
+        }
+
+    def pstats_bytes(self) -> bytes | None:
+        # mesmo formato de Profile.dump_stats: abre com pstats.Stats(arquivo)
+        return marshal.dumps(self.estatisticas) if self.estatisticas is not None else None
+
+    def pilhas_collapsed(self) -> str:
+        return "".join(f"{texto} {n}\n" for texto, n in sorted(self.pilhas.items()))
+
+    def texto_pstats(self, limite: int = 40, ordem: str = "cumulative") -> str | None:
+        if self.estatisticas is None:
+            return None
+        saida = io.StringIO()
+        pstats.Stats(_Estatisticas(self.estatisticas), stream=saida).sort_stats(ordem).print_stats(limite)
+        return saida.getvalue()
+
+
+class AnelPerfis:
+
+    def __init__(self, tamanho: int = PROFILE_RING_SIZE):
+        self._perfis = deque(maxlen=max(1, tamanho))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def proximo_id(self) -> int:
+        return next(self._ids)
+
+    def guardar(self, perfil: Perfil):
+        with self._lock:
+            self._perfis.append(perfil)
+
+    def listar(self) -> list[Perfil]:
+        with self._lock:
+            return list(reversed(self._perfis))
+
+    def obter(self, perfil_id: int) -> Perfil | None:
+        with self._lock:
+            return next((p for p in self._perfis if p.id == perfil_id), None)
+
+
+perfis = AnelPerfis()
+amostrador = Amostrador(PROFILE_SAMPLE_MS / 1000)
+
+
+# ======================================
+# COLETA DA REQUISIÇÃO ATUAL
+# ======================================
+class _Coleta:
+
+    def __init__(self, detalhado: bool):
+        self.detalhado = detalhado
+        self.anotacoes: dict = {}
+        self.pilhas_filhos = Counter()
+        self.estatisticas_filhos: list[dict] = []
+
+    @property
+    def modo_filho(self) -> str:
+        return "detalhado" if self.detalhado else "amostrar"
+
+    def incorporar(self, perfil_filho: dict):
+        for texto, n in perfil_filho["pilhas"].items():
+            self.pilhas_filhos["processo_renderizacao;" + texto] += n
+        if perfil_filho["pstats"] is not None:
+            self.estatisticas_filhos.append(perfil_filho["pstats"])
+
+
+_coleta: ContextVar[_Coleta | None] = ContextVar("perfilador_coleta", default=None)
+
+
+def coleta_atual() -> _Coleta | None:
+    return _coleta.get()
+
+
+def anotar(**valores):
+    """
+    Marca o perfil da requisição atual (ex.: anotar(modelo_id=3)); não faz
+    nada se a requisição não está sendo perfilada.
+    """
+    coleta = _coleta.get()
+    if coleta is not None:
+        coleta.anotacoes.update({k: v for k, v in valores.items() if v is not None})
+
+
+# um cProfile por thread: a thread do event loop só perfila uma requisição por vez
+_cprofile_ocupado = threading.Lock()
+
+
+def _solicitante(scope) -> str | None:
+    """Usuário administrador que pediu o perfil, se pediu."""
+    cabecalhos = dict(scope["headers"])
+    pedido = cabecalhos.get(CABECALHO, b"").strip() in (b"1", b"true")
+    if not pedido:
+        pedido = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("perfil", [""])[0] in ("1", "true")
+    if not pedido:
+        return None
+
+    autorizacao = cabecalhos.get(b"authorization", b"").decode("latin-1")
+    if not autorizacao.lower().startswith("bearer "):
+        return None
+    try:
+        usuario = jwt.decode(autorizacao[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+    return usuario if pode_perfilar(usuario) else None
+
+
+# ======================================
+# MIDDLEWARE
+# ======================================
+class MiddlewarePerfilador:
+    """
+    Middleware ASGI puro, como o de métricas. Fora dos dois modos (pedido
+    por admin ou SYNTHETIS_PROFILE_SLOW_MS) não custa nada além de olhar
+    os cabeçalhos.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._em_andamento = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usuario = _solicitante(scope) if PROFILE_ADMINS else None
+        automatico = PROFILE_SLOW_MS > 0 and not scope["path"].startswith(IGNORADAS)
+        if usuario is None and not automatico:
+            await self.app(scope, receive, send)
+            return
+
+        coleta = _Coleta(detalhado=usuario is not None)
+        perfil_id = perfis.proximo_id() if usuario is not None else None
+        status = 500
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                if perfil_id is not None:
+                    mensagem = {**mensagem, "headers": [
+                        *mensagem.get("headers", []), (CABECALHO_ID, str(perfil_id).encode())
+                    ]}
+            await send(mensagem)
+
+        perfil = None
+        if coleta.detalhado and _cprofile_ocupado.acquire(blocking=False):
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:  # outro profiler ativo na thread
+                _cprofile_ocupado.release()
+                perfil = None
+
+        self._em_andamento += 1
+        concorrentes = self._em_andamento
+        token = _coleta.set(coleta)
+        amostrador.iniciar()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            fim = time.perf_counter()
+            amostrador.parar()
+            _coleta.reset(token)
+            concorrentes = max(concorrentes, self._em_andamento)
+            self._em_andamento -= 1
+            if perfil is not None:
+                perfil.disable()
+                _cprofile_ocupado.release()
+
+            duracao = fim - inicio
+            if usuario is not None or duracao * 1000 >= PROFILE_SLOW_MS:
+                self._guardar(scope, coleta, perfil, perfil_id, usuario, status,
+                              inicio, fim, concorrentes)
+
+    def _guardar(self, scope, coleta, perfil, perfil_id, usuario, status, inicio, fim, concorrentes):
+        estatisticas = None
+        if perfil is not None or coleta.estatisticas_filhos:
+            juntas = pstats.Stats(perfil) if perfil is not None else pstats.Stats(_Estatisticas(coleta.estatisticas_filhos.pop()))
+            for filho in coleta.estatisticas_filhos:
+                juntas.add(_Estatisticas(filho))
+            estatisticas = juntas.stats
+
+        perfis.guardar(Perfil(
+            id=perfil_id or perfis.proximo_id(),
+            motivo="solicitado" if usuario is not None else "lento",
+            usuario=usuario,
+            rota=getattr(scope.get("route"), "path", scope["path"]),
+            metodo=scope["method"],
+            status=status,
+            duracao=fim - inicio,
+            anotacoes=coleta.anotacoes,
+            concorrentes=concorrentes,
+            pilhas=amostrador.recortar(inicio, fim) + coleta.pilhas_filhos,
+            estatisticas=estatisticas,
+        ))
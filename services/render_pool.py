@@ -0,0 +1,200 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from docx import Document
+
+from core.config import RENDER_WORKERS, RENDER_MAX_TASKS_PER_CHILD, RENDER_MAX_QUEUE
+from database import engine, SessionLocal
+from models.modelo import Modelo
+from services import metricas, perfilador
+from services.metricas import etapa
+from services.manifesto import gerar_manifesto
+from services.pacote import salvar_documento, nomes_partes
+from services.renderizador import (
+    PLACEHOLDER_RE, aplicar_substituicoes, substituir_imagens_pendentes, mapear_pendentes, percorrer_paragrafos,
+)
+from services.template_cache import cache_modelos
+
+
+class FilaRenderizacaoCheia(Exception):
+    """Todas as vagas de renderização (em execução + fila) estão ocupadas."""
+
+
+# ======================================
+# TAREFAS (executadas nos processos filhos)
+# ======================================
+def _iniciar_processo():
+    # conexões herdadas do processo principal (fork) não podem ser usadas aqui
+    engine.dispose(close=False)
+
+
+def _ler_documento_modelo(modelo_id, atualizado_em) -> bytes:
+    sessao = SessionLocal()
+    try:
+        linha = sessao.query(Modelo.documento_modelo, Modelo.atualizado_em).filter(Modelo.id == modelo_id).first()
+    finally:
+        sessao.close()
+    # a versão é conferida aqui (e não no WHERE): no SQLite o TIMESTAMP é comparado como texto
+    if linha is None or linha.atualizado_em != atualizado_em:
+        raise LookupError(f"versão {atualizado_em} do modelo {modelo_id} não está mais no banco")
+    return linha.documento_modelo
+
+
+def _salvar(doc, origem, originais: dict, tocadas: set) -> bytes:
+    # só as partes alteradas são compactadas; o resto sai
+    # byte a byte do pacote de origem
+    with etapa("salvar"):
+        return salvar_documento(doc, origem, originais, tocadas)
+
+
+def _medido(funcao, enviado_em: float, perfil: str | None, *args):
+    """
+    Executa `funcao` no processo filho e devolve (resultado, etapas, perfil):
+    as durações medidas lá dentro voltam para o registro do processo
+    principal e, se a requisição está sendo perfilada (`perfil` =
+    "amostrar"/"detalhado"), as pilhas/pstats voltam para o perfilador.
+    """
+    perfil_filho = None
+    with metricas.coletar() as etapas:
+        metricas.registrar_etapa("fila", max(0.0, time.time() - enviado_em))
+        if perfil is None:
+            resultado = funcao(*args)
+        else:
+            resultado, perfil_filho = perfilador.perfilar_chamada(funcao, args, perfil == "detalhado")
+    return resultado, etapas, perfil_filho
+
+
+def renderizar_relatorio(modelo_id, atualizado_em, documento_modelo: str | bytes, dados: dict,
+                         pendencias: list[dict], chavePendencia: str, anexos: dict = None) -> tuple[bytes, dict]:
+    """
+    Renderiza o modelo com os dados do relatório. Devolve o .docx em bytes
+    e o mapa dos placeholders que ficaram pendentes (mapear_pendentes).
+    O cache de modelos compilados é o do próprio processo filho;
+    `documento_modelo` é o caminho no cache em disco (services.cache_blobs)
+    ou, com ele desligado, os bytes.
+    """
+    try:
+        compilado = cache_modelos.obter(modelo_id, atualizado_em, lambda: documento_modelo)
+    except FileNotFoundError:
+        # o cache em disco despejou o arquivo depois que o processo principal
+        # o encontrou: o BLOB é lido de novo do banco
+        compilado = cache_modelos.obter(
+            modelo_id, atualizado_em, lambda: _ler_documento_modelo(modelo_id, atualizado_em)
+        )
+
+    with etapa("instanciar"):
+        doc, locais = compilado.instanciar()
+
+    # inclui a etapa "imagens" (decodificação e redução das fotos)
+    with etapa("substituicao"):
+        aplicar_substituicoes(locais, dados, pendencias, chavePendencia, anexos)
+
+    conteudo = _salvar(doc, compilado.abrir_pacote(), compilado.partes, compilado.tocadas)
+
+    with etapa("mapear_pendentes"):
+        return conteudo, mapear_pendentes(doc)
+
+
+def resolver_relatorio(documento: bytes, imagens: dict) -> tuple[bytes, dict]:
+    """
+    Substitui as imagens pendentes de um relatório já gerado, reabrindo o
+    documento inteiro (relatórios sem mapa de pendências).
+    """
+    with etapa("abrir_documento"):
+        doc = Document(BytesIO(documento))
+        originais = nomes_partes(doc)
+        tocadas = {
+            parte.partname.membername
+            for _, parte, p in percorrer_paragrafos(doc) if PLACEHOLDER_RE.search(p.text)
+        }
+
+    with etapa("substituicao"):
+        substituir_imagens_pendentes(doc, imagens)
+
+    conteudo = _salvar(doc, documento, originais, tocadas)
+
+    with etapa("mapear_pendentes"):
+        return conteudo, mapear_pendentes(doc)
+
+
+# ======================================
+# EXECUTOR
+# ======================================
+class ExecutorRenderizacao:
+    """
+    ProcessPoolExecutor criado sob demanda, com limite de tarefas
+    simultâneas (em execução + aguardando na fila).
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS,
+                 max_tarefas_por_processo: int = RENDER_MAX_TASKS_PER_CHILD,
+                 max_fila: int = RENDER_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_tarefas_por_processo = max_tarefas_por_processo or None
+        self.max_fila = max_fila
+        self._executor = None
+        self._em_andamento = 0
+
+    @property
+    def em_andamento(self) -> int:
+        return self._em_andamento
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                max_tasks_per_child=self.max_tarefas_por_processo,
+                initializer=_iniciar_processo,
+            )
+        return self._executor
+
+    async def executar(self, funcao, *args):
+        if self._em_andamento >= self.workers + self.max_fila:
+            raise FilaRenderizacaoCheia()
+
+        coleta = perfilador.coleta_atual()
+
+        self._em_andamento += 1
+        try:
+            loop = asyncio.get_running_loop()
+            resultado, etapas, perfil_filho = await loop.run_in_executor(
+                self._pool(), _medido, funcao, time.time(),
+                coleta.modo_filho if coleta is not None else None, *args
+            )
+        except BrokenProcessPool:
+            # um processo filho morreu: descarta o pool para recriar na próxima chamada
+            self._executor = None
+            raise
+        finally:
+            self._em_andamento -= 1
+
+        for nome, duracao in etapas:
+            metricas.etapa_segundos.observar(duracao, etapa=nome)
+        if perfil_filho is not None:
+            coleta.incorporar(perfil_filho)
+        return resultado
+
+    async def renderizar(self, *args) -> tuple[bytes, dict]:
+        return await self.executar(renderizar_relatorio, *args)
+
+    async def resolver(self, *args) -> tuple[bytes, dict]:
+        return await self.executar(resolver_relatorio, *args)
+
+    async def manifesto(self, *args) -> dict:
+        return await self.executar(gerar_manifesto, *args)
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+executor_renderizacao = ExecutorRenderizacao()
+
+metricas.registro.registrar(metricas.Medidor(
+    "synthetis_render_em_andamento", "Renderizações em execução ou aguardando no pool.",
+    funcao=lambda: {(): executor_renderizacao.em_andamento},
+))
@@ -0,0 +1,322 @@
+import re
+from base64 import b64decode
+from io import BytesIO
+from types import SimpleNamespace
+
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.shared import Pt, Cm
+from docx.text.paragraph import Paragraph
+
+from services.imagens import preparar_imagens
+from services.metricas import etapa
+
+PLACEHOLDER_RE = re.compile(r"\{\{(.*?)\}\}")
+
+# Onde o parágrafo está no documento (define a formatação aplicada na substituição)
+CORPO = "corpo"
+TABELA = "tabela"
+CABECALHO = "cabecalho"
+CABECALHO_TABELA = "cabecalho_tabela"
+
+VALORES_VAZIOS = [None, "", " ", "null"]
+
+# Valor que aponta para um arquivo enviado no multipart: "arquivo:<campo>"
+PREFIXO_ARQUIVO = "arquivo:"
+
+_W_P = qn("w:p")
+_W_TBL = qn("w:tbl")
+_W_TR = qn("w:tr")
+_W_TC = qn("w:tc")
+
+
+# =========================
+# UTILITÁRIOS
+# =========================
+def is_base64_image(value: str) -> bool:
+    return isinstance(value, str) and value.startswith("data:image") and ";base64," in value
+
+
+def decode_base64_image(data_url: str) -> BytesIO:
+    base64_str = re.sub(r"^data:image/\w+;base64,", "", data_url)
+    image_bytes = b64decode(base64_str)
+    return BytesIO(image_bytes)
+
+
+def referencia_arquivo(value) -> str | None:
+    if isinstance(value, str) and value.startswith(PREFIXO_ARQUIVO):
+        return value[len(PREFIXO_ARQUIVO):]
+    return None
+
+
+def is_image_value(value, anexos: dict = None) -> bool:
+    """
+    Imagem em base64 ou referência a um arquivo enviado junto (multipart).
+    """
+    if is_base64_image(value):
+        return True
+    return bool(anexos) and referencia_arquivo(value) in anexos
+
+
+def clear_paragraph(paragraph):
+    for run in paragraph.runs:
+        paragraph._element.remove(run._element)
+
+
+def preparar_imagens_payload(valores, anexos: dict = None) -> dict:
+    """
+    {valor: bytes} com as imagens já reduzidas/recomprimidas. Arquivos
+    do multipart são lidos direto, sem passar por base64.
+    """
+    def decodificar(valor):
+        nome = referencia_arquivo(valor)
+        if nome is not None:
+            return anexos[nome]
+        return decode_base64_image(valor).getvalue()
+
+    return preparar_imagens(
+        [v for v in valores if is_image_value(v, anexos)],
+        decodificar,
+    )
+
+
+# ======================================
+# PERCURSO ÚNICO DO DOCUMENTO
+# ======================================
+def _percorrer_bloco(elemento, contexto, contexto_tabela):
+    """
+    Parágrafos de um bloco (body, hdr, ftr, tc) em ordem de documento,
+    descendo em tabelas e tabelas aninhadas.
+    """
+    for filho in elemento.iterchildren(_W_P, _W_TBL):
+        if filho.tag == _W_P:
+            yield contexto, filho
+            continue
+
+        for linha in filho.iterchildren(_W_TR):
+            for celula in linha.iterchildren(_W_TC):
+                yield from _percorrer_bloco(celula, contexto_tabela, contexto_tabela)
+
+
+def percorrer_paragrafos(doc):
+    """
+    Uma única passada por corpo, tabelas (inclusive aninhadas),
+    cabeçalhos e rodapés. Gera (contexto, parte, elemento w:p).
+    """
+    for contexto, p in _percorrer_bloco(doc.element.body, CORPO, TABELA):
+        yield contexto, doc.part, p
+
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.reltype not in (RT.HEADER, RT.FOOTER):
+            continue
+
+        parte = rel.target_part
+        for contexto, p in _percorrer_bloco(parte.element, CABECALHO, CABECALHO_TABELA):
+            yield contexto, parte, p
+
+
+def paragrafo(elemento, parte) -> Paragraph:
+    return Paragraph(elemento, SimpleNamespace(part=parte))
+
+
+def caminho_elemento(elemento, raiz) -> tuple:
+    """
+    Caminho de índices de filhos da raiz da parte até o elemento.
+    """
+    caminho = []
+    while elemento is not raiz:
+        pai = elemento.getparent()
+        caminho.append(pai.index(elemento))
+        elemento = pai
+    return tuple(reversed(caminho))
+
+
+def resolver_caminho(raiz, caminho):
+    elemento = raiz
+    for i in caminho:
+        elemento = elemento[i]
+    return elemento
+
+
+# ======================================
+# SUBSTITUIÇÃO (TEXTO / IMAGEM / PENDÊNCIAS)
+# ======================================
+def _substituir_texto(paragraph, contexto, textos: dict):
+    atual = paragraph.text
+
+    novo = PLACEHOLDER_RE.sub(
+        lambda m: str(textos[m.group(1)]) if m.group(1) in textos else m.group(0),
+        atual,
+    )
+
+    if novo == atual:
+        return
+
+    paragraph.text = novo
+
+    if contexto in (TABELA, CABECALHO_TABELA):
+        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    else:
+        paragraph.style.font.size = Pt(10)
+
+    for run in paragraph.runs:
+        run.font.size = Pt(10)
+
+
+def _inserir_pendencias(paragraph, pendencias: list[dict], imagens_prontas: dict):
+    clear_paragraph(paragraph)
+
+    if not pendencias:
+        paragraph.add_run("Nenhuma pendência relatada.\n")
+        return
+
+    for idx, pendencia in enumerate(pendencias, 1):
+        titulo = pendencia.get("titulo", "Sem título")
+        descricao = pendencia.get("descriçao") or pendencia.get("descricao") or ""
+        imagem = pendencia.get("imagem")
+
+        # título
+        par_titulo = paragraph.insert_paragraph_before(f"{idx}. {titulo}")
+        par_titulo.runs[0].bold = True
+        par_titulo.runs[0].font.size = Pt(10)
+
+        # descrição
+        if descricao:
+            par_desc = paragraph.insert_paragraph_before(descricao)
+            par_desc.runs[0].font.size = Pt(10)
+
+        # imagem
+        if isinstance(imagem, str) and imagem in imagens_prontas:
+            par_img = paragraph.insert_paragraph_before()
+            run_img = par_img.add_run()
+            run_img.add_picture(BytesIO(imagens_prontas[imagem]), width=Cm(10))
+
+
+def aplicar_substituicoes(locais: list, dados: dict, pendencias: list[dict] = None,
+                          chavePendencia: str = None, anexos: dict = None):
+    """
+    Aplica dados e pendências aos parágrafos indexados, um parágrafo por vez.
+
+    `locais` é a lista de (contexto, Paragraph, chaves) devolvida por
+    ModeloCompilado.instanciar(). Para cada parágrafo a ordem é a mesma
+    de sempre: textos, depois imagem e, por último, as pendências.
+
+    `anexos` são os arquivos do multipart ({campo: bytes}), referenciados
+    nos valores como "arquivo:<campo>".
+    """
+    ordem = {key: i for i, key in enumerate(dados)}
+
+    # corpo/tabelas ignoram valores vazios; cabeçalho/rodapé não
+    textos_corpo = {
+        key: value for key, value in dados.items()
+        if value not in VALORES_VAZIOS and not is_image_value(value, anexos)
+    }
+    textos_cabecalho = {
+        key: value for key, value in dados.items()
+        if not is_image_value(value, anexos)
+    }
+    imagens = {key: value for key, value in dados.items() if is_image_value(value, anexos)}
+
+    # todas as fotos usadas no modelo (dados + pendências) processadas de uma vez, em paralelo
+    usadas = {key for _, _, chaves in locais for key in chaves}
+    with etapa("imagens"):
+        imagens_prontas = preparar_imagens_payload([
+            *(value for key, value in imagens.items() if key in usadas),
+            *(p.get("imagem") for p in (pendencias or []) if chavePendencia in usadas),
+        ], anexos)
+
+    for contexto, paragraph, chaves in locais:
+        cabecalho = contexto in (CABECALHO, CABECALHO_TABELA)
+        textos = textos_cabecalho if cabecalho else textos_corpo
+
+        if any(key in textos for key in chaves):
+            _substituir_texto(paragraph, contexto, textos)
+
+        if cabecalho:
+            continue
+
+        # só a primeira imagem (na ordem de `dados`) ocupa o parágrafo
+        chaves_imagem = [key for key in chaves if key in imagens]
+        if chaves_imagem:
+            key = min(chaves_imagem, key=ordem.get)
+            if f"{{{{{key}}}}}" in paragraph.text:
+                clear_paragraph(paragraph)
+                run = paragraph.add_run()
+                run.add_picture(BytesIO(imagens_prontas[imagens[key]]), height=Cm(10))
+
+    if not chavePendencia:
+        return
+
+    # pendências vão na primeira ocorrência do corpo; senão, na primeira das tabelas
+    placeholder = f"{{{{{chavePendencia}}}}}"
+    candidatos = sorted(
+        (
+            (0 if contexto == CORPO else 1, i, paragraph)
+            for i, (contexto, paragraph, chaves) in enumerate(locais)
+            if chavePendencia in chaves and contexto in (CORPO, TABELA)
+        ),
+        key=lambda c: c[:2],
+    )
+
+    for _, _, paragraph in candidatos:
+        if placeholder in paragraph.text:
+            _inserir_pendencias(paragraph, pendencias or [], imagens_prontas)
+            return
+
+
+def substituir_imagens_pendentes(doc, imagens: dict):
+    """
+    Resolução de pendências: troca os placeholders de imagem ainda
+    presentes no corpo e nas tabelas pelas imagens enviadas.
+    """
+    ordem = {chave: i for i, chave in enumerate(imagens)}
+    alvos = []
+
+    for contexto, parte, p in percorrer_paragrafos(doc):
+        if contexto not in (CORPO, TABELA):
+            continue
+
+        paragraph = paragrafo(p, parte)
+        chaves = [
+            chave for chave in PLACEHOLDER_RE.findall(paragraph.text)
+            if is_base64_image(imagens.get(chave))
+        ]
+
+        # uma imagem por parágrafo, a primeira na ordem de `imagens`
+        if chaves:
+            alvos.append((paragraph, imagens[min(chaves, key=ordem.get)]))
+
+    with etapa("imagens"):
+        imagens_prontas = preparar_imagens_payload(imagem for _, imagem in alvos)
+
+    for paragraph, imagem in alvos:
+        clear_paragraph(paragraph)
+        run = paragraph.add_run()
+        run.add_picture(BytesIO(imagens_prontas[imagem]), height=Cm(10))
+
+
+def mapear_pendentes(doc) -> dict:
+    """
+    Onde ficaram os placeholders não resolvidos do corpo e das tabelas:
+
+        {"foto": [{"parte": "/word/document.xml", "caminho": [0, 12]}]}
+
+    Gravado junto do relatório, permite resolver as pendências depois sem
+    reabrir o documento inteiro (services.pacote).
+    """
+    mapa = {}
+
+    for contexto, parte, p in percorrer_paragrafos(doc):
+        if contexto not in (CORPO, TABELA):
+            continue
+
+        chaves = PLACEHOLDER_RE.findall(paragrafo(p, parte).text)
+        if not chaves:
+            continue
+
+        local = {"parte": str(parte.partname), "caminho": list(caminho_elemento(p, parte.element))}
+        for chave in dict.fromkeys(chaves):
+            mapa.setdefault(chave, []).append(local)
+
+    return mapa
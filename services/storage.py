@@ -0,0 +1,345 @@
+import gzip
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from io import BytesIO
+from uuid import uuid4
+
+from core.config import STORAGE_BACKEND, STORAGE_ROOT, STORAGE_COLD_ROOT
+
+
+class ArquivoNaoEncontrado(Exception):
+    """A chave não existe no armazenamento."""
+
+
+class Armazenamento:
+    """
+    Interface do armazenamento de relatórios. `Relatorio.caminho_arquivo`
+    guarda a chave devolvida por `gravar()`.
+    """
+
+    def gravar(self, conteudo: bytes, extensao: str = ".docx") -> str:
+        raise NotImplementedError
+
+    def gravar_arquivo(self, origem, extensao: str = ".docx") -> str:
+        """Como `gravar`, lendo de um arquivo binário aberto (a partir do início)."""
+        origem.seek(0)
+        return self.gravar(origem.read(), extensao)
+
+    def ler(self, chave: str) -> bytes:
+        raise NotImplementedError
+
+    def abrir(self, chave: str):
+        """Arquivo binário aberto para leitura (quem chama fecha)."""
+        raise NotImplementedError
+
+    def existe(self, chave: str) -> bool:
+        raise NotImplementedError
+
+    def metadados(self, chave: str) -> tuple[int, float]:
+        """(tamanho em bytes, data de modificação em epoch)."""
+        raise NotImplementedError
+
+    def remover(self, chave: str):
+        raise NotImplementedError
+
+    def listar(self):
+        """
+        Gera (chave, data de modificação em epoch, está na camada fria)
+        para tudo que está gravado.
+        """
+        raise NotImplementedError
+
+    def normalizar(self, chave: str) -> str:
+        """Forma canônica da chave, para comparar com o que `listar()` gera."""
+        return chave
+
+    # camada fria (opcional): relatórios antigos guardados compactados,
+    # ainda lidos normalmente por `abrir()`/`ler()`
+    suporta_camada_fria = False
+
+    def congelar(self, chave: str):
+        raise NotImplementedError
+
+    @staticmethod
+    def nova_chave(extensao: str = ".docx") -> str:
+        return f"{uuid4().hex}{extensao}"
+
+
+# ======================================
+# DISCO LOCAL (subpastas por hash)
+# ======================================
+class ArmazenamentoLocal(Armazenamento):
+    """
+    Grava em <raiz>/ab/cd/<chave>, com ab/cd tirados do SHA-1 da chave,
+    para nenhuma pasta acumular centenas de milhares de arquivos.
+
+    Chaves que já são caminhos absolutos (relatórios antigos, de antes do
+    armazenamento por chave) continuam sendo lidas de onde estão.
+
+    A camada fria fica em <raiz_fria>/ab/cd/<chave>.gz; `abrir()` procura
+    primeiro na quente e, se o arquivo foi congelado, descompacta para um
+    temporário (com descritor, seek e Range funcionando como antes).
+    Relatórios antigos, de caminho absoluto, não vão para a camada fria.
+    """
+
+    suporta_camada_fria = True
+
+    def __init__(self, raiz: str = STORAGE_ROOT, raiz_fria: str = STORAGE_COLD_ROOT):
+        self.raiz = raiz
+        self.raiz_fria = raiz_fria
+
+    def caminho(self, chave: str) -> str:
+        if os.path.isabs(chave):
+            return chave
+
+        h = hashlib.sha1(chave.encode()).hexdigest()
+        return os.path.join(self.raiz, h[:2], h[2:4], chave)
+
+    def caminho_frio(self, chave: str) -> str | None:
+        if os.path.isabs(chave):
+            return None
+
+        h = hashlib.sha1(chave.encode()).hexdigest()
+        return os.path.join(self.raiz_fria, h[:2], h[2:4], f"{chave}.gz")
+
+    def gravar(self, conteudo: bytes, extensao: str = ".docx") -> str:
+        return self._gravar(lambda f: f.write(conteudo), extensao)
+
+    def gravar_arquivo(self, origem, extensao: str = ".docx") -> str:
+        # copia em blocos, sem carregar o arquivo inteiro na memória
+        origem.seek(0)
+        return self._gravar(lambda f: shutil.copyfileobj(origem, f, 1024 * 1024), extensao)
+
+    def _gravar(self, escrever, extensao: str) -> str:
+        chave = self.nova_chave(extensao)
+        destino = self.caminho(chave)
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+
+        # escreve num temporário da mesma pasta e troca de nome: quem lê
+        # nunca encontra um arquivo pela metade
+        fd, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                escrever(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, destino)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+        return chave
+
+    def ler(self, chave: str) -> bytes:
+        with self.abrir(chave) as f:
+            return f.read()
+
+    def abrir(self, chave: str):
+        try:
+            return open(self.caminho(chave), "rb")
+        except FileNotFoundError:
+            pass
+
+        frio = self.caminho_frio(chave)
+        try:
+            if frio is None:
+                raise FileNotFoundError(chave)
+            compactado = gzip.open(frio, "rb")
+        except FileNotFoundError:
+            raise ArquivoNaoEncontrado(chave)
+
+        with compactado:
+            arquivo = tempfile.TemporaryFile()
+            try:
+                shutil.copyfileobj(compactado, arquivo, 1024 * 1024)
+            except BaseException:
+                arquivo.close()
+                raise
+        arquivo.seek(0)
+        return arquivo
+
+    def existe(self, chave: str) -> bool:
+        frio = self.caminho_frio(chave)
+        return os.path.exists(self.caminho(chave)) or (frio is not None and os.path.exists(frio))
+
+    def metadados(self, chave: str) -> tuple[int, float]:
+        try:
+            info = os.stat(self.caminho(chave))
+            return info.st_size, info.st_mtime
+        except FileNotFoundError:
+            pass
+
+        frio = self.caminho_frio(chave)
+        try:
+            if frio is None:
+                raise FileNotFoundError(chave)
+            with open(frio, "rb") as f:
+                info = os.fstat(f.fileno())
+                # tamanho original: últimos 4 bytes do gzip (ISIZE, módulo 2**32)
+                f.seek(-4, os.SEEK_END)
+                tamanho = struct.unpack("<I", f.read(4))[0]
+        except FileNotFoundError:
+            raise ArquivoNaoEncontrado(chave)
+
+        # congelar() preserva a data de modificação do original
+        return tamanho, info.st_mtime
+
+    def remover(self, chave: str):
+        removido = False
+        for caminho in (self.caminho(chave), self.caminho_frio(chave)):
+            if caminho is None:
+                continue
+            try:
+                os.remove(caminho)
+                removido = True
+            except FileNotFoundError:
+                pass
+
+        if not removido:
+            raise ArquivoNaoEncontrado(chave)
+
+    def congelar(self, chave: str):
+        """
+        Move o arquivo para a camada fria, compactado. Enquanto a cópia é
+        feita o original continua sendo servido; ele só é removido depois
+        que o .gz está completo.
+        """
+        destino = self.caminho_frio(chave)
+        if destino is None:
+            raise ValueError(f"Relatório antigo (caminho absoluto) não vai para a camada fria: {chave}")
+
+        origem = self.caminho(chave)
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+
+        try:
+            entrada = open(origem, "rb")
+        except FileNotFoundError:
+            raise ArquivoNaoEncontrado(chave)
+
+        with entrada:
+            info = os.fstat(entrada.fileno())
+            fd, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    with gzip.GzipFile(fileobj=f, mode="wb", mtime=int(info.st_mtime)) as saida:
+                        shutil.copyfileobj(entrada, saida, 1024 * 1024)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.utime(temporario, (info.st_atime, info.st_mtime))
+                os.replace(temporario, destino)
+            except BaseException:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+                raise
+
+        os.remove(origem)
+
+    def normalizar(self, chave: str) -> str:
+        if os.path.isabs(chave):
+            return os.path.normcase(os.path.abspath(chave))
+        return chave
+
+    def _chave_de(self, pasta: str, nome: str, raiz: str) -> str:
+        """
+        Chave de um arquivo encontrado no disco: o próprio nome quando está
+        na subpasta que o hash dele indica; senão, o caminho absoluto
+        (relatórios antigos e temporários de gravações interrompidas).
+        """
+        h = hashlib.sha1(nome.encode()).hexdigest()
+        if os.path.normcase(pasta) == os.path.normcase(os.path.join(raiz, h[:2], h[2:4])):
+            return nome
+        return self.normalizar(os.path.join(pasta, nome))
+
+    def listar(self):
+        fria = os.path.normcase(os.path.abspath(self.raiz_fria))
+
+        for pasta, subpastas, arquivos in os.walk(self.raiz):
+            # a camada fria pode estar dentro da raiz quente
+            subpastas[:] = [
+                d for d in subpastas
+                if os.path.normcase(os.path.abspath(os.path.join(pasta, d))) != fria
+            ]
+            for nome in arquivos:
+                try:
+                    modificado_em = os.stat(os.path.join(pasta, nome)).st_mtime
+                except FileNotFoundError:
+                    continue
+                yield self._chave_de(pasta, nome, self.raiz), modificado_em, False
+
+        for pasta, _, arquivos in os.walk(self.raiz_fria):
+            for nome in arquivos:
+                caminho = os.path.join(pasta, nome)
+                try:
+                    modificado_em = os.stat(caminho).st_mtime
+                except FileNotFoundError:
+                    continue
+
+                if nome.endswith(".gz") and self._chave_de(pasta, nome[:-3], self.raiz_fria) == nome[:-3]:
+                    yield nome[:-3], modificado_em, True
+                else:
+                    # temporário de um congelamento interrompido
+                    yield self.normalizar(caminho), modificado_em, True
+
+
+# ======================================
+# MEMÓRIA (testes)
+# ======================================
+class ArmazenamentoMemoria(Armazenamento):
+
+    def __init__(self):
+        self._arquivos: dict[str, bytes] = {}
+        self._modificados: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def gravar(self, conteudo: bytes, extensao: str = ".docx") -> str:
+        chave = self.nova_chave(extensao)
+        with self._lock:
+            self._arquivos[chave] = bytes(conteudo)
+            self._modificados[chave] = time.time()
+        return chave
+
+    def ler(self, chave: str) -> bytes:
+        try:
+            return self._arquivos[chave]
+        except KeyError:
+            raise ArquivoNaoEncontrado(chave)
+
+    def abrir(self, chave: str):
+        return BytesIO(self.ler(chave))
+
+    def existe(self, chave: str) -> bool:
+        return chave in self._arquivos
+
+    def metadados(self, chave: str) -> tuple[int, float]:
+        return len(self.ler(chave)), self._modificados[chave]
+
+    def remover(self, chave: str):
+        with self._lock:
+            if self._arquivos.pop(chave, None) is None:
+                raise ArquivoNaoEncontrado(chave)
+            self._modificados.pop(chave, None)
+
+    def listar(self):
+        with self._lock:
+            itens = list(self._modificados.items())
+        for chave, modificado_em in itens:
+            yield chave, modificado_em, False
+
+
+def criar_armazenamento(backend: str = STORAGE_BACKEND) -> Armazenamento:
+    if backend == "memoria":
+        return ArmazenamentoMemoria()
+    if backend == "local":
+        return ArmazenamentoLocal()
+    raise ValueError(f"Backend de armazenamento desconhecido: {backend}")
+
+
+armazenamento = criar_armazenamento()
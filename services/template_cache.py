@@ -0,0 +1,150 @@
+import copy
+import threading
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+from docx import Document
+
+from core.config import TEMPLATE_CACHE_MAX_BYTES
+from services.cache_blobs import mapear_arquivo
+from services.pacote import nomes_partes
+from services.metricas import etapa
+from services.renderizador import (
+    PLACEHOLDER_RE, percorrer_paragrafos, paragrafo, caminho_elemento, resolver_caminho,
+)
+
+
+# ======================================
+# INDEXAÇÃO DOS PLACEHOLDERS
+# ======================================
+class ModeloCompilado:
+    """
+    Pacote .docx já carregado + índice de onde cada {{placeholder}} aparece.
+
+    O documento guardado aqui nunca é alterado: cada renderização trabalha
+    sobre uma cópia obtida em `instanciar()`.
+
+    Uso por processo, uma renderização por vez (processos do pool): o mmap
+    do pacote tem uma posição de leitura só.
+    """
+
+    def __init__(self, documento):
+        # bytes ou arquivo binário com seek; o mmap do cache em disco é
+        # guardado como está (páginas compartilhadas entre os processos)
+        if isinstance(documento, (bytes, bytearray)):
+            self.pacote = bytes(documento)
+        else:
+            self.pacote = documento
+
+        self.documento = Document(self.abrir_pacote())
+        # partes (e assinaturas) copiadas sem recompactar se não mudarem (services.pacote.salvar_documento)
+        self.partes = nomes_partes(self.documento)
+
+        with zipfile.ZipFile(self.abrir_pacote()) as pacote:
+            self.tamanho = sum(info.file_size for info in pacote.infolist()) + len(self.pacote)
+
+        # [(contexto, nome da parte, caminho do parágrafo, chaves)] em ordem de documento
+        self.indice: list[tuple[str, str, tuple, tuple]] = []
+        # partes XML que a renderização pode alterar (as que têm placeholder)
+        self.tocadas: set = set()
+
+        for contexto, parte, p in percorrer_paragrafos(self.documento):
+            chaves = PLACEHOLDER_RE.findall(p.text)
+            if not chaves:
+                continue
+
+            self.tocadas.add(parte.partname.membername)
+            self.indice.append((
+                contexto,
+                str(parte.partname),
+                caminho_elemento(p, parte.element),
+                tuple(dict.fromkeys(chaves)),
+            ))
+
+    def abrir_pacote(self):
+        """O .docx original como arquivo binário, do início."""
+        if isinstance(self.pacote, bytes):
+            return BytesIO(self.pacote)
+        self.pacote.seek(0)
+        return self.pacote
+
+    def instanciar(self):
+        """
+        Retorna (doc, locais): uma cópia independente do documento e a lista
+        de (contexto, Paragraph, chaves) já apontando para a cópia.
+        """
+        doc = copy.deepcopy(self.documento)
+        partes = {str(p.partname): p for p in doc.part.package.iter_parts()}
+
+        locais = [
+            (
+                contexto,
+                paragrafo(resolver_caminho(partes[nome_parte].element, caminho), partes[nome_parte]),
+                chaves,
+            )
+            for contexto, nome_parte, caminho, chaves in self.indice
+        ]
+
+        return doc, locais
+
+
+# ======================================
+# CACHE LRU (POR PROCESSO)
+# ======================================
+class CacheModelos:
+    """
+    Cache LRU de ModeloCompilado, chaveado por (modelo_id, atualizado_em)
+    e limitado pelo tamanho descompactado dos pacotes.
+    """
+
+    def __init__(self, limite_bytes: int = TEMPLATE_CACHE_MAX_BYTES):
+        self.limite_bytes = limite_bytes
+        self._entradas: OrderedDict = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def obter(self, modelo_id, atualizado_em, carregar) -> ModeloCompilado:
+        """
+        Devolve o modelo compilado; `carregar()` só é chamado em caso de miss
+        e deve retornar os bytes do .docx ou o caminho dele no cache em
+        disco (services.cache_blobs), que é lido por mmap.
+        """
+        chave = (modelo_id, atualizado_em)
+
+        with self._lock:
+            compilado = self._entradas.get(chave)
+            if compilado is not None:
+                self._entradas.move_to_end(chave)
+                return compilado
+
+        with etapa("compilar_modelo"):
+            origem = carregar()
+            if isinstance(origem, str):
+                # o mapeamento fica com o modelo compilado enquanto ele estiver no cache
+                compilado = ModeloCompilado(mapear_arquivo(origem))
+            else:
+                compilado = ModeloCompilado(origem)
+
+        with self._lock:
+            # versões antigas do mesmo modelo não serão mais pedidas
+            for antiga in [c for c in self._entradas if c[0] == modelo_id and c != chave]:
+                self._total -= self._entradas.pop(antiga).tamanho
+
+            if chave not in self._entradas:
+                self._entradas[chave] = compilado
+                self._total += compilado.tamanho
+
+            while self._total > self.limite_bytes and len(self._entradas) > 1:
+                _, removido = self._entradas.popitem(last=False)
+                self._total -= removido.tamanho
+
+            return self._entradas[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._total = 0
+
+
+cache_modelos = CacheModelos()
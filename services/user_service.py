@@ -1,24 +1,31 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.usuario import User
-from core.security import verify_password
+from core.security import verify_and_update_password
 
-def get_user_by_usuario(db: Session, usuario: str):
+async def get_user_by_usuario(db: AsyncSession, usuario: str):
     """
     Busca um usuário no banco pelo campo 'usuario'.
     """
-    return db.query(User).filter(User.usuario == usuario).first()
+    return (await db.execute(select(User).where(User.usuario == usuario))).scalars().first()
 
-def authenticate_user(db: Session, usuario: str, senha: str):
+async def authenticate_user(db: AsyncSession, usuario: str, senha: str):
     """
     Valida o login:
     1. Verifica se o usuário existe
-    2. Compara a senha informada com o hash no banco
+    2. Compara a senha informada com o hash no banco (pool de bcrypt)
+    3. Se o hash usa um custo diferente do atual, grava o hash refeito
     """
-    user = get_user_by_usuario(db, usuario)
+    user = await get_user_by_usuario(db, usuario)
     if not user:
         return None  # Usuário não encontrado
 
-    if not verify_password(senha, user.senha):
+    valida, novo_hash = await verify_and_update_password(senha, user.senha)
+    if not valida:
         return None  # Senha inválida
 
+    if novo_hash:
+        user.senha = novo_hash
+        await db.commit()
+
     return user  # Autenticação bem-sucedida
\ No newline at end of file
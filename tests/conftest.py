@@ -0,0 +1,77 @@
+"""
+Ambiente dos testes: SQLite num diretório temporário, armazenamento em
+memória e caches em disco isolados. As variáveis precisam estar definidas
+antes de qualquer import do projeto (database/core.config leem na carga).
+"""
+import os
+import sys
+import tempfile
+
+_PASTA = tempfile.mkdtemp(prefix="synthetis-testes-")
+
+os.environ["SYNTHETIS_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_PASTA, 'teste.db')}"
+os.environ["SYNTHETIS_STORAGE_BACKEND"] = "memoria"
+os.environ["SYNTHETIS_TEMPLATE_BLOB_CACHE_DIR"] = os.path.join(_PASTA, "modelos")
+os.environ["SYNTHETIS_DELTA_CACHE_DIR"] = os.path.join(_PASTA, "montados")
+os.environ["SYNTHETIS_RENDER_WORKERS"] = "1"
+os.environ.setdefault("SYNTHETIS_BCRYPT_ROUNDS", "4")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from io import BytesIO
+
+import pytest
+from docx import Document
+from fastapi.testclient import TestClient
+
+import main
+from core.security import create_access_token
+from database import Base, SessionLocal, engine
+from models.modelo import Modelo
+
+
+@pytest.fixture(autouse=True)
+def banco_limpo():
+    yield
+    with engine.begin() as conexao:
+        for tabela in reversed(Base.metadata.sorted_tables):
+            conexao.execute(tabela.delete())
+
+
+@pytest.fixture
+def sessao():
+    s = SessionLocal()
+    try:
+        yield s
+    finally:
+        s.close()
+
+
+@pytest.fixture(scope="session")
+def cliente():
+    # sem o lifespan: o pool de renderização só sobe nos testes que o usam
+    return TestClient(main.app)
+
+
+def autorizacao(usuario: str) -> dict:
+    return {"Authorization": "Bearer " + create_access_token({"sub": usuario})}
+
+
+def docx_modelo(*paragrafos: str) -> bytes:
+    documento = Document()
+    for texto in paragrafos:
+        documento.add_paragraph(texto)
+    saida = BytesIO()
+    documento.save(saida)
+    return saida.getvalue()
+
+
+@pytest.fixture
+def modelo(sessao) -> Modelo:
+    novo = Modelo(
+        titulo="Inspeção", equipe="E1", descriçao="teste", modelo_automacao="{}",
+        documento_modelo=docx_modelo("Olá {{nome}}", "{{foto}}"), termografia=False,
+    )
+    sessao.add(novo)
+    sessao.commit()
+    return novo
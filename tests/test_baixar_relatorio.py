@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from conftest import autorizacao
+from models.relatorio import Relatorio
+from services.storage import armazenamento
+
+CONTEUDO = os.urandom(1000)
+
+
+@pytest.fixture
+def relatorio(sessao) -> Relatorio:
+    novo = Relatorio(
+        modelo="Inspeção", emissor="ana", equipe="E1", nome_arquivo="Relatório Bomba",
+        caminho_arquivo=armazenamento.gravar(CONTEUDO),
+    )
+    sessao.add(novo)
+    sessao.commit()
+    return novo
+
+
+def baixar(cliente, relatorio, usuario="ana", **cabecalhos):
+    return cliente.get(
+        f"/app/baixarRelatorio/{relatorio.id}", headers={**autorizacao(usuario), **cabecalhos}
+    )
+
+
+def test_download_completo(cliente, relatorio):
+    resposta = baixar(cliente, relatorio)
+
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+    assert resposta.headers["content-length"] == str(len(CONTEUDO))
+    assert resposta.headers["accept-ranges"] == "bytes"
+    assert resposta.headers["etag"].startswith('"')
+    assert "filename*=UTF-8''Relat%C3%B3rio%20Bomba.docx" in resposta.headers["content-disposition"]
+
+
+def test_intervalos(cliente, relatorio):
+    parcial = baixar(cliente, relatorio, Range="bytes=10-19")
+    assert parcial.status_code == 206
+    assert parcial.content == CONTEUDO[10:20]
+    assert parcial.headers["content-range"] == f"bytes 10-19/{len(CONTEUDO)}"
+    assert parcial.headers["content-length"] == "10"
+
+    aberto = baixar(cliente, relatorio, Range="bytes=990-")
+    assert aberto.status_code == 206
+    assert aberto.content == CONTEUDO[990:]
+
+    sufixo = baixar(cliente, relatorio, Range="bytes=-5")
+    assert sufixo.status_code == 206
+    assert sufixo.content == CONTEUDO[-5:]
+
+    alem_do_fim = baixar(cliente, relatorio, Range="bytes=5000-")
+    assert alem_do_fim.status_code == 416
+    assert alem_do_fim.headers["content-range"] == f"bytes */{len(CONTEUDO)}"
+
+    # vários intervalos não são suportados: arquivo inteiro
+    varios = baixar(cliente, relatorio, Range="bytes=0-1,5-6")
+    assert varios.status_code == 200
+    assert varios.content == CONTEUDO
+
+
+def test_etag_e_if_range(cliente, relatorio):
+    etag = baixar(cliente, relatorio).headers["etag"]
+
+    nao_modificado = baixar(cliente, relatorio, **{"If-None-Match": etag})
+    assert nao_modificado.status_code == 304
+    assert nao_modificado.content == b""
+
+    assert baixar(cliente, relatorio, **{"If-None-Match": '"outro"'}).status_code == 200
+
+    mesmo = baixar(cliente, relatorio, Range="bytes=0-3", **{"If-Range": etag})
+    assert mesmo.status_code == 206
+    assert mesmo.content == CONTEUDO[:4]
+
+    # arquivo mudou desde o início do download: recomeça do zero
+    mudou = baixar(cliente, relatorio, Range="bytes=0-3", **{"If-Range": '"outro"'})
+    assert mudou.status_code == 200
+    assert mudou.content == CONTEUDO
+
+
+def test_so_o_emissor_baixa(cliente, relatorio):
+    assert baixar(cliente, relatorio, usuario="bia").status_code == 403
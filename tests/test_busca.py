@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import autorizacao
+from models.relatorio import Relatorio
+from models.usuario import User
+from services import busca
+
+
+@pytest.fixture
+def relatorios(sessao) -> dict:
+    sessao.add_all([
+        User(usuario="ana", senha="x", equipe="E1", acesso=1),
+        User(usuario="bia", senha="x", equipe="E1", acesso=1),
+        User(usuario="caio", senha="x", equipe="E2", acesso=1),
+    ])
+    criados = {}
+    for nome, emissor, equipe in [
+        ("Bomba Centrífuga 01", "ana", "E1"),
+        ("Bomba Submersa 02", "ana", "E2"),
+        ("Bomba de Incêndio 03", "bia", "E1"),
+        ("Bomba Dosadora 04", "caio", "E2"),
+    ]:
+        criados[nome] = Relatorio(
+            modelo="Inspeção", emissor=emissor, equipe=equipe, nome_arquivo=nome, caminho_arquivo="x.docx"
+        )
+        sessao.add(criados[nome])
+    sessao.commit()
+    return {nome: r.id for nome, r in criados.items()}
+
+
+def buscar(cliente, usuario: str, **params) -> set:
+    resposta = cliente.get("/app/relatorios/busca", params=params, headers=autorizacao(usuario))
+    assert resposta.status_code == 200
+    return {r["id"] for r in resposta.json()["relatorios"]}
+
+
+def test_busca_so_nos_relatorios_do_usuario(cliente, relatorios):
+    assert buscar(cliente, "ana", q="bomba") == {relatorios["Bomba Centrífuga 01"], relatorios["Bomba Submersa 02"]}
+    # outra equipe: só filtra os do próprio usuário, como recuperarRelatorios
+    assert buscar(cliente, "ana", q="bomba", equipe="E2") == {relatorios["Bomba Submersa 02"]}
+
+
+def test_equipe_nao_amplia_para_os_colegas(cliente, relatorios):
+    # bia e ana são da E1: a equipe continua só filtrando os próprios relatórios
+    assert buscar(cliente, "bia", q="bomba", equipe="E1") == {relatorios["Bomba de Incêndio 03"]}
+    assert buscar(cliente, "caio", q="centrifuga") == set()
+
+
+def test_prefixo_sem_acento_e_termo_curto(cliente, relatorios):
+    assert buscar(cliente, "bia", q="INCENDI") == {relatorios["Bomba de Incêndio 03"]}
+    # "de" é stopword e curto para o FULLTEXT do MySQL, mas continua obrigatório
+    assert buscar(cliente, "ana", q="bomba de") == set()
+    assert buscar(cliente, "bia", q="bomba de") == {relatorios["Bomba de Incêndio 03"]}
+
+
+def test_termos_fora_do_fulltext():
+    assert busca.indexado_fulltext("bomba")
+    assert not busca.indexado_fulltext("de")  # stopword
+    assert not busca.indexado_fulltext("ab")  # menor que innodb_ft_min_token_size
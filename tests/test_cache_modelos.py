@@ -0,0 +1,35 @@
+import os
+from io import BytesIO
+
+from docx import Document
+
+from services.cache_blobs import ArquivoMapeado, CacheBlobsModelo
+from services.render_pool import renderizar_relatorio
+from services.template_cache import cache_modelos
+
+
+def textos(conteudo: bytes) -> list[str]:
+    return [p.text for p in Document(BytesIO(conteudo)).paragraphs]
+
+
+def test_modelo_compilado_usa_o_mmap_sem_copiar(tmp_path, modelo):
+    blobs = CacheBlobsModelo(str(tmp_path), 10 * 1024 * 1024)
+    caminho = blobs.obter(modelo.id, modelo.atualizado_em, lambda: modelo.documento_modelo)
+    cache_modelos.limpar()
+
+    conteudo, _ = renderizar_relatorio(modelo.id, modelo.atualizado_em, caminho, {"nome": "Ana"}, [], None)
+
+    compilado = cache_modelos.obter(modelo.id, modelo.atualizado_em, lambda: None)
+    assert isinstance(compilado.pacote, ArquivoMapeado)
+    assert textos(conteudo)[0] == "Olá Ana"
+
+
+def test_arquivo_despejado_antes_da_renderizacao_vem_do_banco(tmp_path, modelo):
+    blobs = CacheBlobsModelo(str(tmp_path), 10 * 1024 * 1024)
+    caminho = blobs.obter(modelo.id, modelo.atualizado_em, lambda: modelo.documento_modelo)
+    os.remove(caminho)
+    cache_modelos.limpar()
+
+    conteudo, _ = renderizar_relatorio(modelo.id, modelo.atualizado_em, caminho, {"nome": "Bia"}, [], None)
+
+    assert textos(conteudo)[0] == "Olá Bia"
@@ -0,0 +1,102 @@
+import os
+import time
+import zipfile
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from services import delta
+from services.cache_blobs import cache_blobs
+from services.pacote import nomes_partes, salvar_documento
+from services.storage import armazenamento
+
+
+@pytest.fixture
+def base(monkeypatch, modelo) -> str:
+    monkeypatch.setattr(delta, "STORAGE_DELTA", True)
+    # a memória das versões registradas não sobrevive à limpeza do banco entre testes
+    monkeypatch.setattr(delta, "_versoes", {})
+    return delta.base_do_modelo(modelo.id, modelo.atualizado_em, modelo.documento_modelo)
+
+
+def relatorio_de(modelo, nome: str) -> bytes:
+    documento = Document(BytesIO(modelo.documento_modelo))
+    originais = nomes_partes(documento)
+    documento.paragraphs[0].runs[0].text = f"Olá {nome}"
+    return salvar_documento(documento, modelo.documento_modelo, originais, {"word/document.xml"})
+
+
+def test_delta_guarda_so_o_que_mudou_e_remonta_igual(modelo, base):
+    conteudo = relatorio_de(modelo, "Ana")
+    chave = delta.gravar_relatorio(conteudo, base)
+
+    assert delta.eh_delta(chave)
+    assert delta.base_de(chave) == base
+    with zipfile.ZipFile(armazenamento.abrir(chave)) as pacote:
+        assert set(pacote.namelist()) == {"word/document.xml", delta.MANIFESTO}
+
+    assert delta.ler_relatorio(chave) == conteudo
+    tamanho, _ = delta.metadados_relatorio(chave)
+    assert tamanho == len(conteudo)
+
+
+def test_metadados_nao_remonta(monkeypatch, modelo, base):
+    chave = delta.gravar_relatorio(relatorio_de(modelo, "Ana"), base)
+    monkeypatch.setattr(delta, "montar", lambda *a: pytest.fail("remontou para ler o tamanho"))
+
+    assert delta.metadados_relatorio(chave)[0] > 0
+
+
+def test_sem_base_grava_o_docx_inteiro(modelo):
+    conteudo = relatorio_de(modelo, "Ana")
+    chave = delta.gravar_relatorio(conteudo, None)
+
+    assert not delta.eh_delta(chave)
+    assert delta.ler_relatorio(chave) == conteudo
+
+
+def test_arquivo_aberto_sobrevive_ao_despejo(monkeypatch, tmp_path, modelo, base):
+    montados = delta.CacheMontados(str(tmp_path), max_entradas=1)
+    monkeypatch.setattr(delta, "montados", montados)
+
+    primeiro = relatorio_de(modelo, "Ana")
+    chave_a = delta.gravar_relatorio(primeiro, base)
+    chave_b = delta.gravar_relatorio(relatorio_de(modelo, "Bia"), base)
+
+    with delta.abrir_relatorio(chave_a) as arquivo:
+        # outro download despeja o arquivo de `chave_a` do cache
+        delta.abrir_relatorio(chave_b).close()
+        assert len(os.listdir(tmp_path)) == 1
+        assert arquivo.read() == primeiro
+
+
+def test_base_despejada_do_cache_em_disco_vem_do_banco(monkeypatch, modelo, base):
+    chave = delta.gravar_relatorio(relatorio_de(modelo, "Ana"), base)
+    caminho = cache_blobs.caminho("versao", base)
+    os.remove(caminho)
+    # obter() devolve o caminho como se o arquivo ainda existisse
+    monkeypatch.setattr(cache_blobs, "obter", lambda *a: caminho)
+
+    assert Document(BytesIO(delta.ler_relatorio(chave))).paragraphs[0].text == "Olá Ana"
+
+
+def test_pasta_limitada_inclusive_com_arquivos_de_outros_processos(monkeypatch, tmp_path, modelo, base):
+    # sobras de uma execução anterior, usadas há uma hora
+    for n in range(3):
+        sobra = tmp_path / f"antigo{n}.docx"
+        sobra.write_bytes(b"x")
+        os.utime(sobra, (time.time() - 3600, time.time() - 3600))
+
+    montados = delta.CacheMontados(str(tmp_path), max_entradas=2)
+    monkeypatch.setattr(delta, "montados", montados)
+    chave = delta.gravar_relatorio(relatorio_de(modelo, "Ana"), base)
+    delta.abrir_relatorio(chave).close()
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert os.path.exists(montados.caminho(chave))
+
+    # outro processo (outra instância) acha o arquivo sem remontar
+    monkeypatch.setattr(delta, "montar", lambda *a: pytest.fail("remontou"))
+    with delta.CacheMontados(str(tmp_path), max_entradas=2).obter(chave) as arquivo:
+        assert Document(arquivo).paragraphs[0].text == "Olá Ana"
@@ -0,0 +1,80 @@
+from sqlalchemy import inspect, text
+
+from database import engine, criar_colunas_ausentes, criar_indices_ausentes
+from models.modelo import Modelo
+from models.relatorio import Relatorio
+from models.usuario import User, renomear_usuarios_duplicados
+
+
+def nomes_indices(tabela: str) -> set:
+    return {i["name"] for i in inspect(engine).get_indexes(tabela)}
+
+
+def nomes_colunas(tabela: str) -> set:
+    return {c["name"] for c in inspect(engine).get_columns(tabela)}
+
+
+def test_cria_indices_em_tabelas_existentes():
+    indices = [
+        *(i for i in Modelo.__table__.indexes if i.name == "ix_modelos_equipe_atualizado"),
+        *(i for i in Relatorio.__table__.indexes if i.name == "ix_relatorios_emissor_equipe_emitido"),
+    ]
+    assert len(indices) == 2
+
+    # conexões antigas do pool guardam o esquema lido antes do DROP (SQLite);
+    # na inicialização do app não há nenhuma
+    engine.dispose()
+    with engine.begin() as conexao:
+        for indice in indices:
+            conexao.execute(text(f"DROP INDEX {indice.name}"))
+    assert "ix_modelos_equipe_atualizado" not in nomes_indices("modelos")
+
+    criar_indices_ausentes(*indices)
+    # de novo: nada a fazer
+    criar_indices_ausentes(*indices)
+
+    assert "ix_modelos_equipe_atualizado" in nomes_indices("modelos")
+    assert "ix_relatorios_emissor_equipe_emitido" in nomes_indices("relatorios")
+
+
+def test_cria_colunas_em_tabelas_existentes(modelo):
+    colunas = [Modelo.__table__.c.manifesto_placeholders, Relatorio.__table__.c.mapa_pendentes]
+
+    engine.dispose()
+    with engine.begin() as conexao:
+        for coluna in colunas:
+            conexao.execute(text(f"ALTER TABLE {coluna.table.name} DROP COLUMN {coluna.name}"))
+    assert "manifesto_placeholders" not in nomes_colunas("modelos")
+    assert "mapa_pendentes" not in nomes_colunas("relatorios")
+
+    criar_colunas_ausentes(*colunas)
+    criar_colunas_ausentes(*colunas)
+
+    assert "manifesto_placeholders" in nomes_colunas("modelos")
+    assert "mapa_pendentes" in nomes_colunas("relatorios")
+    # a linha que já existia fica com NULL
+    with engine.connect() as conexao:
+        assert conexao.execute(text("SELECT manifesto_placeholders FROM modelos")).scalar_one() is None
+
+
+def test_indice_unico_de_login_depois_de_renomear_repetidos():
+    indice = next(i for i in User.__table__.indexes if i.name == "ix_usuarios_usuario")
+
+    engine.dispose()
+    with engine.begin() as conexao:
+        conexao.execute(text("DROP INDEX ix_usuarios_usuario"))
+        ids = [
+            conexao.execute(User.__table__.insert().values(usuario=usuario, senha="x", acesso=1)).inserted_primary_key[0]
+            for usuario in ("ana", "bia", "ana", "ana")
+        ]
+
+    with engine.begin() as conexao:
+        assert sorted(renomear_usuarios_duplicados(conexao)) == [f"ana#{ids[2]}", f"ana#{ids[3]}"]
+    criar_indices_ausentes(indice)
+
+    assert "ix_usuarios_usuario" in nomes_indices("usuarios")
+    with engine.connect() as conexao:
+        # a conta de menor id, a que o login encontrava, fica com o nome
+        assert [u for (u,) in conexao.execute(text("SELECT usuario FROM usuarios ORDER BY id"))] == [
+            "ana", "bia", f"ana#{ids[2]}", f"ana#{ids[3]}"
+        ]
@@ -0,0 +1,46 @@
+import pickle
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from conftest import autorizacao, docx_modelo
+from services.manifesto import gerar_manifesto, ModeloInvalido, TIPO_IMAGEM, TIPO_TEXTO
+
+
+def test_manifesto_classifica_os_placeholders():
+    manifesto = gerar_manifesto(docx_modelo("Olá {{nome}}", "{{foto}}"), None, ["foto"])
+
+    assert manifesto["placeholders"]["nome"]["tipo"] == TIPO_TEXTO
+    assert manifesto["placeholders"]["foto"]["tipo"] == TIPO_IMAGEM
+
+
+def com_document_xml(conteudo: bytes) -> bytes:
+    saida = BytesIO()
+    with zipfile.ZipFile(BytesIO(docx_modelo("x"))) as origem, zipfile.ZipFile(saida, "w") as destino:
+        for info in origem.infolist():
+            dados = conteudo if info.filename == "word/document.xml" else origem.read(info)
+            destino.writestr(info, dados)
+    return saida.getvalue()
+
+
+@pytest.mark.parametrize("documento", [b"isto nao e um zip", com_document_xml(b"<w:document")])
+def test_docx_ilegivel_vira_modelo_invalido(documento):
+    with pytest.raises(ModeloInvalido) as erro:
+        gerar_manifesto(documento)
+
+    # precisa atravessar o pool de processos
+    assert isinstance(pickle.loads(pickle.dumps(erro.value)), ModeloInvalido)
+
+
+def test_campos_imagem_malformado_e_rejeitado(cliente):
+    resposta = cliente.post(
+        "/app/novoModelo",
+        data={
+            "titulo": "M", "equipe": "E1", "descriçao": "d", "modelo_automacao": "{}",
+            "termografia": "false", "campos_imagem": '{"foto": 1}',
+        },
+        files={"documento_modelo": ("m.docx", docx_modelo("{{foto}}"))},
+        headers=autorizacao("ana"),
+    )
+    assert resposta.status_code == 400
@@ -0,0 +1,105 @@
+import zipfile
+from io import BytesIO
+
+from docx import Document
+from PIL import Image
+
+from conftest import docx_modelo
+from services.pacote import copiar_entrada, nomes_partes, salvar_documento
+from services.renderizador import aplicar_substituicoes
+from services.template_cache import ModeloCompilado
+
+
+def png(cor="red") -> bytes:
+    saida = BytesIO()
+    Image.new("RGB", (30, 20), cor).save(saida, "PNG")
+    return saida.getvalue()
+
+
+def docx_com_imagem() -> bytes:
+    documento = Document()
+    documento.add_picture(BytesIO(png("blue")))
+    documento.add_paragraph("Olá {{nome}}")
+    saida = BytesIO()
+    documento.save(saida)
+    return saida.getvalue()
+
+
+def entrada_bruta(pacote: zipfile.ZipFile, nome: str) -> tuple:
+    info = pacote.getinfo(nome)
+    pacote.fp.seek(info.header_offset + 26)
+    tamanho_nome, tamanho_extra = int.from_bytes(pacote.fp.read(2), "little"), int.from_bytes(pacote.fp.read(2), "little")
+    pacote.fp.seek(tamanho_nome + tamanho_extra, 1)
+    return info.CRC, info.compress_type, pacote.fp.read(info.compress_size)
+
+
+def test_copiar_entrada_preserva_bytes_compactados():
+    origem = docx_com_imagem()
+    saida = BytesIO()
+    with zipfile.ZipFile(BytesIO(origem)) as zo, zipfile.ZipFile(saida, "w") as zd:
+        for info in zo.infolist():
+            copiar_entrada(zo, info, zd)
+
+    with zipfile.ZipFile(BytesIO(origem)) as zo, zipfile.ZipFile(BytesIO(saida.getvalue())) as zd:
+        assert zd.testzip() is None
+        assert zd.namelist() == zo.namelist()
+        for nome in zo.namelist():
+            assert entrada_bruta(zd, nome) == entrada_bruta(zo, nome)
+            assert zd.read(nome) == zo.read(nome)
+
+
+def test_salvar_documento_regrava_so_as_partes_tocadas():
+    origem = docx_com_imagem()
+    documento = Document(BytesIO(origem))
+    originais = nomes_partes(documento)
+    for paragrafo in documento.paragraphs:
+        if "{{nome}}" in paragrafo.text:
+            paragrafo.runs[0].text = "Olá Ana"
+
+    conteudo = salvar_documento(documento, origem, originais, {"word/document.xml"})
+
+    with zipfile.ZipFile(BytesIO(origem)) as zo, zipfile.ZipFile(BytesIO(conteudo)) as zr:
+        assert zr.testzip() is None
+        assert set(zr.namelist()) == set(zo.namelist())
+        for nome in zo.namelist():
+            if nome != "word/document.xml":
+                assert entrada_bruta(zr, nome) == entrada_bruta(zo, nome), nome
+
+    assert "Olá Ana" in [p.text for p in Document(BytesIO(conteudo)).paragraphs]
+
+
+def test_salvar_documento_com_imagem_nova_a_partir_de_arquivo():
+    origem = docx_modelo("{{foto}}")
+    documento = Document(BytesIO(origem))
+    originais = nomes_partes(documento)
+    documento.paragraphs[0].runs[0].text = ""
+    documento.paragraphs[0].runs[0].add_picture(BytesIO(png()))
+
+    # origem como arquivo (o mmap do cache em disco) em vez de bytes
+    conteudo = salvar_documento(documento, BytesIO(origem), originais, {"word/document.xml"})
+
+    with zipfile.ZipFile(BytesIO(conteudo)) as zr:
+        assert zr.testzip() is None
+        midia = [i for i in zr.infolist() if i.filename.startswith("word/media/")]
+        assert len(midia) == 1 and midia[0].compress_type == zipfile.ZIP_STORED
+        assert b"image/png" in zr.read("[Content_Types].xml") or b'Extension="png"' in zr.read("[Content_Types].xml")
+
+    assert len(Document(BytesIO(conteudo)).inline_shapes) == 1
+
+
+def test_salvar_documento_igual_ao_save_com_estilo_alterado():
+    origem = docx_modelo("Olá {{nome}}", "Parágrafo sem placeholder")
+    compilado = ModeloCompilado(origem)
+    doc, locais = compilado.instanciar()
+    # a substituição no corpo muda a fonte do estilo Normal (word/styles.xml)
+    aplicar_substituicoes(locais, {"nome": "Ana"})
+
+    conteudo = salvar_documento(doc, origem, compilado.partes, compilado.tocadas)
+    esperado = BytesIO()
+    doc.save(esperado)
+
+    with zipfile.ZipFile(BytesIO(conteudo)) as zr, zipfile.ZipFile(esperado) as ze:
+        assert set(zr.namelist()) == set(ze.namelist())
+        for nome in ze.namelist():
+            assert zr.read(nome) == ze.read(nome), nome
+        assert b'<w:sz w:val="20"/>' in zr.read("word/styles.xml")
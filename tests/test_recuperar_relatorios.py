@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from conftest import autorizacao
+from database import engine
+from models.relatorio import Relatorio, normalizar_emitido_em_sqlite
+
+
+def criar_relatorio(sessao, emissor="ana", equipe="E1", **campos) -> Relatorio:
+    relatorio = Relatorio(
+        modelo="Inspeção", emissor=emissor, equipe=equipe, nome_arquivo="r",
+        caminho_arquivo="x.docx", **campos
+    )
+    sessao.add(relatorio)
+    sessao.commit()
+    return relatorio
+
+
+def percorrer(cliente, limite, **filtros) -> list[int]:
+    ids, cursor = [], None
+    for _ in range(100):
+        params = {"limite": limite, **filtros}
+        if cursor:
+            params["cursor"] = cursor
+        resposta = cliente.get("/app/recuperarRelatorios", params=params, headers=autorizacao("ana"))
+        assert resposta.status_code == 200
+        corpo = resposta.json()
+        ids += [r["id"] for r in corpo["relatorios"]]
+        cursor = corpo["next_cursor"]
+        if cursor is None:
+            return ids
+    raise AssertionError("a paginação não terminou")
+
+
+def test_percorre_todas_as_paginas_ate_o_fim(cliente, sessao):
+    base = datetime(2026, 1, 10, 8, 0, 0)
+    # vários com o mesmo emitido_em: o desempate é pelo id
+    for i in range(11):
+        criar_relatorio(sessao, emitido_em=base + timedelta(minutes=i // 3))
+    # default (agora) e um com microssegundos, como resolver-itens-pendentes gravava
+    criar_relatorio(sessao)
+    criar_relatorio(sessao, emitido_em=base + timedelta(seconds=30, microseconds=123456))
+    criar_relatorio(sessao, emissor="outro")
+
+    # formato do CURRENT_TIMESTAMP do SQLite (linhas antigas)
+    with engine.begin() as conexao:
+        conexao.execute(text(
+            "INSERT INTO relatorios (modelo, emissor, equipe, nome_arquivo, caminho_arquivo, emitido_em) "
+            "VALUES ('Inspeção', 'ana', 'E1', 'r', 'x.docx', '2026-01-10 08:02:00')"
+        ))
+        normalizar_emitido_em_sqlite(conexao)
+
+    sessao.expire_all()
+    esperado = [
+        r.id for r in sessao.query(Relatorio)
+        .filter(Relatorio.emissor == "ana")
+        .order_by(Relatorio.emitido_em.desc(), Relatorio.id.desc())
+    ]
+    assert len(esperado) == 14
+
+    for limite in (1, 3, 5, 50):
+        assert percorrer(cliente, limite) == esperado
+
+
+def test_filtros_de_data_incluem_os_extremos(cliente, sessao):
+    base = datetime(2026, 3, 1, 12, 0, 0)
+    ids = [criar_relatorio(sessao, emitido_em=base + timedelta(hours=h)).id for h in range(4)]
+
+    assert percorrer(
+        cliente, 2, desde="2026-03-01T13:00:00", ate="2026-03-01T14:00:00"
+    ) == [ids[2], ids[1]]
+    # com fuso: 17:00 UTC = 13:00 em UTC-4
+    assert percorrer(cliente, 2, desde="2026-03-01T17:00:00+00:00") == [ids[3], ids[2], ids[1]]
+
+
+def test_cursor_invalido(cliente):
+    resposta = cliente.get("/app/recuperarRelatorios", params={"cursor": "lixo"}, headers=autorizacao("ana"))
+    assert resposta.status_code == 400
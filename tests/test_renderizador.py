@@ -0,0 +1,143 @@
+from io import BytesIO
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.shared import Pt
+from lxml import etree
+
+from services.renderizador import aplicar_substituicoes
+from services.template_cache import ModeloCompilado
+
+DADOS = {"nome": "Ana", "equipamento": "Bomba 01", "vazio": ""}
+
+
+# ======================================
+# RENDERIZADOR ANTERIOR (referência)
+# ======================================
+# As regras de texto de antes da passada única: parágrafo a parágrafo,
+# `paragraph.text.replace` por chave. `aninhadas` estende a mesma regra às
+# tabelas dentro de células, que antes não eram percorridas.
+def _substituir(paragraph, dados, tabela, ignora_vazio=True):
+    for key, value in dados.items():
+        if ignora_vazio and value in [None, "", " ", "null"]:
+            continue
+        placeholder = f"{{{{{key}}}}}"
+        if placeholder in paragraph.text:
+            paragraph.text = paragraph.text.replace(placeholder, str(value))
+            if tabela:
+                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            else:
+                paragraph.style.font.size = Pt(10)
+            for run in paragraph.runs:
+                run.font.size = Pt(10)
+
+
+def _tabelas(tabelas, dados, aninhadas, ignora_vazio=True):
+    for table in tabelas:
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.paragraphs:
+                    _substituir(paragraph, dados, True, ignora_vazio)
+                if aninhadas:
+                    _tabelas(cell.tables, dados, aninhadas, ignora_vazio)
+
+
+def renderizar_como_antes(conteudo: bytes, dados: dict, aninhadas: bool = False):
+    doc = Document(BytesIO(conteudo))
+    for paragraph in doc.paragraphs:
+        _substituir(paragraph, dados, False)
+    _tabelas(doc.tables, dados, aninhadas)
+    for section in doc.sections:
+        for area in [section.header, section.footer]:
+            for paragraph in area.paragraphs:
+                _substituir(paragraph, dados, False, ignora_vazio=False)
+            _tabelas(area.tables, dados, aninhadas, ignora_vazio=False)
+    return doc
+
+
+def renderizar(conteudo: bytes, dados: dict):
+    doc, locais = ModeloCompilado(conteudo).instanciar()
+    aplicar_substituicoes(locais, dados)
+    return doc
+
+
+# ======================================
+# MODELOS
+# ======================================
+def paragrafo_partido(container, *pedacos):
+    paragraph = container.add_paragraph()
+    for pedaco in pedacos:
+        paragraph.add_run(pedaco)
+    return paragraph
+
+
+def salvar(doc) -> bytes:
+    saida = BytesIO()
+    doc.save(saida)
+    return saida.getvalue()
+
+
+def textos(doc) -> list:
+    def das_tabelas(tabelas):
+        for table in tabelas:
+            for row in table.rows:
+                for cell in row.cells:
+                    for paragraph in cell.paragraphs:
+                        yield paragraph.text, paragraph.alignment
+                    yield from das_tabelas(cell.tables)
+
+    resultado = [(p.text, p.alignment) for p in doc.paragraphs]
+    resultado += list(das_tabelas(doc.tables))
+    for section in doc.sections:
+        resultado += [(p.text, p.alignment) for p in section.header.paragraphs]
+        resultado += list(das_tabelas(section.header.tables))
+    return resultado
+
+
+def corpo_xml(doc) -> list:
+    # sem o sectPr: o renderizador anterior criava cabeçalho/rodapé vazios
+    # só de acessar `section.footer`
+    return [etree.tostring(e) for e in doc.element.body if e.tag != qn("w:sectPr")]
+
+
+def test_placeholders_partidos_em_runs_como_antes():
+    doc = Document()
+    paragrafo_partido(doc, "Olá {{no", "me}}, equipamento ", "{{equi", "pamento}}")
+    paragrafo_partido(doc, "Sem valor: {{va", "zio}}")
+    tabela = doc.add_table(rows=1, cols=2)
+    paragrafo_partido(tabela.cell(0, 0), "{", "{nome}", "}")
+    tabela.cell(0, 1).text = "fixo"
+    paragrafo_partido(doc.sections[0].header, "Cabeçalho {{equipamento}", "} / {{vazio}}")
+    modelo = salvar(doc)
+
+    novo = renderizar(modelo, DADOS)
+    antes = renderizar_como_antes(modelo, DADOS)
+
+    assert textos(novo) == textos(antes)
+    assert novo.paragraphs[0].text == "Olá Ana, equipamento Bomba 01"
+    assert novo.paragraphs[1].text == "Sem valor: {{vazio}}"
+    assert novo.sections[0].header.paragraphs[-1].text == "Cabeçalho Bomba 01 / "
+    # mesmos runs e formatação, não só o texto
+    assert corpo_xml(novo) == corpo_xml(antes)
+
+
+def test_tabelas_aninhadas_seguem_a_regra_das_tabelas():
+    doc = Document()
+    externa = doc.add_table(rows=1, cols=1)
+    celula = externa.cell(0, 0)
+    celula.text = "Equipamento {{equipamento}}"
+    interna = celula.add_table(rows=2, cols=1)
+    paragrafo_partido(interna.cell(0, 0), "Responsável: {{no", "me}}")
+    interna.cell(1, 0).add_table(rows=1, cols=1).cell(0, 0).text = "{{equipamento}} / {{nome}}"
+    modelo = salvar(doc)
+
+    novo = renderizar(modelo, DADOS)
+    antes = renderizar_como_antes(modelo, DADOS, aninhadas=True)
+
+    assert textos(novo) == textos(antes)
+    assert corpo_xml(novo) == corpo_xml(antes)
+    assert [t for t, _ in textos(novo) if t] == [
+        "Equipamento Bomba 01", "Responsável: Ana", "Bomba 01 / Ana"
+    ]
+    assert all(alinhamento == WD_ALIGN_PARAGRAPH.CENTER for t, alinhamento in textos(novo) if t)
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from passlib.hash import bcrypt
+
+from core import security
+
+
+def custo(hash_: str) -> int:
+    return int(hash_.split("$")[2])
+
+
+def test_hash_mais_fraco_e_refeito_com_o_custo_atual():
+    contexto = security.criar_pwd_context(5)
+    fraco = bcrypt.using(rounds=4).hash("segredo")
+
+    assert contexto.needs_update(fraco)
+    valida, novo = contexto.verify_and_update("segredo", fraco)
+    assert valida
+    assert custo(novo) == 5
+
+
+def test_hash_mais_forte_nunca_e_rebaixado():
+    contexto = security.criar_pwd_context(5)
+    forte = bcrypt.using(rounds=6).hash("segredo")
+
+    assert not contexto.needs_update(forte)
+    assert contexto.verify_and_update("segredo", forte) == (True, None)
+    assert contexto.verify_and_update("errada", forte) == (False, None)
+
+
+def test_hash_com_o_custo_atual_fica_como_esta():
+    contexto = security.criar_pwd_context(5)
+    assert contexto.verify_and_update("segredo", contexto.hash("segredo")) == (True, None)
+
+
+def test_calibracao_fica_nos_limites():
+    rounds = security.calibrar_rounds(alvo_ms=1, amostras=3)
+    assert security.BCRYPT_MIN_ROUNDS <= rounds <= security.BCRYPT_MAX_ROUNDS
+
+
+def test_contexto_e_criado_fora_do_event_loop(monkeypatch):
+    threads = []
+
+    def calibrar():
+        threads.append(threading.current_thread().name)
+        return 4
+
+    monkeypatch.setattr(security, "_pwd_context", None)
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", 0)
+    monkeypatch.setattr(security, "calibrar_rounds", calibrar)
+
+    hash_ = bcrypt.using(rounds=4).hash("segredo")
+    assert asyncio.run(security.verify_and_update_password("segredo", hash_)) == (True, None)
+    assert len(threads) == 1 and threads[0].startswith("bcrypt")